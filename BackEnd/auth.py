@@ -1,6 +1,6 @@
 from datetime import datetime, timedelta
 from jose import JWTError, jwt
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, Header, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 import os
 from dotenv import load_dotenv
@@ -11,6 +11,7 @@ load_dotenv()
 SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = os.getenv("ALGORITHM")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 4320))
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
@@ -41,3 +42,9 @@ def get_current_user(token: str = Depends(oauth2_scheme)):
     )
     user_id = verify_access_token(token, credentials_exception)
     return user_id
+
+
+def require_admin(x_admin_token: str | None = Header(default=None)):
+    # admin endpoints are disabled unless ADMIN_TOKEN is configured
+    if not ADMIN_TOKEN or x_admin_token != ADMIN_TOKEN:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin token required")
@@ -0,0 +1,171 @@
+"""
+Differential fuzz + benchmark for json_stream.extract_json.
+
+    python bench_extract_json.py [--cases 5000] [--sizes 50000 100000] [--seed 0]
+
+Fuzz: random lesson-shaped replies (fences, prose, trailing junk, braces and
+escapes inside strings, truncation) are fed to both the current extractor
+and the legacy multi-pass one kept below. Whatever the new one returns must
+be either the whole source lesson (same number of top-level keys
+and segments) or {"raw": ...}; anything else (a nested
+segment, a fragment) fails the run. Differences from legacy are counted.
+
+Bench: time per call on fenced lesson payloads of the given sizes.
+"""
+import argparse
+import json
+import random
+import re
+import time
+
+from json_stream import extract_json
+
+
+def legacy_extract_json(text):
+    """gemini_api._extract_json before the single-pass rewrite (reference only)."""
+    try:
+        return json.loads(text)
+    except Exception:
+        pass
+    fence = re.search(r"```(?:json)?\s*([\s\S]*?)\s*```", text, flags=re.IGNORECASE)
+    if fence:
+        blk = fence.group(1).strip()
+        try:
+            return json.loads(blk)
+        except Exception:
+            last = blk.rfind("}")
+            if last != -1:
+                try:
+                    return json.loads(blk[:last+1])
+                except Exception:
+                    pass
+    if "{" in text and "}" in text:
+        s = text[text.find("{"):]
+        depth = 0
+        end_idx = None
+        for i, ch in enumerate(s):
+            if ch == "{": depth += 1
+            elif ch == "}":
+                depth -= 1
+                if depth == 0:
+                    end_idx = i
+                    break
+        if end_idx is not None:
+            candidate = s[:end_idx+1]
+            try:
+                return json.loads(candidate)
+            except Exception:
+                last = candidate.rfind("}")
+                if last != -1:
+                    try:
+                        return json.loads(candidate[:last+1])
+                    except Exception:
+                        pass
+    return {"raw": text}
+
+
+_WORDS = ("graph", "vertex", "edge", "degree", "matrix", "list", "path", "cycle", "tree", "cover")
+_NOISE = ("{", "}", "[", "]", '"', "\\", "\n", "`", ":", ",")
+
+
+def _md(rng, n_chars, braces=True):
+    out, size = [], 0
+    while size < n_chars:
+        w = rng.choice(_WORDS)
+        if braces and rng.random() < 0.05:
+            w = rng.choice(("{", "}", "G=(V,E)", "{u, v}", "\\(x\\)", '"q"', "\n\n## H", "`code`"))
+        out.append(w)
+        size += len(w) + 1
+    return " ".join(out)
+
+
+def lesson_payload(rng, n_chars, braces=True):
+    segs, size = [], 0
+    while size < n_chars:
+        seg = {"section": _md(rng, 20, False), "kind": "content", "text": _md(rng, rng.randint(200, 2000), braces),
+               "text_format": "md"}
+        if rng.random() < 0.2:
+            seg.update(kind="diagram", mermaid="flowchart TD\nA[Start]-->B{Check}\nB-->C[End]")
+        size += len(seg["text"]) + 80
+        segs.append(seg)
+    return {"title": _md(rng, 30, False), "segments": segs, "narration": _md(rng, 200, braces)}
+
+
+def wrap(rng, obj):
+    body = json.dumps(obj, ensure_ascii=rng.random() < 0.5, indent=rng.choice((None, 2)))
+    style = rng.randrange(6)
+    if style == 0:
+        text = body
+    elif style == 1:
+        text = f"```json\n{body}\n```"
+    elif style == 2:
+        text = f"Here is the lesson:\n```json\n{body}\n```\nHope this helps!"
+    elif style == 3:
+        text = body + "\n" + rng.choice(("```", "Let me know!", "}", "} extra {", "\n\n"))
+    elif style == 4:
+        text = "Sure. " + body
+    else:
+        text = body[:rng.randint(1, len(body))]   # truncated stream
+    if rng.random() < 0.1:
+        pos = rng.randrange(len(text))
+        text = text[:pos] + rng.choice(_NOISE) + text[pos:]
+    return text
+
+
+def _is_lesson(val, obj):
+    # noise can rename a key ("ti}tle"), but the top-level object keeps its size and
+    # segment list; a nested segment or fragment has neither
+    segs = [v for v in val.values() if isinstance(v, list)] if isinstance(val, dict) else []
+    return len(val) == len(obj) and len(segs) == 1 and len(segs[0]) == len(obj["segments"]) if segs else False
+
+
+def fuzz(cases, seed):
+    rng = random.Random(seed)
+    agree = recovered = lost = wrong = 0
+    for n in range(cases):
+        obj = lesson_payload(rng, rng.choice((200, 2000, 8000)), braces=rng.random() < 0.7)
+        text = wrap(rng, obj)
+        old, new = legacy_extract_json(text), extract_json(text)
+        new_raw = isinstance(new, dict) and set(new) == {"raw"}
+        # anything recovered must be the whole lesson (noise may have landed inside a
+        # string) or what legacy also took as the top-level value ("{\n}..."), never a
+        # nested segment or a fragment
+        nested = isinstance(new, dict) and "section" in new
+        if not new_raw and not _is_lesson(new, obj) and (nested or new != old):
+            wrong += 1
+            if wrong <= 3:
+                print(f"[wrong shape] case={n} got={str(new)[:120]!r} head={text[:120]!r}")
+        elif old == new:
+            agree += 1
+        elif new_raw:
+            lost += 1       # legacy returned something (whole lesson or a fragment); new says raw
+            if old == obj and lost <= 3:
+                print(f"[lost] case={n} head={text[:120]!r}")
+        else:
+            recovered += 1  # new returned the lesson where legacy returned raw or a fragment
+    print(f"fuzz: cases={cases} agree={agree} recovered_only_by_new={recovered} "
+          f"raw_where_legacy_parsed={lost} wrong_shape={wrong}")
+    return wrong
+
+
+def bench(sizes, seed, reps=20):
+    rng = random.Random(seed)
+    for size in sizes:
+        text = f"Here is the lesson:\n```json\n{json.dumps(lesson_payload(rng, size))}\n```\n"
+        for name, fn in (("legacy", legacy_extract_json), ("single-pass", extract_json)):
+            t0 = time.perf_counter()
+            for _ in range(reps):
+                fn(text)
+            dt = (time.perf_counter() - t0) / reps
+            print(f"bytes={len(text):>7,}  {name:<11}  {dt * 1000:8.3f} ms/call")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--cases", type=int, default=5000)
+    ap.add_argument("--sizes", type=int, nargs="+", default=[50_000, 100_000])
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+    bad = fuzz(args.cases, args.seed)
+    bench(args.sizes, args.seed)
+    raise SystemExit(1 if bad else 0)
@@ -0,0 +1,118 @@
+"""
+Benchmark for media/mermaid_validate.py on real model output.
+
+    python bench_mermaid_validate.py [--data local_data] [--mutations 20] [--seed 0] [--render]
+
+Corpus: every segment's `mermaid` in the pickled lessons under --data, plus
+--mutations broken variants per diagram with the mistakes models make
+(parentheses in labels or edge text, `->` arrows, unclosed brackets,
+missing header, stray `end`, a prose line).
+
+Reports how many diagrams pass as-is, pass after auto-fix, or are rejected,
+and the validator's time per diagram. With --render, each diagram (and its
+fixed form) is also rendered with the real renderer (warm pool or mmdc) to
+measure agreement and how long a render costs next to a check.
+"""
+import argparse
+import glob
+import os
+import pickle
+import random
+import tempfile
+import time
+
+os.environ.setdefault("DIAGRAM_STORE", "0")  # time real renders, not store hits
+
+from media.mermaid_validate import validate_mermaid  # noqa: E402
+
+
+def load_corpus(data_dir):
+    out = []
+    for path in sorted(glob.glob(os.path.join(data_dir, "*.pkl"))):
+        try:
+            with open(path, "rb") as f:
+                lesson = pickle.load(f)
+        except Exception as e:
+            print(f"skip {path}: {e}")
+            continue
+        segs = lesson.get("segments") if isinstance(lesson, dict) else getattr(lesson, "segments", None)
+        for seg in segs or []:
+            mer = seg.get("mermaid") if isinstance(seg, dict) else getattr(seg, "mermaid", None)
+            if isinstance(mer, str) and mer.strip():
+                out.append(mer)
+    return out
+
+
+def _mutations(code, rng):
+    lines = code.splitlines()
+    body = list(range(1, len(lines))) or [0]
+    k = rng.choice(body)
+
+    def edit(fn):
+        new = list(lines)
+        new[k] = fn(new[k])
+        return "\n".join(new)
+
+    return [
+        edit(lambda ln: ln.replace("]", " (x)]", 1)),
+        edit(lambda ln: ln.replace("-->", "-- step (1) -->", 1)),
+        edit(lambda ln: ln.replace("-->", "->", 1)),
+        edit(lambda ln: ln.replace("]", "", 1)),
+        edit(lambda ln: ln.replace("]", ")", 1)),
+        "\n".join(lines[1:]),
+        code + "\nend",
+        code + "\nThis diagram shows the flow above.",
+    ]
+
+
+def run(data_dir, n_mut, seed, render):
+    rng = random.Random(seed)
+    real = load_corpus(data_dir)
+    mutated = [m for code in real for _ in range(n_mut) for m in [rng.choice(_mutations(code, rng))]]
+    print(f"corpus: {len(real)} real diagrams, {len(mutated)} mutated")
+
+    for name, corpus in (("real", real), ("mutated", mutated)):
+        if not corpus:
+            continue
+        counts = {"valid": 0, "fixed": 0, "rejected": 0}
+        t0 = time.perf_counter()
+        checks = [validate_mermaid(c) for c in corpus]
+        per = (time.perf_counter() - t0) / len(corpus) * 1e6
+        for chk in checks:
+            counts["rejected" if not chk.ok else "fixed" if chk.fixes else "valid"] += 1
+        print(f"{name:8s} {counts}  validate {per:.0f} µs/diagram")
+        for code, chk in zip(corpus, checks):
+            if name == "real" and chk.fixes:
+                print("  fixed:", "; ".join(chk.fixes))
+        if render:
+            _render_agreement(name, corpus, checks)
+
+
+def _render_agreement(name, corpus, checks):
+    from media.mermaid import render_mermaid
+
+    agree = disagree = 0
+    times = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for i, (code, chk) in enumerate(zip(corpus, checks)):
+            t0 = time.perf_counter()
+            rendered = render_mermaid(chk.code, os.path.join(tmp, f"{i}.png"))
+            times.append(time.perf_counter() - t0)
+            if rendered == chk.ok:
+                agree += 1
+            else:
+                disagree += 1
+                print(f"  disagree (validator ok={chk.ok}, render ok={rendered}):\n{chk.code}\n  {chk.errors}")
+    times.sort()
+    print(f"{name:8s} render agreement {agree}/{agree + disagree}, "
+          f"render p50 {times[len(times) // 2] * 1000:.0f} ms/diagram")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--data", default="local_data")
+    ap.add_argument("--mutations", type=int, default=20)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--render", action="store_true", help="also render with the real renderer (needs mmdc or node+puppeteer)")
+    args = ap.parse_args()
+    run(args.data, args.mutations, args.seed, args.render)
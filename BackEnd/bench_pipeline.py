@@ -0,0 +1,73 @@
+"""
+End-to-end lesson pipeline benchmark without live Gemini quota.
+
+    LLM_BACKEND=synthetic DB_URL=sqlite:///bench.db python bench_pipeline.py \
+        [--requests 20] [--concurrency 4] [--same-prompt]
+
+Runs main.api_full_lesson_rendered (normalize → retrieval → lesson → top-up →
+render) from a thread pool and reports latency percentiles, throughput and
+gateway counters. LLM_BACKEND defaults to synthetic here; tune it with
+LLM_SYNTH_LATENCY / LLM_SYNTH_IMAGE_LATENCY, or use LLM_BACKEND=replay with a
+recorded LLM_REPLAY_FILE. Retrieval still needs the local Whoosh/Qdrant indexes.
+"""
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault("LLM_BACKEND", "synthetic")
+os.environ.setdefault("LESSON_CACHE", "0")
+
+import main  # noqa: E402  (env above must be set first)
+from llm_gateway import gateway_stats, prefix_cache_stats  # noqa: E402
+
+PROMPTS = [
+    "explain BFS with diagrams",
+    "teach me dijkstra's algorithm for beginners",
+    "what is a minimum vertex cover? include 3 images",
+    "adjacency matrix vs adjacency list",
+    "intro to dynamic programming with examples",
+]
+
+
+def _pct(vals, p):
+    vals = sorted(vals)
+    return vals[min(len(vals) - 1, int(round(p / 100 * (len(vals) - 1))))] if vals else 0.0
+
+
+def run(n, concurrency, same_prompt):
+    def one(i):
+        prompt = PROMPTS[0] if same_prompt else f"{PROMPTS[i % len(PROMPTS)]} (#{i})"
+        t0 = time.perf_counter()
+        out = main.api_full_lesson_rendered(prompt, [])
+        return time.perf_counter() - t0, len(out.segments)
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as ex:
+        results = list(ex.map(one, range(n)))
+    wall = time.perf_counter() - t0
+    lat = [r[0] for r in results]
+    report = {
+        "backend": os.environ["LLM_BACKEND"],
+        "requests": n,
+        "concurrency": concurrency,
+        "wall_s": round(wall, 3),
+        "lessons_per_s": round(n / wall, 3),
+        "p50_s": round(_pct(lat, 50), 3),
+        "p95_s": round(_pct(lat, 95), 3),
+        "max_s": round(max(lat), 3),
+        "segments_avg": round(sum(r[1] for r in results) / n, 1),
+        "gateway": gateway_stats(),
+        "prefix_cache": {k: v for k, v in prefix_cache_stats().items() if k != "recent"},
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--requests", type=int, default=20)
+    ap.add_argument("--concurrency", type=int, default=4)
+    ap.add_argument("--same-prompt", action="store_true", help="exercise single-flight/caches with one prompt")
+    args = ap.parse_args()
+    run(args.requests, args.concurrency, args.same_prompt)
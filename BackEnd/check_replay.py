@@ -0,0 +1,60 @@
+"""
+Offline record → replay round trip for llm_providers.
+
+    python check_replay.py
+
+Records a few gateway calls (a cached-prefix chat turn, its streaming
+variant and a plain generate_text) with the synthetic backend standing in
+for Gemini and provider-style context caching on, then replays them with
+LLM_REPLAY_MISS=error:
+- with context caching on (new, different handle names)
+- with context caching off (prefix sent inline)
+Every replayed answer must come from the recording and match it.
+"""
+import os
+import tempfile
+
+os.environ.setdefault("LLM_BACKEND", "synthetic")
+
+import context_cache  # noqa: E402
+import llm_cache  # noqa: E402
+import llm_gateway  # noqa: E402
+import llm_providers  # noqa: E402
+
+MODEL = "gemini-2.0-flash"
+PREFIX = "You are HackTutor. Teach with short sections, diagrams and examples. " * 40
+
+
+def _calls():
+    history = [{"sender": "user", "content": "hi"}, {"sender": "bot", "content": "hello"}]
+    task = "Return ONLY JSON lesson. TaskSpec: {\"topic\": \"BFS\"}"
+    return [
+        llm_gateway.chat(MODEL, history, task, system_instruction=PREFIX, cache_prefix=True),
+        "".join(llm_gateway.chat_stream(MODEL, history, task + " (stream)", system_instruction=PREFIX,
+                                        cache_prefix=True)),
+        llm_gateway.generate_text(MODEL, "Produce ONLY a valid, compact Mermaid diagram. Description: BFS"),
+    ]
+
+
+def _use(client, caching: bool):
+    llm_gateway._client = client
+    llm_gateway._context_cache = context_cache.GeminiContextCache(lambda: client) if caching else False
+
+
+def main():
+    llm_cache.backend = None  # every call must reach the client
+    path = os.path.join(tempfile.mkdtemp(prefix="replay_"), "llm_replay.jsonl")
+
+    _use(llm_providers.RecordingClient(llm_providers.SyntheticClient(), path=path), caching=True)
+    recorded = _calls()
+
+    llm_providers.LLM_REPLAY_MISS = "error"
+    for caching in (True, False):
+        _use(llm_providers.ReplayClient(path), caching=caching)
+        replayed = _calls()
+        assert replayed == recorded, f"replay differs from recording (caching={caching})"
+        print(f"replay ok with context caching {'on' if caching else 'off'}: {len(replayed)} calls")
+
+
+if __name__ == "__main__":
+    main()
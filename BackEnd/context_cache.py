@@ -0,0 +1,139 @@
+"""
+Cached-content handles for large static prompt prefixes (system instructions).
+
+LLM_CONTEXT_CACHE selects the backend:
+- gemini (default): `client.caches.create` stores the prefix provider-side;
+  requests then send `cached_content=<name>` instead of the full text
+- local: in-process stand-in with the same handle/expiry behaviour, for tests
+  and offline runs; the gateway re-inlines the prefix for local handles, so
+  nothing is saved (its token savings are reported as simulated)
+- off
+
+Handles are kept per (model, sha256(prefix)) and recreated shortly before
+their TTL runs out. If the provider refuses (model without caching support,
+prefix below its minimum size, quota), the model is skipped for
+LLM_CONTEXT_CACHE_RETRY seconds and callers fall back to inline prompts;
+this is logged once per window. Handle creation is a network call, so it
+runs under a per-key lock, not the cache-wide one.
+"""
+import hashlib
+import os
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+from google.genai import types
+
+LLM_CONTEXT_CACHE = os.getenv("LLM_CONTEXT_CACHE", "gemini").lower()
+LLM_CONTEXT_CACHE_TTL = int(os.getenv("LLM_CONTEXT_CACHE_TTL", "3600"))
+LLM_CONTEXT_CACHE_RETRY = int(os.getenv("LLM_CONTEXT_CACHE_RETRY", "900"))
+
+LOCAL_PREFIX = "local/"
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+class ContextCache:
+    """Maps (model, prefix) → cached-content handle; subclasses create the handles."""
+
+    def __init__(self, ttl: int = LLM_CONTEXT_CACHE_TTL):
+        self.ttl = ttl
+        self._handles: Dict[Tuple[str, str], Tuple[str, float]] = {}
+        self._disabled_until: Dict[str, float] = {}
+        self._key_locks: Dict[Tuple[str, str], threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def _create(self, model: str, prefix: str, key: str) -> str:
+        raise NotImplementedError
+
+    def _fresh(self, key: Tuple[str, str], model: str, now: float):
+        """(done, handle) under self._lock: a disabled model or a live handle needs no create."""
+        if self._disabled_until.get(model, 0) > now:
+            return True, None
+        item = self._handles.get(key)
+        # refresh a minute early so in-flight requests never carry an expired handle
+        if item and item[1] - 60 > now:
+            return True, item[0]
+        return False, None
+
+    def handle(self, model: str, prefix: str) -> Optional[str]:
+        key = (model, _digest(prefix))
+        with self._lock:
+            done, name = self._fresh(key, model, time.time())
+            if done:
+                return name
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        # one create per key at a time; other keys and cache hits don't wait on the network
+        with key_lock:
+            with self._lock:
+                done, name = self._fresh(key, model, time.time())
+                if done:
+                    return name
+            try:
+                name = self._create(model, prefix, key[1])
+            except Exception as e:
+                now = time.time()
+                with self._lock:
+                    self._handles.pop(key, None)
+                    if self._disabled_until.get(model, 0) > now:
+                        return None  # another key already disabled the model and logged it
+                    self._disabled_until[model] = now + LLM_CONTEXT_CACHE_RETRY
+                print(f"[context_cache] caching unavailable for {model}, inline prompts for "
+                      f"{LLM_CONTEXT_CACHE_RETRY}s: {e}")
+                return None
+            with self._lock:
+                self._handles[key] = (name, time.time() + self.ttl)
+            return name
+
+    def invalidate(self, model: str, prefix: str):
+        with self._lock:
+            self._handles.pop((model, _digest(prefix)), None)
+
+    def info(self) -> Dict[str, int]:
+        with self._lock:
+            return {"handles": len(self._handles), "disabled_models": len(self._disabled_until)}
+
+
+class GeminiContextCache(ContextCache):
+    def __init__(self, get_client: Callable, ttl: int = LLM_CONTEXT_CACHE_TTL):
+        super().__init__(ttl)
+        self.get_client = get_client
+
+    def _create(self, model: str, prefix: str, key: str) -> str:
+        cached = self.get_client().caches.create(
+            model=model,
+            config=types.CreateCachedContentConfig(
+                system_instruction=prefix,
+                ttl=f"{self.ttl}s",
+                display_name=f"prefix-{key}",
+            ),
+        )
+        return cached.name
+
+
+class LocalContextCache(ContextCache):
+    """Stand-in: handles resolve back to the prefix in-process (see `resolve`)."""
+
+    def __init__(self, ttl: int = LLM_CONTEXT_CACHE_TTL):
+        super().__init__(ttl)
+        self.prefixes: Dict[str, str] = {}
+        self.creates = 0
+
+    def _create(self, model: str, prefix: str, key: str) -> str:
+        self.creates += 1
+        name = f"{LOCAL_PREFIX}{model}/{key}"
+        self.prefixes[name] = prefix
+        return name
+
+    def resolve(self, name: str) -> Optional[str]:
+        return self.prefixes.get(name)
+
+
+def make_context_cache(get_client: Callable) -> Optional[ContextCache]:
+    if LLM_CONTEXT_CACHE == "local":
+        return LocalContextCache()
+    if LLM_CONTEXT_CACHE in ("off", "none", "0", ""):
+        return None
+    return GeminiContextCache(get_client)
@@ -31,6 +31,14 @@ class Message(Base):
     mermaid_code = Column(Text, nullable=True)
     img = Column(Text, nullable=True)  # Base64 encoded image data 
 
+class Chat_Summary(Base):
+    __tablename__ = "chat_summaries"
+
+    session_id = Column(UUID, primary_key=True)
+    upto_message_id = Column(BigInteger, nullable=False, default=0)  # last message folded into the summary
+    summary = Column(Text, nullable=False, default="")
+    updated_at = Column(DateTime, nullable=False)
+
 # Base.metadata.create_all(bind=engine)
 # User.__table__.drop(bind=engine)  # Ensure messages table is created
 # Message.__table__.drop(bind=engine)  # Ensure messages table is created
@@ -83,11 +83,21 @@ class FullLessonRequest(BaseModel):
     model: Optional[str] = None
 
 # ---- Enriched (rendered assets) ----
+class ImageVariant(BaseModel):
+    url: str
+    format: str
+    width: int
+    height: int
+
 class EnrichedLessonSegment(LessonSegment):
+    diagram_key: Optional[str] = None  # GET /diagrams/{diagram_key}.png|svg
     diagram_path: Optional[str] = None
     image_path: Optional[str] = None
     diagram_url: Optional[str] = None
     image_url: Optional[str] = None
+    image_width: Optional[int] = None
+    image_height: Optional[int] = None
+    image_variants: Optional[List[ImageVariant]] = None  # WebP full size + thumbnails
 
 class LessonWithAssets(BaseModel):
     title: str
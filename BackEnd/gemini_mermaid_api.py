@@ -16,10 +16,11 @@ Prereqs:
 This file:
   1) Calls Gemini to produce compact Mermaid code (TEXT only).
   2) Auto-heals Mermaid (adds header, strips brittle 'style'/'classDef').
-  3) Renders via Mermaid CLI (mmdc) to PNG (transparent).
+  3) Renders to PNG (transparent) on the warm worker pool (media/render_pool),
+     falling back to the Mermaid CLI (mmdc).
   4) Returns PNG bytes.
 
-No other project files required.
+Gemini calls go through the shared llm_gateway (one client, rate limits, retries).
 """
 
 from __future__ import annotations
@@ -34,36 +35,21 @@ import tempfile
 from pathlib import Path
 from typing import Optional, Tuple
 
-# Load .env (if present) and read API_KEY
-try:
-    from dotenv import load_dotenv
-except Exception as _e:
-    raise RuntimeError(
-        "python-dotenv not installed. Run: pip install python-dotenv"
-    ) from _e
-
 # Gemini SDK
 try:
-    from google import genai
     from google.genai import types as gtypes
 except Exception as _e:
     raise RuntimeError(
         "google-genai not installed. Run: pip install google-genai"
     ) from _e
 
-
-DEFAULT_TEXT_MODEL = "gemini-2.0-flash-lite"  # fast & inexpensive for text→Mermaid
+import llm_gateway
+from media.cas import diagram_store, diagram_key
+from media.mermaid_validate import validate_mermaid
+from media.render_pool import render_pool, MermaidSyntaxError
 
 
-# -------------------------------
-# Gemini client
-# -------------------------------
-def _gemini_client() -> genai.Client:
-    load_dotenv()  # safe if .env absent; does nothing
-    api_key = os.getenv("API_KEY")
-    if not api_key:
-        raise RuntimeError("Missing API_KEY (set it in .env or environment).")
-    return genai.Client(api_key=api_key)
+DEFAULT_TEXT_MODEL = "gemini-2.0-flash-lite"  # fast & inexpensive for text→Mermaid
 
 
 # -------------------------------
@@ -189,12 +175,23 @@ def _render_mermaid_png(mermaid_code: str, out_path: Path, theme: str = "default
     """
     try:
         bin_path, use_shell = _resolve_mmdc()
-    except MermaidCliNotFound as e:
-        raise RuntimeError(str(e))
+    except MermaidCliNotFound:
+        bin_path, use_shell = None, False  # only fatal if the worker pool can't render either
 
     out_path.parent.mkdir(parents=True, exist_ok=True)
 
     def _run(src: str) -> bool:
+        try:
+            png = render_pool.render(src, fmt="png", theme=theme, background="transparent")
+        except MermaidSyntaxError as ex:
+            print(f"[mmdc] invalid diagram: {ex}", file=sys.stderr)
+            return False
+        if png:
+            out_path.write_bytes(png)
+            return True
+        if bin_path is None:
+            raise RuntimeError(_MMD_HINT)
+
         tmpdir: Path | None = None
         try:
             tmpdir = Path(tempfile.mkdtemp(prefix="mmdc_"))
@@ -223,14 +220,37 @@ def _render_mermaid_png(mermaid_code: str, out_path: Path, theme: str = "default
                 except Exception:
                     pass
 
+    def _stored_run(src: str, validate: bool = True) -> bool:
+        # diagrams the local validator rejects are not sent to the renderer (see the last resort below)
+        check = validate_mermaid(src)
+        if validate and not check.ok:
+            print(f"[mmdc] skipping invalid diagram: {'; '.join(check.errors)}", file=sys.stderr)
+            return False
+        src = check.code
+        # repeat diagrams (and the fallback below) come from the content-addressed store
+        if diagram_store is None:
+            return _run(src)
+        key = diagram_key(src, theme, "transparent", "png")
+        with diagram_store.key_lock(key):
+            if diagram_store.link(key, "png", str(out_path)):
+                return True
+            if not _run(src):
+                return False
+            diagram_store.materialize(diagram_store.put_file(key, str(out_path), "png"), str(out_path))
+            return True
+
     # Try original, then healed, then a tiny fallback
-    if _run(mermaid_code):
+    if _stored_run(mermaid_code):
         return True
     healed = _sanitize_mermaid(mermaid_code)
-    if healed != mermaid_code and _run(healed):
+    if healed != mermaid_code and _stored_run(healed):
+        return True
+    # the validator is stricter than Mermaid in places; before replacing a rejected
+    # original with the placeholder, let the renderer decide once
+    if not validate_mermaid(mermaid_code).ok and _stored_run(mermaid_code, validate=False):
         return True
     fallback = "flowchart TD\nA[Start] --> B[Concept] --> C[End]"
-    return _run(fallback)
+    return _stored_run(fallback)
 
 
 # -------------------------------
@@ -256,22 +276,15 @@ def _generate_mermaid_text(description: str, model: Optional[str] = None) -> str
     """
     Ask Gemini to produce Mermaid code (TEXT generation).
     """
-    client = _gemini_client()
     chosen = model or DEFAULT_TEXT_MODEL
     prompt = _prompt_for_mermaid(description)
 
-    res = client.models.generate_content(
-        model=chosen,
-        contents=prompt,
+    txt = llm_gateway.generate_text(
+        chosen,
+        prompt,
         config=gtypes.GenerateContentConfig(response_modalities=["TEXT"]),
     )
 
-    txt = ""
-    if res and getattr(res, "candidates", None):
-        parts = res.candidates[0].content.parts
-        if parts and getattr(parts[0], "text", None):
-            txt = parts[0].text
-
     mer = _extract_mermaid(txt)
     if not mer:
         mer = "flowchart TD\nA[Start] --> B[Idea] --> C[End]"
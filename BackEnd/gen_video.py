@@ -21,7 +21,6 @@ Reqs:
 from __future__ import annotations
 from utils import generate_audio
 from gemini_mermaid_api import generate_mermaid_image
-import os
 import io
 import json
 import base64
@@ -30,12 +29,11 @@ from typing import List, Dict, Any, Optional, Tuple
 from pathlib import Path
 from db_setup import models
 
-from dotenv import load_dotenv
 from pydantic import BaseModel, Field, ValidationError, field_validator
 from sqlalchemy.orm import Session
 # Gemini SDK
-from google import genai
 from google.genai import types as gtypes
+import llm_gateway
 
 # MoviePy
 from pathlib import Path
@@ -150,23 +148,14 @@ Output format: application/json ONLY with keys slides[] and meta{{}} as per sche
 
 
 # ----------------------------------------------------------------------
-# Gemini client (API key from .env)
+# Gemini (shared client via llm_gateway; API key from .env)
 # ----------------------------------------------------------------------
-def _gemini() -> genai.Client:
-    load_dotenv()
-    api_key = os.getenv("API_KEY")
-    if not api_key:
-        raise RuntimeError("Missing API_KEY in .env")
-    return genai.Client(api_key=api_key)
-
-
 def _plan_slides_with_gemini(user_prompt: str, model="gemini-2.5-flash") -> SlidePlan:
-    client = _gemini()
     schema = _schema_for_gemini()
     prompt = _build_planning_prompt(user_prompt)
 
     log.info("Requesting slide plan from Gemini (structured JSON)...")
-    resp = client.models.generate_content(
+    resp = llm_gateway.generate_content(
         model=model,
         contents=prompt,
         config=gtypes.GenerateContentConfig(
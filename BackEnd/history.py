@@ -0,0 +1,131 @@
+"""
+Token-budgeted chat history for lesson/chat calls.
+
+The most recent turns (up to HISTORY_KEEP_TURNS user+model pairs) are sent
+verbatim, each message clipped to HISTORY_MSG_MAX_TOKENS, as long as they
+fit in HISTORY_TOKEN_BUDGET. Everything older is folded into a rolling
+summary stored in `chat_summaries`. Each turn only the messages newer than
+the stored summary are summarized, together with the previous summary, so
+the summary is never rebuilt from scratch.
+
+Token counts are estimated as len(text) / 4.
+"""
+import os
+from collections import namedtuple
+from datetime import datetime
+from typing import List, Optional
+
+from sqlalchemy.exc import IntegrityError
+
+import llm_gateway
+from db_setup import models
+from db_setup.db_setup import get_db
+
+HISTORY_KEEP_TURNS = int(os.getenv("HISTORY_KEEP_TURNS", "3"))
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "6000"))
+HISTORY_MSG_MAX_TOKENS = int(os.getenv("HISTORY_MSG_MAX_TOKENS", "1200"))
+HISTORY_SUMMARY_TOKENS = int(os.getenv("HISTORY_SUMMARY_TOKENS", "600"))
+HISTORY_SUMMARY_MODEL = os.getenv("HISTORY_SUMMARY_MODEL", "gemini-2.0-flash-lite")
+
+# Same shape the prompt builders read from models.Message (sender/content)
+Turn = namedtuple("Turn", ["sender", "content"])
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text or "") + 3) // 4
+
+
+def _clip(text: str, max_tokens: int) -> str:
+    limit = max_tokens * 4
+    text = text or ""
+    return text if len(text) <= limit else text[:limit].rstrip() + "\n…(truncated)"
+
+
+def _summarize(previous: str, messages: list) -> Optional[str]:
+    convo = "\n\n".join(f"{m.sender.upper()}: {_clip(m.content, HISTORY_MSG_MAX_TOKENS)}" for m in messages)
+    prompt = (
+        "You maintain a running summary of a tutoring conversation. Merge the new messages into the "
+        f"existing summary. Keep topics covered, the learner's level, preferences and open questions; "
+        f"drop lesson prose. At most {HISTORY_SUMMARY_TOKENS * 3 // 4} words, plain text.\n\n"
+        f"Existing summary:\n{previous or '(none)'}\n\nNew messages:\n{convo}"
+    )
+    try:
+        out = llm_gateway.generate_text(HISTORY_SUMMARY_MODEL, prompt).strip()
+    except Exception as e:
+        print(f"[history] summary update failed: {e}")
+        return None
+    return _clip(out, HISTORY_SUMMARY_TOKENS) if out else None
+
+
+def _verbatim_window(messages: list, budget: int) -> int:
+    """Index where the verbatim tail starts: newest messages first, capped by turns and tokens."""
+    start, used = len(messages), 0
+    max_msgs = max(0, HISTORY_KEEP_TURNS) * 2
+    for i in range(len(messages) - 1, -1, -1):
+        cost = estimate_tokens(_clip(messages[i].content, HISTORY_MSG_MAX_TOKENS))
+        if len(messages) - i > max_msgs or used + cost > budget:
+            break
+        used += cost
+        start = i
+    # don't open the window on a model reply
+    while start < len(messages) and messages[start].sender != "user":
+        start += 1
+    return start
+
+
+def _save_summary(db, session_id: str, row, summary: str, upto: int) -> str:
+    """
+    Store the summary; returns the one now in effect. Two first summaries for a
+    session can race on the insert: the loser re-reads the winner's row and keeps
+    whichever summary covers more messages.
+    """
+    if row is None:
+        row = models.Chat_Summary(session_id=session_id)
+        db.add(row)
+    row.summary, row.upto_message_id, row.updated_at = summary, upto, datetime.now()
+    try:
+        db.commit()
+        return summary
+    except IntegrityError:
+        db.rollback()
+    row = db.query(models.Chat_Summary).filter(models.Chat_Summary.session_id == session_id).first()
+    if row is None:
+        return summary
+    if row.upto_message_id >= upto:
+        return row.summary
+    row.summary, row.upto_message_id, row.updated_at = summary, upto, datetime.now()
+    db.commit()
+    return summary
+
+
+def compact_history(session_id: str, messages: list) -> List[Turn]:
+    """
+    messages (models.Message, oldest first) → Turns to send as chat history:
+    an optional summary exchange followed by the verbatim tail.
+    """
+    if not messages:
+        return []
+    start = _verbatim_window(messages, HISTORY_TOKEN_BUDGET - HISTORY_SUMMARY_TOKENS)
+    older, tail = messages[:start], messages[start:]
+
+    summary = ""
+    if older:
+        db = next(get_db())
+        try:
+            row = db.query(models.Chat_Summary).filter(models.Chat_Summary.session_id == session_id).first()
+            upto = row.upto_message_id if row else 0
+            summary = row.summary if row else ""
+            fresh = [m for m in older if m.id > upto]
+            if fresh:
+                updated = _summarize(summary, fresh)
+                if updated is not None:
+                    summary = _save_summary(db, session_id, row, updated, fresh[-1].id)
+        finally:
+            db.close()
+
+    turns: List[Turn] = []
+    if summary:
+        turns.append(Turn("user", f"Summary of our earlier conversation:\n{summary}"))
+        turns.append(Turn("model", "Got it, I'll keep that context in mind."))
+    turns.extend(Turn(m.sender, _clip(m.content, HISTORY_MSG_MAX_TOKENS)) for m in tail)
+    return turns
@@ -0,0 +1,82 @@
+"""
+Reproducible ingest benchmark on generated EPUB fixtures (fixed seeds).
+
+    python ingest/bench_ingest.py [--books 4] [--chapters 30] [--chapter-chars 60000]
+                                  [--whoosh] [--embed] [--out report.json]
+
+Always runs read -> cleanup -> split -> chunk -> dedupe; --whoosh adds a
+BM25 index write into a temp dir and --embed adds MiniLM encoding (no
+Qdrant needed). Prints the same JSON report as build_bundle.py.
+"""
+import argparse
+import json
+import tempfile
+from pathlib import Path
+
+from dedupe import ChunkDeduper
+from ingest_epub import iter_chunks
+from stats import IngestStats
+from synth_epub import write_synthetic_epub
+
+def run(books: int, chapters: int, chapter_chars: int, whoosh: bool, embed: bool, batch: int = 512):
+    with tempfile.TemporaryDirectory() as tmp:
+        fixtures = [write_synthetic_epub(Path(tmp) / f"book_{b:02d}.epub", n_chapters=chapters,
+                                         chapter_chars=chapter_chars, title=f"Book {b}", seed=b)
+                    for b in range(books)]
+        stats = IngestStats()  # fixture generation is not part of the measurement
+        writer = model = None
+        if whoosh:
+            from whoosh import index
+            from build_whoosh import make_schema
+            (Path(tmp) / "ix").mkdir()
+            writer = index.create_in(str(Path(tmp) / "ix"), make_schema()).writer(limitmb=512)
+        if embed:
+            from sentence_transformers import SentenceTransformer
+            from build_qdrant import EMB_MODEL
+            model = SentenceTransformer(EMB_MODEL)
+        deduper = ChunkDeduper()
+        pending = []
+
+        def flush():
+            with stats.stage("embed"):
+                model.encode([c["text"] for c in pending], batch_size=64, show_progress_bar=False,
+                             normalize_embeddings=True)
+            pending.clear()
+
+        for fp in fixtures:
+            for c in iter_chunks(fp, stats=stats):
+                with stats.stage("dedupe"):
+                    dup = deduper.canonical_of(c)
+                if dup is not None:
+                    continue
+                stats.add("indexed")
+                if writer is not None:
+                    with stats.stage("index_write"):
+                        writer.add_document(chunk_id=c["chunk_id"], doc_id=c["doc_id"], title=c["title"], text=c["text"])
+                if model is not None:
+                    pending.append(c)
+                    if len(pending) >= batch:
+                        flush()
+        if pending:
+            flush()
+        if writer is not None:
+            with stats.stage("index_write"):
+                writer.commit()
+    report = stats.report()
+    report["fixtures"] = {"books": books, "chapters": chapters, "chapter_chars": chapter_chars}
+    return report
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--books", type=int, default=4)
+    ap.add_argument("--chapters", type=int, default=30)
+    ap.add_argument("--chapter-chars", type=int, default=60_000)
+    ap.add_argument("--whoosh", action="store_true")
+    ap.add_argument("--embed", action="store_true")
+    ap.add_argument("--out")
+    args = ap.parse_args()
+    report = run(args.books, args.chapters, args.chapter_chars, args.whoosh, args.embed)
+    out = json.dumps(report, indent=2)
+    if args.out:
+        Path(args.out).write_text(out, encoding="utf-8")
+    print(out)
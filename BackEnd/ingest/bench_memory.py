@@ -0,0 +1,42 @@
+"""
+Peak-memory benchmark: streaming iter_chunks vs. the materialized
+parse_epub + make_chunks path, on a large synthetic EPUB.
+
+    python ingest/bench_memory.py [--chapters 200] [--chapter-chars 200000]
+
+Peaks are Python heap peaks from tracemalloc, measured per run.
+"""
+import argparse
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+from ingest_epub import iter_chunks, make_chunks, parse_epub
+from synth_epub import write_synthetic_epub
+
+def _measure(label, fn):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    n = fn()
+    dt = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<12} chunks={n:>8,}  time={dt:7.2f}s  peak={peak / 2**20:8.1f} MiB")
+    return peak
+
+def run(chapters: int, chapter_chars: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        fp = write_synthetic_epub(Path(tmp) / "big.epub", n_chapters=chapters, chapter_chars=chapter_chars)
+        print(f"EPUB: {fp.stat().st_size / 2**20:.1f} MiB on disk, "
+              f"~{chapters * chapter_chars / 2**20:.0f} MiB of text in {chapters} chapters")
+        streamed = _measure("streaming", lambda: sum(1 for _ in iter_chunks(fp)))
+        listed = _measure("materialized", lambda: len(make_chunks(parse_epub(fp))))
+        print(f"streaming peak is {streamed / max(listed, 1):.1%} of materialized")
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--chapters", type=int, default=200)
+    ap.add_argument("--chapter-chars", type=int, default=200_000)
+    args = ap.parse_args()
+    run(args.chapters, args.chapter_chars)
@@ -0,0 +1,146 @@
+"""
+Build a versioned index bundle in one pass over the corpus:
+
+    data/bundles/<version>/
+        whoosh/            BM25 index
+        chunks.jsonl       chunk store (canonical chunks, one JSON per line)
+        provenance.json    collapsed duplicate copies per canonical chunk
+        manifest.json      version, Qdrant collection name, counts
+        ingest_report.json per-stage timings and throughput (see stats.py)
+    Qdrant collection      books_corpus_<version>
+
+The running API only switches to a bundle once it is published
+(data/bundles/CURRENT is replaced atomically, the version it replaces is
+kept in PREVIOUS), so re-ingest never touches the indexes being served.
+--keep N prunes to the newest N bundles, but never the published one or
+the one before it (still served until workers swap, and the rollback).
+
+    python ingest/build_bundle.py [--version V] [--publish] [--keep N]
+"""
+import argparse
+import json
+import shutil
+import sys
+import time
+from pathlib import Path
+
+from qdrant_client import QdrantClient
+from sentence_transformers import SentenceTransformer
+from tqdm import tqdm
+from whoosh import index
+
+from build_qdrant import COLLECTION, EMB_MODEL, EMBED_BATCH, ensure_collection
+from build_whoosh import make_schema
+from dedupe import ChunkDeduper
+from ingest_epub import CHUNK_MODE, iter_chunks
+from stats import IngestStats
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))  # BackEnd/, for the shared bundle layout
+from retrieval.bundles import BUNDLES_DIR, available_versions, publish, read_previous, read_published  # noqa: E402
+
+def build_bundle(epub_dir="data/epubs", version=None, publish_after=False, stats=None):
+    stats = stats or IngestStats()
+    version = version or time.strftime("%Y%m%d-%H%M%S")
+    root = Path(BUNDLES_DIR) / version
+    if root.exists():
+        raise RuntimeError(f"bundle {version} already exists")
+    whoosh_dir = root / "whoosh"
+    whoosh_dir.mkdir(parents=True)
+    collection = f"{COLLECTION}_{version}"
+
+    client = QdrantClient(host="localhost", port=6333)
+    model = SentenceTransformer(EMB_MODEL)
+    ensure_collection(client, dim=model.get_sentence_embedding_dimension(), name=collection)
+    writer = index.create_in(str(whoosh_dir), make_schema()).writer(limitmb=512)
+    deduper = ChunkDeduper()
+
+    pid = 0
+    pids = {}
+    batch = []
+
+    def flush():
+        nonlocal pid
+        with stats.stage("embed"):
+            vecs = model.encode([c["text"] for c in batch], batch_size=64, show_progress_bar=False, normalize_embeddings=True)
+        points = []
+        for c, v in zip(batch, vecs):
+            points.append({"id": pid, "vector": v.tolist(), "payload": c})
+            pids[c["chunk_id"]] = pid
+            pid += 1
+        with stats.stage("upsert"):
+            client.upsert(collection_name=collection, points=points)
+        batch.clear()
+
+    with open(root / "chunks.jsonl", "w", encoding="utf-8") as store:
+        for fp in tqdm(sorted(Path(epub_dir).glob("*.epub"))):
+            for c in iter_chunks(fp, stats=stats):
+                with stats.stage("dedupe"):
+                    dup = deduper.canonical_of(c)
+                if dup is not None:
+                    continue
+                stats.add("indexed")
+                with stats.stage("store_write"):
+                    store.write(json.dumps(c, ensure_ascii=False) + "\n")
+                with stats.stage("index_write"):
+                    writer.add_document(chunk_id=c["chunk_id"], doc_id=c["doc_id"], title=c["title"], text=c["text"])
+                batch.append(c)
+                if len(batch) >= EMBED_BATCH:
+                    flush()
+        if batch:
+            flush()
+    with stats.stage("index_write"):
+        writer.commit()
+    with stats.stage("upsert"):
+        for cid, dupes in deduper.sources.items():
+            client.set_payload(collection_name=collection, points=[pids[cid]], payload={"duplicates": dupes})
+    deduper.save(str(root / "provenance.json"))
+
+    manifest = {
+        "version": version,
+        "collection": collection,
+        "whoosh_dir": "whoosh",
+        "chunk_store": "chunks.jsonl",
+        "emb_model": EMB_MODEL,
+        "chunk_mode": CHUNK_MODE,
+        "chunks": pid,
+        "collapsed": deduper.collapsed,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    # the manifest is written last: a bundle without one is incomplete
+    (root / "manifest.json").write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+    print(stats.dump(str(root / "ingest_report.json")))
+    print(deduper.summary())
+    print(f"Bundle {version} built: {pid} chunks -> {root}")
+    if publish_after:
+        publish(version)
+        print(f"Published bundle {version}.")
+    return manifest
+
+def _created_at(version: str) -> tuple:
+    manifest = json.loads((Path(BUNDLES_DIR) / version / "manifest.json").read_text(encoding="utf-8"))
+    return (manifest.get("created_at", ""), version)
+
+def prune(keep: int):
+    """Delete all but the newest `keep` bundles; the published one and the one it replaced are always kept."""
+    root = Path(BUNDLES_DIR)
+    protected = {read_published(), read_previous()}
+    versions = sorted(available_versions(), key=_created_at)
+    client = QdrantClient(host="localhost", port=6333)
+    for v in versions[:-keep] if keep > 0 else []:
+        if v in protected:
+            continue
+        manifest = json.loads((root / v / "manifest.json").read_text(encoding="utf-8"))
+        client.delete_collection(collection_name=manifest["collection"])
+        shutil.rmtree(root / v)
+        print(f"Pruned bundle {v}.")
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--epub-dir", default="data/epubs")
+    ap.add_argument("--version")
+    ap.add_argument("--publish", action="store_true")
+    ap.add_argument("--keep", type=int, default=0, help="after building, keep only the newest N bundles")
+    args = ap.parse_args()
+    build_bundle(args.epub_dir, version=args.version, publish_after=args.publish)
+    if args.keep:
+        prune(args.keep)
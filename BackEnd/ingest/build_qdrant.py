@@ -1,45 +1,69 @@
 from qdrant_client import QdrantClient
 from qdrant_client.http.models import Distance, VectorParams
 from sentence_transformers import SentenceTransformer
-from ingest_epub import parse_epub, make_chunks
+from ingest_epub import iter_chunks
+from dedupe import ChunkDeduper
+from stats import IngestStats
 from pathlib import Path
+import os
 from tqdm import tqdm
 
 COLLECTION = "books_corpus"
+EMBED_BATCH = 512  # chunks held in memory between encode/upsert rounds
 EMB_MODEL = "sentence-transformers/all-MiniLM-L6-v2"  # 384-d
+DEDUPE = os.getenv("DEDUPE", "1") != "0"
 
-def ensure_collection(client: QdrantClient, dim: int = 384):
-    if COLLECTION not in [c.name for c in client.get_collections().collections]:
+def ensure_collection(client: QdrantClient, dim: int = 384, name: str = COLLECTION):
+    if name not in [c.name for c in client.get_collections().collections]:
         client.recreate_collection(
-            collection_name=COLLECTION,
+            collection_name=name,
             vectors_config=VectorParams(size=dim, distance=Distance.COSINE),
         )
 
-def embed_and_upsert(epub_dir="data/epubs"):
+def embed_and_upsert(epub_dir="data/epubs", report_path=None):
+    stats = IngestStats()
     client = QdrantClient(host="localhost", port=6333)
     model = SentenceTransformer(EMB_MODEL)
     ensure_collection(client, dim=model.get_sentence_embedding_dimension())
 
-    points = []
     pid = 0
-    for fp in tqdm(sorted(Path(epub_dir).glob("*.epub"))):
-        entry = parse_epub(fp)
-        chunks = make_chunks(entry)
-        texts = [c["text"] for c in chunks]
-        vecs = model.encode(texts, batch_size=64, show_progress_bar=True, normalize_embeddings=True)
-        for c, v in zip(chunks, vecs):
+    batch = []
+    deduper = ChunkDeduper() if DEDUPE else None
+    pids = {}  # canonical chunk_id -> point id, for the provenance patch below
+
+    def flush():
+        nonlocal pid
+        with stats.stage("embed"):
+            vecs = model.encode([c["text"] for c in batch], batch_size=64, show_progress_bar=False, normalize_embeddings=True)
+        points = []
+        for c, v in zip(batch, vecs):
             points.append({
                 "id": pid,
                 "vector": v.tolist(),
                 "payload": c
             })
+            if deduper:
+                pids[c["chunk_id"]] = pid
             pid += 1
-            if len(points) >= 2048:
-                client.upsert(collection_name=COLLECTION, points=points)
-                points = []
-    if points:
-        client.upsert(collection_name=COLLECTION, points=points)
+        with stats.stage("upsert"):
+            client.upsert(collection_name=COLLECTION, points=points)
+        batch.clear()
+
+    for fp in tqdm(sorted(Path(epub_dir).glob("*.epub"))):
+        chunks = iter_chunks(fp, stats=stats)
+        for c in (deduper.filter(chunks) if deduper else chunks):
+            batch.append(c)
+            if len(batch) >= EMBED_BATCH:
+                flush()
+    if batch:
+        flush()
+    if deduper:
+        # canonical chunks also list the other books/chapters they were collapsed from
+        for cid, dupes in deduper.sources.items():
+            client.set_payload(collection_name=COLLECTION, points=[pids[cid]], payload={"duplicates": dupes})
+        print(deduper.summary())
+    print(stats.dump(report_path))
     print("Upsert complete.")
 
 if __name__ == "__main__":
-    embed_and_upsert()
+    embed_and_upsert(report_path=os.getenv("INGEST_REPORT"))
@@ -2,36 +2,49 @@ from whoosh import index
 from whoosh.fields import Schema, ID, TEXT
 from whoosh.analysis import StemmingAnalyzer
 from pathlib import Path
-from ingest_epub import parse_epub, make_chunks
+from ingest_epub import iter_chunks
+from dedupe import ChunkDeduper
+from stats import IngestStats
 import os, shutil
 from tqdm import tqdm
 
 INDEX_DIR = "data/whoosh_index"
+DEDUPE = os.getenv("DEDUPE", "1") != "0"
 
-def build_index(epub_dir="data/epubs"):
-    schema = Schema(
+def make_schema() -> Schema:
+    return Schema(
         chunk_id=ID(stored=True, unique=True),
         doc_id=ID(stored=True),
         title=TEXT(stored=True),
         text=TEXT(analyzer=StemmingAnalyzer(), stored=True)
     )
+
+def build_index(epub_dir="data/epubs", report_path=None):
+    stats = IngestStats()
+    schema = make_schema()
     if os.path.exists(INDEX_DIR):
         shutil.rmtree(INDEX_DIR)
     os.makedirs(INDEX_DIR, exist_ok=True)
     ix = index.create_in(INDEX_DIR, schema)
     writer = ix.writer(limitmb=512)
+    deduper = ChunkDeduper() if DEDUPE else None
     for fp in tqdm(sorted(Path(epub_dir).glob("*.epub"))):
-        entry = parse_epub(fp)
-        chunks = make_chunks(entry)
-        for c in chunks:
-            writer.add_document(
-                chunk_id=c["chunk_id"],
-                doc_id=c["doc_id"],
-                title=c["title"],
-                text=c["text"]
-            )
-    writer.commit()
+        chunks = iter_chunks(fp, stats=stats)
+        for c in (deduper.filter(chunks) if deduper else chunks):
+            with stats.stage("index_write"):
+                writer.add_document(
+                    chunk_id=c["chunk_id"],
+                    doc_id=c["doc_id"],
+                    title=c["title"],
+                    text=c["text"]
+                )
+    with stats.stage("index_write"):
+        writer.commit()
+    if deduper:
+        deduper.save(os.path.join(INDEX_DIR, "provenance.json"))
+        print(deduper.summary())
+    print(stats.dump(report_path))
     print("Whoosh index built.")
 
 if __name__ == "__main__":
-    build_index()
+    build_index(report_path=os.getenv("INGEST_REPORT"))
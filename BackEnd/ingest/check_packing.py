@@ -0,0 +1,43 @@
+"""
+Budget check for text_utils.pack_spans (used by both chunk modes).
+
+    python ingest/check_packing.py [--cases 20000] [--seed 0]
+
+Every chunk must cost at most the budget (a single over-budget sentence
+excepted), chunks must move forward and together cover every sentence.
+Includes the case where the overlap tail plus the next sentence used to
+overflow: lengths [100, 20, 240, 10], budget 254, overlap 32.
+"""
+import argparse
+import random
+
+from text_utils import pack_spans
+
+def check(lengths, budget, overlap):
+    spans = [(10 * i, 10 * i + 9) for i in range(len(lengths))]
+    first = {s: i for i, (s, _) in enumerate(spans)}
+    last = {e: i for i, (_, e) in enumerate(spans)}
+    covered = -1
+    for s, e in pack_spans(spans, lengths, budget, overlap):
+        a, b = first[s], last[e]
+        cost = sum(lengths[a:b + 1])
+        assert cost <= budget or a == b, f"chunk {a}..{b} costs {cost} > {budget}: {lengths}"
+        assert a <= covered + 1, f"sentences {covered + 1}..{a - 1} dropped: {lengths}"
+        assert b > covered, f"chunk {a}..{b} makes no progress: {lengths}"
+        covered = b
+    assert covered == len(lengths) - 1, f"tail dropped: {lengths}"
+
+def run(cases, seed):
+    check([100, 20, 240, 10], 254, 32)
+    rng = random.Random(seed)
+    for _ in range(cases):
+        lengths = [rng.randint(1, 300) for _ in range(rng.randint(1, 30))]
+        check(lengths, rng.randint(50, 300), rng.randint(0, 60))
+    print(f"pack_spans ok: {cases + 1} cases")
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--cases", type=int, default=20000)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+    run(args.cases, args.seed)
@@ -0,0 +1,87 @@
+import hashlib
+import json
+import re
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional
+import numpy as np
+
+_WORD = re.compile(r"[a-z0-9]+")
+_PROVENANCE_KEYS = ("doc_id", "title", "author", "chapter", "section", "chunk_id", "start_char", "end_char")
+
+def normalize_text(text: str) -> str:
+    """Case/punctuation/whitespace-insensitive form used for duplicate hashing."""
+    return " ".join(_WORD.findall((text or "").lower()))
+
+def simhash64(norm: str, shingle: int = 3) -> int:
+    """64-bit SimHash over word shingles; near-identical texts differ in a few bits."""
+    words = norm.split()
+    grams = [" ".join(words[i:i + shingle]) for i in range(max(1, len(words) - shingle + 1))]
+    digests = b"".join(hashlib.blake2b(g.encode(), digest_size=8).digest() for g in grams)
+    bits = np.unpackbits(np.frombuffer(digests, dtype=np.uint8).reshape(-1, 8), axis=1)
+    votes = bits.sum(axis=0) * 2 > len(grams)
+    return int.from_bytes(np.packbits(votes).tobytes(), "big")
+
+def provenance(chunk: Dict) -> Dict:
+    return {k: chunk.get(k) for k in _PROVENANCE_KEYS}
+
+class ChunkDeduper:
+    """
+    Collapses exact and near-exact duplicate chunks across books.
+    Exact: sha1 of the normalized text. Near-exact: SimHash within
+    `max_distance` bits, looked up through 4 x 16-bit bands (pigeonhole:
+    any pair within 3 bits shares at least one band).
+    The first occurrence is canonical; later copies become provenance
+    records under the canonical chunk_id.
+    """
+
+    _BANDS = 4
+
+    def __init__(self, max_distance: int = 3):
+        self.max_distance = max_distance
+        self._exact: Dict[str, str] = {}
+        self._bands: List[Dict[int, List]] = [dict() for _ in range(self._BANDS)]
+        self.sources: Dict[str, List[Dict]] = {}
+        self.seen = 0
+        self.collapsed = 0
+
+    def _near(self, sh: int) -> Optional[str]:
+        for b in range(self._BANDS):
+            key = (sh >> (16 * b)) & 0xFFFF
+            for other, cid in self._bands[b].get(key, ()):
+                if bin(sh ^ other).count("1") <= self.max_distance:
+                    return cid
+        return None
+
+    def canonical_of(self, chunk: Dict) -> Optional[str]:
+        """Register `chunk`; return the canonical chunk_id if it is a duplicate, else None."""
+        self.seen += 1
+        norm = normalize_text(chunk["text"])
+        digest = hashlib.sha1(norm.encode()).hexdigest()
+        cid = self._exact.get(digest)
+        sh = simhash64(norm)
+        if cid is None:
+            cid = self._near(sh)
+        if cid is not None:
+            self.sources.setdefault(cid, []).append(provenance(chunk))
+            self.collapsed += 1
+            return cid
+        own = chunk["chunk_id"]
+        self._exact[digest] = own
+        for b in range(self._BANDS):
+            self._bands[b].setdefault((sh >> (16 * b)) & 0xFFFF, []).append((sh, own))
+        return None
+
+    def filter(self, chunks: Iterable[Dict]) -> Iterator[Dict]:
+        """Pass through canonical chunks only."""
+        for c in chunks:
+            if self.canonical_of(c) is None:
+                yield c
+
+    def save(self, path: str):
+        """Write {canonical chunk_id: [provenance of each collapsed copy]} as JSON."""
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.sources, f, ensure_ascii=False)
+
+    def summary(self) -> str:
+        return f"dedupe: {self.collapsed}/{self.seen} chunks collapsed into {len(self.sources)} canonical chunks"
@@ -1,78 +1,159 @@
+import os
+import posixpath
+import zipfile
+import xml.etree.ElementTree as ET
+from functools import lru_cache
 from pathlib import Path
-from typing import Dict, List
-from ebooklib import epub, ITEM_DOCUMENT
+from typing import Dict, Iterator, List, Optional, Tuple
+from urllib.parse import unquote
 from bs4 import BeautifulSoup
-from text_utils import html_to_text, split_sentences, chunk_by_tokens
+from stats import IngestStats, timed
+from text_utils import html_to_text, split_sentence_spans, chunk_spans, chunk_spans_by_tokens
 from tqdm import tqdm
 
-def parse_epub(epub_path: Path) -> Dict:
-    book = epub.read_epub(str(epub_path))
-    # metadata
-    def first(md, key): 
-        vals = book.get_metadata('DC', key)
-        return vals[0][0] if vals else None
-    meta = {
+# "chars" packs ~1400 chars per chunk; "tokens" packs to the embedder's real token window
+CHUNK_MODE = os.getenv("CHUNK_MODE", "chars")
+CHUNK_TOKENIZER = os.getenv("CHUNK_TOKENIZER", "sentence-transformers/all-MiniLM-L6-v2")
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", 254))   # 256 minus [CLS]/[SEP]
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", 32))
+
+_NS = {
+    "c": "urn:oasis:names:tc:opendocument:xmlns:container",
+    "opf": "http://www.idpf.org/2007/opf",
+    "dc": "http://purl.org/dc/elements/1.1/",
+}
+_DOC_TYPES = ("application/xhtml+xml", "text/html")
+
+@lru_cache(maxsize=1)
+def _tokenizer():
+    from transformers import AutoTokenizer
+    return AutoTokenizer.from_pretrained(CHUNK_TOKENIZER, use_fast=True)
+
+def _read_opf(zf: zipfile.ZipFile) -> Tuple[str, ET.Element]:
+    container = ET.fromstring(zf.read("META-INF/container.xml"))
+    rootfile = container.find(".//c:rootfile", _NS).get("full-path")
+    return rootfile, ET.fromstring(zf.read(rootfile))
+
+def _meta_from_opf(epub_path: Path, opf: ET.Element) -> Dict:
+    def first(key):
+        el = opf.find(f".//dc:{key}", _NS)
+        return el.text.strip() if el is not None and el.text and el.text.strip() else None
+    return {
         "doc_id": epub_path.name,
-        "title": first('DC','title') or epub_path.stem,
-        "author": first('DC','creator') or "",
-        "lang": first('DC','language') or "en",
+        "title": first('title') or epub_path.stem,
+        "author": first('creator') or "",
+        "lang": first('language') or "en",
+    }
+
+def read_meta(epub_path: Path) -> Dict:
+    """Book metadata from the OPF only; no document content is read."""
+    with zipfile.ZipFile(epub_path) as zf:
+        _, opf = _read_opf(zf)
+        return _meta_from_opf(epub_path, opf)
+
+def _chapter_from_html(html: bytes, idx: int) -> Optional[Dict]:
+    soup = BeautifulSoup(html, "html.parser")
+    body = soup.body or soup
+    # remove scripts/styles/nav
+    for tag in body(["script","style","nav","header","footer"]):
+        tag.decompose()
+    # best-effort headings
+    chapter = None
+    for h in body.find_all(['h1','h2','h3']):
+        chapter = h.get_text(strip=True); break
+    text = body.get_text(" ", strip=True)
+    text = html_to_text(text)
+    if not text or sum(ch.isalnum() for ch in text) < 500:
+        return None
+    return {
+        "chapter": chapter or f"section-{idx:04d}",
+        "section": chapter or "",
+        "text": text
     }
-    chapters: List[Dict] = []
-    idx = 0
-    for item in book.get_items():
-        if item.get_type() != ITEM_DOCUMENT:
-            continue
-        soup = BeautifulSoup(item.get_body_content(), "html.parser")
-        # remove scripts/styles/nav
-        for tag in soup(["script","style","nav","header","footer"]):
-            tag.decompose()
-        # best-effort headings
-        chapter = None
-        for h in soup.find_all(['h1','h2','h3']):
-            chapter = h.get_text(strip=True); break
-        text = soup.get_text(" ", strip=True)
-        text = html_to_text(text)
-        if not text or sum(ch.isalnum() for ch in text) < 500:
-            continue
-        chapters.append({
-            "chapter": chapter or f"section-{idx:04d}",
-            "section": chapter or "",
-            "text": text
-        })
-        idx += 1
-    return {"meta": meta, "chapters": chapters}
 
-def make_chunks(entry: Dict) -> List[Dict]:
+def iter_chapters(epub_path: Path, stats: Optional[IngestStats] = None) -> Iterator[Dict]:
+    """
+    Yield chapters one document item at a time (manifest order), reading each
+    item straight from the zip so only the current chapter is held in memory.
+    """
+    if stats is not None:
+        stats.add("books")
+        stats.add("epub_bytes", os.path.getsize(epub_path))
+    with zipfile.ZipFile(epub_path) as zf:
+        with timed(stats, "epub_read"):
+            opf_path, opf = _read_opf(zf)
+        base = posixpath.dirname(opf_path)
+        idx = 0
+        for item in opf.iterfind("opf:manifest/opf:item", _NS):
+            if item.get("media-type") not in _DOC_TYPES or "nav" in (item.get("properties") or "").split():
+                continue
+            name = posixpath.normpath(posixpath.join(base, unquote(item.get("href", ""))))
+            try:
+                with timed(stats, "epub_read"):
+                    html = zf.read(name)
+            except KeyError:
+                continue
+            with timed(stats, "html_cleanup"):
+                ch = _chapter_from_html(html, idx)
+            del html
+            if ch is None:
+                continue
+            if stats is not None:
+                stats.add("chapters")
+                stats.add("text_chars", len(ch["text"]))
+            yield ch
+            idx += 1
+
+def parse_epub(epub_path: Path) -> Dict:
+    return {"meta": read_meta(epub_path), "chapters": list(iter_chapters(epub_path))}
+
+def _chunk_spans(text: str, mode: str, stats: Optional[IngestStats] = None):
+    with timed(stats, "sentence_split"):
+        sents = split_sentence_spans(text)
+    with timed(stats, "chunk"):
+        if mode == "tokens":
+            return chunk_spans_by_tokens(text, sents, _tokenizer(),
+                                         max_tokens=CHUNK_MAX_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS)
+        return chunk_spans(text, sents, max_chars=1400, overlap_chars=200)
+
+def chapter_chunks(meta: Dict, ch: Dict, mode: Optional[str] = None,
+                   stats: Optional[IngestStats] = None) -> Iterator[Dict]:
+    text = ch["text"]
+    spans = _chunk_spans(text, mode or CHUNK_MODE, stats)
+    if stats is not None:
+        stats.add("chunks", len(spans))
+    for j, (start, end) in enumerate(spans):
+        yield {
+            "doc_id": meta["doc_id"],
+            "title": meta["title"],
+            "author": meta["author"],
+            "lang": meta["lang"],
+            "chapter": ch["chapter"],
+            "section": ch["section"],
+            "chunk_id": f"{meta['doc_id']}#{ch['chapter']}#{j:04d}",
+            "start_char": start,
+            "end_char": end,
+            "text": text[start:end]
+        }
+
+def iter_chunks(epub_path: Path, mode: Optional[str] = None,
+                stats: Optional[IngestStats] = None) -> Iterator[Dict]:
+    """Stream chunks for one book; peak memory is bounded by a single chapter."""
+    meta = read_meta(epub_path)
+    for ch in iter_chapters(epub_path, stats):
+        yield from chapter_chunks(meta, ch, mode, stats)
+
+def make_chunks(entry: Dict, mode: Optional[str] = None) -> List[Dict]:
     meta = entry["meta"]
     out = []
-    pos = 0
     for ch in entry["chapters"]:
-        sents = split_sentences(ch["text"])
-        pieces = chunk_by_tokens(sents, max_chars=1400, overlap_chars=200)
-        for j, piece in enumerate(pieces):
-            start = ch["text"].find(piece[:60])  # approximate
-            if start < 0: start = pos
-            end = start + len(piece)
-            out.append({
-                "doc_id": meta["doc_id"],
-                "title": meta["title"],
-                "author": meta["author"],
-                "lang": meta["lang"],
-                "chapter": ch["chapter"],
-                "section": ch["section"],
-                "chunk_id": f"{meta['doc_id']}#{ch['chapter']}#{j:04d}",
-                "start_char": start,
-                "end_char": end,
-                "text": piece
-            })
-        pos += len(ch["text"])
+        out.extend(chapter_chunks(meta, ch, mode))
     return out
 
 if __name__ == "__main__":
     epub_dir = Path("data/epubs")
-    all_chunks = []
+    total = 0
     for fp in tqdm(sorted(epub_dir.glob("*.epub"))):
-        entry = parse_epub(fp)
-        chunks = make_chunks(entry)
-        all_chunks.extend(chunks)
-    print(f"Total chunks: {len(all_chunks)}")
+        for _ in iter_chunks(fp):
+            total += 1
+    print(f"Total chunks: {total}")
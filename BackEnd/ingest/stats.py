@@ -0,0 +1,56 @@
+import json
+import time
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from typing import Any, Dict, Optional
+
+
+class IngestStats:
+    """Per-stage wall time plus throughput counters for one ingest run."""
+
+    def __init__(self):
+        self.seconds: Dict[str, float] = defaultdict(float)
+        self.calls: Dict[str, int] = defaultdict(int)
+        self.counters: Dict[str, int] = defaultdict(int)
+        self._t0 = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name: str):
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] += time.perf_counter() - t
+            self.calls[name] += 1
+
+    def add(self, counter: str, n: int = 1):
+        self.counters[counter] += n
+
+    def report(self) -> Dict[str, Any]:
+        wall = time.perf_counter() - self._t0
+        staged = sum(self.seconds.values()) or 1e-9
+        chunks = self.counters.get("chunks", 0)
+        mb = self.counters.get("epub_bytes", 0) / 1e6
+        return {
+            "wall_seconds": round(wall, 3),
+            "stages": {
+                name: {"seconds": round(sec, 3), "calls": self.calls[name], "share": round(sec / staged, 4)}
+                for name, sec in sorted(self.seconds.items(), key=lambda kv: -kv[1])
+            },
+            "counters": dict(self.counters),
+            "chunks_per_sec": round(chunks / wall, 2) if wall else 0.0,
+            "epub_mb_per_sec": round(mb / wall, 3) if wall else 0.0,
+            "text_mb_per_sec": round(self.counters.get("text_chars", 0) / 1e6 / wall, 3) if wall else 0.0,
+        }
+
+    def dump(self, path: Optional[str] = None) -> str:
+        out = json.dumps(self.report(), indent=2)
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(out)
+        return out
+
+
+def timed(stats: Optional[IngestStats], name: str):
+    """`stats.stage(name)` or a no-op when the caller is not instrumenting."""
+    return stats.stage(name) if stats is not None else nullcontext()
@@ -0,0 +1,52 @@
+"""Synthetic text / EPUB fixtures for the ingest benchmarks."""
+import random
+import zipfile
+from html import escape
+from pathlib import Path
+
+_WORDS = ("graph vertex edge queue stack frontier level order visit parent child "
+          "tree node search breadth depth path cycle weight heap sort merge "
+          "array index pointer list table hash bucket key value").split()
+
+def synthetic_chapter(n_chars: int, seed: int = 0) -> str:
+    rnd = random.Random(seed)
+    out, size = [], 0
+    while size < n_chars:
+        words = rnd.choices(_WORDS, k=rnd.randint(6, 40))
+        sent = " ".join(words).capitalize() + rnd.choice([".", ".", ".", "?", "!"])
+        out.append(sent)
+        size += len(sent) + 1
+    return " ".join(out)
+
+_CONTAINER = """<?xml version="1.0"?>
+<container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">
+  <rootfiles><rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/></rootfiles>
+</container>"""
+
+def write_synthetic_epub(path: Path, n_chapters: int = 50, chapter_chars: int = 200_000,
+                         title: str = "Synthetic Book", seed: int = 0) -> Path:
+    """Write a minimal valid EPUB with `n_chapters` XHTML documents of ~`chapter_chars` each."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    manifest, spine = [], []
+    with zipfile.ZipFile(path, "w") as zf:
+        zf.writestr("mimetype", "application/epub+zip", compress_type=zipfile.ZIP_STORED)
+        zf.writestr("META-INF/container.xml", _CONTAINER)
+        for i in range(n_chapters):
+            name = f"ch{i:04d}.xhtml"
+            paras = "".join(f"<p>{escape(p)}</p>" for p in
+                            synthetic_chapter(chapter_chars, seed=seed * 100_003 + i).split("! "))
+            zf.writestr(f"OEBPS/{name}",
+                        f'<html xmlns="http://www.w3.org/1999/xhtml"><head><title>{title}</title></head>'
+                        f"<body><h1>Chapter {i + 1}</h1>{paras}</body></html>",
+                        compress_type=zipfile.ZIP_DEFLATED)
+            manifest.append(f'<item id="c{i}" href="{name}" media-type="application/xhtml+xml"/>')
+            spine.append(f'<itemref idref="c{i}"/>')
+        zf.writestr("OEBPS/content.opf",
+                    '<?xml version="1.0"?>'
+                    '<package xmlns="http://www.idpf.org/2007/opf" version="3.0" unique-identifier="id">'
+                    '<metadata xmlns:dc="http://purl.org/dc/elements/1.1/">'
+                    f'<dc:identifier id="id">{escape(path.stem)}</dc:identifier><dc:title>{escape(title)}</dc:title>'
+                    '<dc:creator>bench</dc:creator><dc:language>en</dc:language></metadata>'
+                    f'<manifest>{"".join(manifest)}</manifest><spine>{"".join(spine)}</spine></package>')
+    return path
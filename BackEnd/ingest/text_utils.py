@@ -1,10 +1,12 @@
 import re
-from typing import List, Tuple
+from typing import List, Sequence, Tuple
 from unidecode import unidecode
 import nltk
 
 _SENT_SPLIT = nltk.data.load("tokenizers/punkt/english.pickle")
 
+Span = Tuple[int, int]
+
 def html_to_text(html: str) -> str:
     # expect pre-cleaned bs4 get_text(); this is a final pass
     text = unidecode(html)
@@ -14,26 +16,88 @@ def html_to_text(html: str) -> str:
 def split_sentences(text: str) -> List[str]:
     return _SENT_SPLIT.tokenize(text)
 
+def split_sentence_spans(text: str) -> List[Span]:
+    """Sentence boundaries as (start, end) offsets into `text` (no copies)."""
+    return [(s, e) for s, e in _SENT_SPLIT.span_tokenize(text) if e > s]
+
+def pack_spans(spans: Sequence[Span], lengths: Sequence[int], budget: int, overlap: int) -> List[Span]:
+    """
+    Greedy single pass over sentence spans. `lengths[i]` is the cost of spans[i]
+    (chars or tokens); a chunk holds whole sentences up to `budget`, and the next
+    chunk re-starts at the trailing sentences that fit in `overlap` (fewer, if
+    tail + next sentence would exceed `budget`). Returns (start, end) offsets of
+    each chunk; a single sentence over budget becomes its own chunk.
+    """
+    out: List[Span] = []
+    first, cost = 0, 0          # window is spans[first:i]
+    for i, n in enumerate(lengths):
+        if i > first and cost + n > budget:
+            out.append((spans[first][0], spans[i - 1][1]))
+            # walk back from the end of the window for the overlap tail
+            j, tail = i, 0
+            while j - 1 > first and tail + lengths[j - 1] <= overlap:
+                j -= 1
+                tail += lengths[j]
+            first, cost = j, tail
+            # the carried tail plus this sentence must still fit: shed tail from the front
+            while first < i and cost + n > budget:
+                cost -= lengths[first]
+                first += 1
+        cost += n
+    if first < len(spans):
+        out.append((spans[first][0], spans[-1][1]))
+    return out
+
+def chunk_spans(text: str, spans: Sequence[Span], max_chars: int = 1400, overlap_chars: int = 200) -> List[Span]:
+    """
+    Char-based packing (robust for MiniLM). Aim ~600 tokens ≈ 1200–1500 chars.
+    Drops tiny chunks; offsets index straight into `text`.
+    """
+    lengths = [e - s + 1 for s, e in spans]  # +1 for the joining space
+    return [(s, e) for s, e in pack_spans(spans, lengths, max_chars, overlap_chars)
+            if _alnum_count(text, s, e) >= 200]
+
+def token_lengths(text: str, spans: Sequence[Span], tokenizer, max_tokens: int) -> Tuple[List[Span], List[int]]:
+    """
+    Count real tokens for every sentence with one batched call to a HF fast
+    tokenizer. Sentences longer than `max_tokens` are cut at token boundaries
+    (via offset mappings) so no chunk is silently truncated by the embedder.
+    """
+    if not spans:
+        return [], []
+    enc = tokenizer([text[s:e] for s, e in spans], add_special_tokens=False,
+                    return_offsets_mapping=True, return_attention_mask=False)
+    out_spans: List[Span] = []
+    lengths: List[int] = []
+    for (s, _), offs in zip(spans, enc["offset_mapping"]):
+        for k in range(0, len(offs), max_tokens):
+            window = offs[k:k + max_tokens]
+            out_spans.append((s + window[0][0], s + window[-1][1]))
+            lengths.append(len(window))
+    return out_spans, lengths
+
+def chunk_spans_by_tokens(text: str, spans: Sequence[Span], tokenizer,
+                          max_tokens: int = 254, overlap_tokens: int = 32) -> List[Span]:
+    """
+    Token-budget packing: fills each chunk up to the embedder's window
+    (MiniLM: 256 incl. [CLS]/[SEP]) with a token-based overlap tail.
+    """
+    spans, lengths = token_lengths(text, spans, tokenizer, max_tokens)
+    return [(s, e) for s, e in pack_spans(spans, lengths, max_tokens, overlap_tokens)
+            if _alnum_count(text, s, e) >= 200]
+
 def chunk_by_tokens(sentences: List[str], max_chars: int = 1400, overlap_chars: int = 200) -> List[str]:
     """
-    Simple char-based packing (robust for MiniLM). Aim ~600 tokens ≈ 1200–1500 chars.
+    Simple char-based packing over pre-split sentences; see chunk_spans for the
+    offset-preserving variant used by make_chunks.
     """
-    chunks, cur, cur_len = [], [], 0
+    sentences = [s.strip() for s in sentences if s and s.strip()]
+    text = " ".join(sentences)
+    spans, pos = [], 0
     for s in sentences:
-        s = s.strip()
-        if not s:
-            continue
-        if cur_len + len(s) + 1 <= max_chars:
-            cur.append(s); cur_len += len(s) + 1
-        else:
-            if cur:
-                chunks.append(" ".join(cur))
-                # start next with an overlap tail
-                tail = " ".join(" ".join(cur)[-overlap_chars:].split(".")[-1:]).strip()
-                cur, cur_len = ([tail] if tail else []), len(tail)
-            # add current sentence (might exceed if single long, that’s fine)
-            cur.append(s); cur_len += len(s) + 1
-    if cur:
-        chunks.append(" ".join(cur))
-    # filter tiny chunks
-    return [c for c in chunks if sum(ch.isalnum() for ch in c) >= 200]
+        spans.append((pos, pos + len(s)))
+        pos += len(s) + 1
+    return [text[s:e] for s, e in chunk_spans(text, spans, max_chars, overlap_chars)]
+
+def _alnum_count(text: str, start: int, end: int) -> int:
+    return sum(ch.isalnum() for ch in text[start:end])
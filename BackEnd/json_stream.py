@@ -0,0 +1,121 @@
+"""
+Parsing JSON out of model output.
+
+extract_json pulls the first top-level JSON object out of a reply that may
+be wrapped in fences or prose, or followed by junk, in one decoder pass.
+
+SegmentStream is fed text deltas of a lesson object
+({"title": ..., "segments": [{...}, {...}], ...}) and hands back each
+element of the top-level "segments" array as soon as its closing brace
+arrives. Strings and escapes are tracked, so braces inside Markdown text
+don't confuse it; anything before the first '{' (e.g. a ```json fence) is
+skipped.
+"""
+import json
+import re
+from typing import Any, Dict, List
+
+_SEGMENTS_KEY = re.compile(r'"segments"\s*:\s*$')
+_FENCE_OPEN = re.compile(r"```(?:json)?", re.IGNORECASE)
+_decoder = json.JSONDecoder()
+
+
+def extract_json(text: str) -> Any:
+    """
+    First top-level JSON value in `text`, tolerating ```json fences, leading
+    prose and trailing junk. Exactly one candidate is decoded: the value the
+    text starts with, else the first '{' inside a fence, else the first '{'.
+    raw_decode scans it once (strings and escapes included) and stops at the
+    end of the value. If that candidate doesn't parse (e.g. a truncated
+    lesson), the result is {"raw": text}; objects nested inside it are never
+    returned in its place.
+    """
+    if not isinstance(text, str):
+        return {"raw": text}
+    n = len(text)
+    i = 0
+    while i < n and text[i] in " \t\r\n":
+        i += 1
+    if i < n and text[i] in "{[":
+        try:
+            val, end = _decoder.raw_decode(text, i)
+            if isinstance(val, dict) or not text[end:].strip():
+                return val
+        except ValueError:
+            pass
+        if text[i] == "{":
+            return {"raw": text}
+
+    fence = _FENCE_OPEN.search(text)
+    j = text.find("{", fence.end()) if fence else -1
+    if j == -1:
+        j = text.find("{")
+    if j != -1:
+        try:
+            return _decoder.raw_decode(text, j)[0]
+        except ValueError:
+            pass
+    return {"raw": text}
+
+
+class SegmentStream:
+    def __init__(self):
+        self.buf = ""
+        self.pos = 0             # next char to scan
+        self.depth = 0
+        self.in_str = False
+        self.esc = False
+        self.started = False     # seen the top-level '{'
+        self.done = False        # top-level object closed
+        self.in_segments = False
+        self.seg_start = -1
+        self.count = 0
+
+    def feed(self, text: str) -> List[Dict[str, Any]]:
+        """Add a delta; return the segments completed by it."""
+        self.buf += text
+        out: List[Dict[str, Any]] = []
+        buf, i, n = self.buf, self.pos, len(self.buf)
+        while i < n and not self.done:
+            ch = buf[i]
+            if self.in_str:
+                if self.esc:
+                    self.esc = False
+                elif ch == "\\":
+                    self.esc = True
+                elif ch == '"':
+                    self.in_str = False
+            elif not self.started:
+                if ch == "{":
+                    self.started = True
+                    self.depth = 1
+            elif ch == '"':
+                self.in_str = True
+            elif ch in "{[":
+                if ch == "[" and self.depth == 1 and _SEGMENTS_KEY.search(buf, max(0, i - 64), i):
+                    self.in_segments = True
+                elif ch == "{" and self.in_segments and self.depth == 2:
+                    self.seg_start = i
+                self.depth += 1
+            elif ch in "}]":
+                self.depth -= 1
+                if ch == "}" and self.in_segments and self.depth == 2 and self.seg_start >= 0:
+                    try:
+                        seg = json.loads(buf[self.seg_start:i + 1])
+                        if isinstance(seg, dict):
+                            out.append(seg)
+                            self.count += 1
+                    except ValueError:
+                        pass
+                    self.seg_start = -1
+                elif ch == "]" and self.in_segments and self.depth == 1:
+                    self.in_segments = False
+                elif self.depth == 0:
+                    self.done = True
+            i += 1
+        self.pos = i
+        return out
+
+    @property
+    def text(self) -> str:
+        return self.buf
@@ -0,0 +1,182 @@
+"""
+Semantic cache of rendered lessons.
+
+A normalized TaskSpec is embedded (topic + keywords, same MiniLM model as
+retrieval). A stored LessonWithAssets is served when cosine similarity is at
+least LESSON_CACHE_THRESHOLD, difficulty/audience/language match exactly,
+and the lesson already has the diagrams/images the new request asks for.
+
+Entries live under LESSON_CACHE_DIR: index.pkl (metadata + vectors) and
+one pickle per lesson. Rendered artifacts are shared, not copied.
+"""
+import os
+import pickle
+import threading
+import time
+from typing import Any, Dict, List, Optional
+from uuid import uuid4
+
+import numpy as np
+
+from db_setup.schemas import LessonWithAssets, TaskSpec
+
+LESSON_CACHE = os.getenv("LESSON_CACHE", "1") == "1"
+LESSON_CACHE_DIR = os.getenv("LESSON_CACHE_DIR", os.path.join("local_data", "lesson_cache"))
+LESSON_CACHE_THRESHOLD = float(os.getenv("LESSON_CACHE_THRESHOLD", "0.92"))
+LESSON_CACHE_MAX = int(os.getenv("LESSON_CACHE_MAX", "500"))
+
+
+def _task_text(task: TaskSpec) -> str:
+    return f"{task.topic}. {' '.join(task.keywords)}".strip()
+
+
+def _facets(task: TaskSpec) -> tuple:
+    return tuple((v or "").strip().lower() for v in (task.difficulty, task.audience, task.language))
+
+
+def _embed(text: str) -> np.ndarray:
+    from retrieval.hybrid_search import get_embedder
+    vec = get_embedder().encode([text], normalize_embeddings=True)[0]
+    return np.asarray(vec, dtype=np.float32)
+
+
+def _covers(entry: Dict[str, Any], task: TaskSpec) -> bool:
+    return entry["n_diagrams"] >= task.min_diagrams and entry["n_images"] >= task.min_images
+
+
+class LessonCache:
+    def __init__(self, root: str = LESSON_CACHE_DIR, threshold: float = LESSON_CACHE_THRESHOLD,
+                 max_entries: int = LESSON_CACHE_MAX):
+        self.root = root
+        self.threshold = threshold
+        self.max_entries = max(1, max_entries)
+        self.entries: List[Dict[str, Any]] = []
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    # ---------- persistence ----------
+
+    def _index_path(self) -> str:
+        return os.path.join(self.root, "index.pkl")
+
+    def _lesson_path(self, entry_id: str) -> str:
+        return os.path.join(self.root, f"{entry_id}.pkl")
+
+    def _load(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        try:
+            with open(self._index_path(), "rb") as f:
+                self.entries = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            self.entries = []
+
+    def _save(self):
+        os.makedirs(self.root, exist_ok=True)
+        tmp = self._index_path() + ".tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump(self.entries, f)
+        os.replace(tmp, self._index_path())
+
+    def _drop(self, entry: Dict[str, Any]):
+        try:
+            os.remove(self._lesson_path(entry["id"]))
+        except OSError:
+            pass
+
+    # ---------- API ----------
+
+    def lookup(self, task: TaskSpec) -> Optional[LessonWithAssets]:
+        vec = _embed(_task_text(task))
+        facets = _facets(task)
+        with self._lock:
+            self._load()
+            best, best_sim = None, self.threshold
+            for e in self.entries:
+                if e["facets"] != facets or not _covers(e, task):
+                    continue
+                sim = float(np.dot(e["vec"], vec))
+                if sim >= best_sim:
+                    best, best_sim = e, sim
+            if best is None:
+                self.misses += 1
+                return None
+            try:
+                with open(self._lesson_path(best["id"]), "rb") as f:
+                    lesson = pickle.load(f)
+            except (OSError, EOFError, pickle.UnpicklingError):
+                self.entries.remove(best)
+                self._save()
+                self.misses += 1
+                return None
+            self.hits += 1
+            best["hits"] += 1
+            best["last_hit"] = time.time()
+        print(f"[lesson_cache] hit '{task.topic}' → '{best['topic']}' (cos={best_sim:.3f})")
+        return lesson
+
+    def store(self, task: TaskSpec, lesson: LessonWithAssets) -> str:
+        entry = {
+            "id": uuid4().hex[:12],
+            "topic": task.topic,
+            "facets": _facets(task),
+            "vec": _embed(_task_text(task)),
+            "n_diagrams": sum(1 for s in lesson.segments if s.diagram_url),
+            "n_images": sum(1 for s in lesson.segments if s.image_url),
+            "created": time.time(),
+            "last_hit": None,
+            "hits": 0,
+        }
+        with self._lock:
+            self._load()
+            os.makedirs(self.root, exist_ok=True)
+            with open(self._lesson_path(entry["id"]), "wb") as f:
+                pickle.dump(lesson, f)
+            self.entries.append(entry)
+            # evict the least recently used beyond the cap
+            if len(self.entries) > self.max_entries:
+                self.entries.sort(key=lambda e: e["last_hit"] or e["created"], reverse=True)
+                for e in self.entries[self.max_entries:]:
+                    self._drop(e)
+                del self.entries[self.max_entries:]
+            self._save()
+        return entry["id"]
+
+    def invalidate(self, entry_id: Optional[str] = None, topic: Optional[str] = None) -> int:
+        """Drop one entry, every entry whose topic contains `topic`, or (no arguments) everything."""
+        with self._lock:
+            self._load()
+            if entry_id:
+                doomed = [e for e in self.entries if e["id"] == entry_id]
+            elif topic:
+                doomed = [e for e in self.entries if topic.lower() in e["topic"].lower()]
+            else:
+                doomed = list(self.entries)
+            for e in doomed:
+                self._drop(e)
+            ids = {e["id"] for e in doomed}
+            self.entries = [e for e in self.entries if e["id"] not in ids]
+            self._save()
+        return len(doomed)
+
+    def info(self) -> Dict[str, Any]:
+        with self._lock:
+            self._load()
+            total = self.hits + self.misses
+            return {
+                "enabled": LESSON_CACHE,
+                "threshold": self.threshold,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0,
+                "entries": [
+                    {k: e[k] for k in ("id", "topic", "facets", "n_diagrams", "n_images", "hits", "created", "last_hit")}
+                    for e in self.entries
+                ],
+            }
+
+
+lesson_cache = LessonCache()
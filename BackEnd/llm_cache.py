@@ -0,0 +1,238 @@
+"""
+Response cache for deterministic LLM calls (used by llm_gateway.generate_text).
+
+Keyed by sha256(model, contents, config). Entries carry their own TTL, set
+per call site; calls without a TTL bypass the cache entirely.
+
+- LLM_CACHE=memory (default): in-process LRU of LLM_CACHE_SIZE entries
+- LLM_CACHE=disk: one JSON file per key under LLM_CACHE_DIR, shared by workers;
+  capped at LLM_CACHE_DISK_MAX_MB (least recently used files go first, down
+  to 90%), and expired files are swept on write every LLM_CACHE_SWEEP_SECS
+- LLM_CACHE=off
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from typing import Any, Dict, Optional
+
+LLM_CACHE = os.getenv("LLM_CACHE", "memory").lower()
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "2048"))
+LLM_CACHE_DIR = os.getenv("LLM_CACHE_DIR", os.path.join("data", "llm_cache"))
+LLM_CACHE_DISK_MAX_MB = float(os.getenv("LLM_CACHE_DISK_MAX_MB", "256"))
+LLM_CACHE_SWEEP_SECS = float(os.getenv("LLM_CACHE_SWEEP_SECS", "600"))
+
+
+def _jsonable(obj: Any) -> Any:
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump(mode="json", exclude_none=True)
+    if isinstance(obj, bytes):
+        return hashlib.sha256(obj).hexdigest()
+    return repr(obj)
+
+
+def make_key(model: str, contents: Any, config: Any = None) -> str:
+    blob = json.dumps([model, contents, config], default=_jsonable, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class MemoryCache:
+    def __init__(self, max_items: int = LLM_CACHE_SIZE):
+        self.max_items = max(1, max_items)
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires < time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def put(self, key: str, value: str, ttl: float):
+        with self._lock:
+            self._data[key] = (time.time() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_items:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class DiskCache:
+    def __init__(self, root: str = LLM_CACHE_DIR, max_bytes: float = LLM_CACHE_DISK_MAX_MB * 1024 * 1024,
+                 sweep_secs: float = LLM_CACHE_SWEEP_SECS):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.sweep_secs = sweep_secs
+        os.makedirs(root, exist_ok=True)
+        self._lock = threading.Lock()
+        self._size: Optional[int] = None  # scanned lazily
+        self._next_sweep = 0.0            # the first put sweeps
+        self.evictions = 0
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], f"{key}.json")
+
+    def get(self, key: str) -> Optional[str]:
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                item = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if item.get("expires", 0) < time.time():
+            self._remove(path)
+            return None
+        try:
+            os.utime(path)  # mtime doubles as the LRU clock
+        except OSError:
+            pass
+        return item.get("value")
+
+    def put(self, key: str, value: str, ttl: float):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        old = os.path.getsize(path) if os.path.exists(path) else 0
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"expires": time.time() + ttl, "value": value}, f, ensure_ascii=False)
+        os.replace(tmp, path)
+        with self._lock:
+            if self._size is not None:
+                self._size += os.path.getsize(path) - old
+        self._maintain(keep=path)
+
+    def _remove(self, path: str, size: Optional[int] = None) -> bool:
+        try:
+            size = os.path.getsize(path) if size is None else size
+            os.remove(path)
+        except OSError:
+            return False
+        with self._lock:
+            if self._size is not None:
+                self._size -= size
+        return True
+
+    def _entries(self):
+        for dirpath, _, files in os.walk(self.root):
+            for name in files:
+                if name.endswith(".tmp"):
+                    continue
+                p = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(p)
+                except OSError:
+                    continue
+                yield p, st.st_size, st.st_mtime
+
+    @staticmethod
+    def _expired(path: str, now: float) -> bool:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f).get("expires", 0) < now
+        except (OSError, ValueError):
+            return False
+
+    def _maintain(self, keep: str = ""):
+        """Sweep expired files (every sweep_secs) and evict LRU files while over max_bytes."""
+        now = time.time()
+        with self._lock:
+            sweep = now >= self._next_sweep
+            if sweep:
+                self._next_sweep = now + self.sweep_secs
+            elif self._size is not None and (self.max_bytes <= 0 or self._size <= self.max_bytes):
+                return
+        entries = list(self._entries())
+        with self._lock:
+            self._size = sum(size for _, size, _ in entries)  # also picks up other workers' writes
+        if sweep:
+            live = []
+            for e in entries:
+                if e[0] != keep and self._expired(e[0], now) and self._remove(e[0], e[1]):
+                    continue
+                live.append(e)
+            entries = live
+        if self.max_bytes <= 0 or self._size <= self.max_bytes:
+            return
+        target = self.max_bytes * 0.9
+        for p, size, _ in sorted(entries, key=lambda e: e[2]):
+            if self._size <= target:
+                break
+            if p != keep and self._remove(p, size):
+                self.evictions += 1
+
+    def clear(self):
+        for sub in os.listdir(self.root):
+            d = os.path.join(self.root, sub)
+            if os.path.isdir(d):
+                for name in os.listdir(d):
+                    try:
+                        os.remove(os.path.join(d, name))
+                    except OSError:
+                        pass
+        with self._lock:
+            self._size = 0
+
+    def __len__(self):
+        return sum(len(files) for _, _, files in os.walk(self.root))
+
+
+def _make_backend():
+    if LLM_CACHE == "disk":
+        return DiskCache()
+    if LLM_CACHE in ("off", "none", "0", ""):
+        return None
+    return MemoryCache()
+
+
+backend = _make_backend()
+_stats: Dict[str, Dict[str, int]] = defaultdict(lambda: {"hits": 0, "misses": 0})
+_stats_lock = threading.Lock()
+
+
+def enabled() -> bool:
+    return backend is not None
+
+
+def get(key: str, site: str) -> Optional[str]:
+    value = backend.get(key) if backend is not None else None
+    with _stats_lock:
+        _stats[site]["hits" if value is not None else "misses"] += 1
+    return value
+
+
+def put(key: str, value: str, ttl: float):
+    if backend is not None and ttl > 0:
+        backend.put(key, value, ttl)
+
+
+def clear():
+    if backend is not None:
+        backend.clear()
+
+
+def cache_stats() -> Dict[str, Any]:
+    with _stats_lock:
+        sites = {}
+        for site, s in _stats.items():
+            total = s["hits"] + s["misses"]
+            sites[site] = {**s, "hit_rate": round(s["hits"] / total, 3) if total else 0.0}
+    return {
+        "backend": type(backend).__name__ if backend is not None else "off",
+        "entries": len(backend) if backend is not None else 0,
+        **({"bytes": backend._size, "evictions": backend.evictions} if isinstance(backend, DiskCache) else {}),
+        "sites": sites,
+    }
@@ -0,0 +1,402 @@
+"""
+Shared gateway for every Gemini call in the backend.
+
+- one client per process (its HTTP connection pool is reused); LLM_BACKEND
+  swaps google-genai for synthetic/record/replay backends (see llm_providers)
+- a process-wide cap on in-flight calls (LLM_MAX_CONCURRENCY), shared by
+  the sync and async entry points
+- per-model token-bucket rate limits (LLM_RATE_LIMITS="model=rpm,...",
+  LLM_DEFAULT_RPM for the rest; 0 = unlimited)
+- retries with full-jitter exponential backoff on 408/429/5xx and
+  transport errors (LLM_RETRIES, LLM_BACKOFF)
+- opt-in response memoization for deterministic calls (see llm_cache)
+- cached-content handles for large static system prompts (see context_cache),
+  with per-call prefix-cache savings from usage metadata
+"""
+import asyncio
+import os
+import random
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Any, Dict, List, Optional
+
+import httpx
+from dotenv import load_dotenv
+from google import genai
+from google.genai import errors as genai_errors
+from google.genai import types
+
+import llm_cache
+from context_cache import LOCAL_PREFIX, make_context_cache
+from llm_providers import LLM_BACKEND, make_client
+
+load_dotenv()
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_RETRIES = int(os.getenv("LLM_RETRIES", "3"))
+LLM_BACKOFF = float(os.getenv("LLM_BACKOFF", "0.8"))
+LLM_DEFAULT_RPM = float(os.getenv("LLM_DEFAULT_RPM", "0"))
+LLM_RATE_LIMITS = os.getenv("LLM_RATE_LIMITS", "")
+LLM_TIMEOUT_MS = int(os.getenv("LLM_TIMEOUT_MS", "120000"))
+
+_RETRY_CODES = {408, 429, 500, 502, 503, 504}
+# transport failures; anything else (missing API key, replay miss, a bug) fails on the first attempt
+_RETRY_ERRORS = (httpx.TransportError, ConnectionError, TimeoutError, genai_errors.ServerError)
+
+_client: Optional[genai.Client] = None
+_client_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(max(1, LLM_MAX_CONCURRENCY))
+_stats: Dict[str, int] = defaultdict(int)
+_stats_lock = threading.Lock()
+
+
+def _bump(key: str, n: int = 1):
+    with _stats_lock:
+        _stats[key] += n
+
+
+def _gemini_client() -> genai.Client:
+    api_key = os.getenv("API_KEY")
+    if not api_key:
+        raise RuntimeError("API_KEY not set (add it to .env or the environment)")
+    return genai.Client(api_key=api_key, http_options=types.HttpOptions(timeout=LLM_TIMEOUT_MS))
+
+
+def get_client():
+    """The process-wide client for LLM_BACKEND (google-genai, or an offline stand-in; see llm_providers)."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = make_client(LLM_BACKEND, _gemini_client)
+    return _client
+
+
+# ---------- rate limiting ----------
+
+class TokenBucket:
+    """Thread-safe token bucket; `reserve()` books a token and returns how long to wait for it."""
+
+    def __init__(self, rate_per_sec: float, burst: float):
+        self.rate = rate_per_sec
+        self.capacity = max(1.0, burst)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1.0
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+def _parse_limits(spec: str) -> Dict[str, float]:
+    out = {}
+    for item in spec.split(","):
+        if "=" in item:
+            name, rpm = item.split("=", 1)
+            try:
+                out[name.strip()] = float(rpm)
+            except ValueError:
+                pass
+    return out
+
+
+_rpm_by_model = _parse_limits(LLM_RATE_LIMITS)
+_buckets: Dict[str, Optional[TokenBucket]] = {}
+_buckets_lock = threading.Lock()
+
+
+def _bucket(model: str) -> Optional[TokenBucket]:
+    with _buckets_lock:
+        if model not in _buckets:
+            rpm = _rpm_by_model.get(model, LLM_DEFAULT_RPM)
+            _buckets[model] = TokenBucket(rpm / 60.0, burst=max(1.0, rpm / 60.0)) if rpm > 0 else None
+        return _buckets[model]
+
+
+# ---------- retries ----------
+
+def _retryable(e: Exception) -> bool:
+    code = getattr(e, "code", None) or getattr(e, "status_code", None)
+    if isinstance(code, int):
+        return code in _RETRY_CODES
+    return isinstance(e, _RETRY_ERRORS)
+
+
+def _backoff(attempt: int) -> float:
+    return random.uniform(0, LLM_BACKOFF * (2 ** (attempt - 1)))
+
+
+# ---------- prefix (context) caching ----------
+
+_context_cache = None
+_context_cache_lock = threading.Lock()
+_prefix_recent: deque = deque(maxlen=50)
+_STALE_HANDLE_CODES = {400, 403, 404}
+
+
+def context_cache():
+    global _context_cache
+    if _context_cache is None:
+        with _context_cache_lock:
+            if _context_cache is None:
+                _context_cache = make_context_cache(get_client) or False
+    return _context_cache or None
+
+
+def _with_prefix(model: str, config: Optional[Dict[str, Any]], system_instruction: Optional[str],
+                 cache_prefix: bool):
+    """Config carrying either a cached-content handle or the inline system instruction."""
+    cfg = dict(config or {})
+    handle = None
+    cc = context_cache() if (system_instruction and cache_prefix) else None
+    if cc:
+        handle = cc.handle(model, system_instruction)
+    if handle and not handle.startswith(LOCAL_PREFIX):
+        cfg["cached_content"] = handle
+    elif system_instruction:
+        # local stand-in handles resolve to the same text, so it is sent inline
+        cfg["system_instruction"] = system_instruction
+    return cfg, handle
+
+
+def _stale_handle(e: Exception) -> bool:
+    code = getattr(e, "code", None) or getattr(e, "status_code", None)
+    return code in _STALE_HANDLE_CODES
+
+
+def _record_prefix_usage(model: str, res: Any, handle: Optional[str], prefix: str):
+    usage = getattr(res, "usage_metadata", None)
+    prompt = getattr(usage, "prompt_token_count", None) or 0
+    cached = getattr(usage, "cached_content_token_count", None) or 0
+    # local handles are re-inlined, so nothing is saved; estimate what a provider cache would serve
+    simulated = (len(prefix) + 3) // 4 if handle and handle.startswith(LOCAL_PREFIX) else 0
+    _bump("prefix_calls")
+    _bump("prefix_hits" if handle else "prefix_misses")
+    _bump("prompt_tokens", prompt)
+    _bump("cached_tokens", cached)
+    _bump("simulated_cached_tokens", simulated)
+    with _stats_lock:
+        _prefix_recent.append({"model": model, "handle": handle, "prompt_tokens": prompt, "cached_tokens": cached,
+                               "simulated_cached_tokens": simulated})
+    if simulated:
+        print(f"[llm] {model}: ~{simulated}/{prompt or '?'} prompt tokens would come from a cached prefix "
+              f"(local stand-in, simulated)")
+    elif handle:
+        print(f"[llm] {model}: {cached}/{prompt or '?'} prompt tokens served from cached prefix")
+
+
+def prefix_cache_stats() -> Dict[str, Any]:
+    cc = context_cache()
+    with _stats_lock:
+        prompt, cached = _stats.get("prompt_tokens", 0), _stats.get("cached_tokens", 0)
+        return {
+            "backend": type(cc).__name__ if cc else "off",
+            "calls": _stats.get("prefix_calls", 0),
+            "hits": _stats.get("prefix_hits", 0),
+            "prompt_tokens": prompt,
+            "cached_tokens": cached,
+            "saved_ratio": round(cached / prompt, 3) if prompt else 0.0,
+            "simulated_cached_tokens": _stats.get("simulated_cached_tokens", 0),
+            "recent": list(_prefix_recent),
+            **(cc.info() if cc else {}),
+        }
+
+
+# ---------- sync entry points ----------
+
+def generate_content(model: str, contents: Any, config: Any = None, tries: Optional[int] = None):
+    """Rate-limited, concurrency-capped, retried `client.models.generate_content`."""
+    tries = max(1, tries or LLM_RETRIES)
+    bucket = _bucket(model)
+    for attempt in range(1, tries + 1):
+        if bucket:
+            wait = bucket.reserve()
+            if wait > 0:
+                _bump("rate_limited")
+                time.sleep(wait)
+        try:
+            with _slots:
+                _bump("calls")
+                return get_client().models.generate_content(model=model, contents=contents, config=config)
+        except Exception as e:
+            if attempt >= tries or not _retryable(e):
+                _bump("errors")
+                raise
+            _bump("retries")
+            time.sleep(_backoff(attempt))
+
+
+def generate_text(model: str, contents: Any, config: Any = None, cache_ttl: Optional[float] = None,
+                  cache_site: Optional[str] = None, **kw) -> str:
+    """
+    Text-only generate_content. Pass cache_ttl (seconds) to memoize deterministic
+    calls in llm_cache; calls without it always reach the model.
+    """
+    config = _text_config(config)
+    key = None
+    if cache_ttl and llm_cache.enabled():
+        key = llm_cache.make_key(model, contents, config)
+        hit = llm_cache.get(key, site=cache_site or model)
+        if hit is not None:
+            return hit
+    text = response_text(generate_content(model, contents, config=config, **kw))
+    if key and text:
+        llm_cache.put(key, text, cache_ttl)
+    return text
+
+
+def chat(model: str, history: List[Dict[str, Any]], message: str, system_instruction: Optional[str] = None,
+         config: Optional[Dict[str, Any]] = None, cache_prefix: bool = False, **kw) -> str:
+    """
+    One chat turn as a single stateless request: history + the new user message.
+    cache_prefix=True sends a static system_instruction as a cached-content handle.
+    """
+    contents = _chat_contents(history, message)
+    cfg, handle = _with_prefix(model, config, system_instruction, cache_prefix)
+    try:
+        res = generate_content(model, contents, config=_text_config(cfg), **kw)
+    except Exception as e:
+        if not handle or not _stale_handle(e):
+            raise
+        # handle expired/evicted provider-side: drop it and resend inline
+        context_cache().invalidate(model, system_instruction)
+        cfg, handle = _with_prefix(model, config, system_instruction, False)
+        res = generate_content(model, contents, config=_text_config(cfg), **kw)
+    if cache_prefix and system_instruction:
+        _record_prefix_usage(model, res, handle, system_instruction)
+    return response_text(res)
+
+
+
+def generate_content_stream(model: str, contents: Any, config: Any = None, tries: Optional[int] = None):
+    """
+    Streaming variant of `generate_content`; yields response chunks.
+    The concurrency slot is held until the stream is exhausted or closed.
+    Only failures before the first chunk are retried.
+    """
+    tries = max(1, tries or LLM_RETRIES)
+    bucket = _bucket(model)
+    for attempt in range(1, tries + 1):
+        if bucket:
+            wait = bucket.reserve()
+            if wait > 0:
+                _bump("rate_limited")
+                time.sleep(wait)
+        started = False
+        try:
+            with _slots:
+                _bump("calls")
+                _bump("streams")
+                for chunk in get_client().models.generate_content_stream(model=model, contents=contents, config=config):
+                    started = True
+                    yield chunk
+                return
+        except Exception as e:
+            if started or attempt >= tries or not _retryable(e):
+                _bump("errors")
+                raise
+            _bump("retries")
+            time.sleep(_backoff(attempt))
+
+
+def chat_stream(model: str, history: List[Dict[str, Any]], message: str, system_instruction: Optional[str] = None,
+                config: Optional[Dict[str, Any]] = None, cache_prefix: bool = False, **kw):
+    """Like `chat`, but yields text deltas as they arrive."""
+    contents = _chat_contents(history, message)
+    cfg, handle = _with_prefix(model, config, system_instruction, cache_prefix)
+    last, started = None, False
+    try:
+        for chunk in generate_content_stream(model, contents, config=_text_config(cfg), **kw):
+            started, last = True, chunk
+            text = response_text(chunk)
+            if text:
+                yield text
+    except Exception as e:
+        if started or not handle or not _stale_handle(e):
+            raise
+        context_cache().invalidate(model, system_instruction)
+        cfg, handle = _with_prefix(model, config, system_instruction, False)
+        for chunk in generate_content_stream(model, contents, config=_text_config(cfg), **kw):
+            last = chunk
+            text = response_text(chunk)
+            if text:
+                yield text
+    if cache_prefix and system_instruction and last is not None:
+        # usage metadata rides on the final chunk
+        _record_prefix_usage(model, last, handle, system_instruction)
+
+# ---------- async entry points ----------
+
+async def _acquire_slot():
+    if _slots.acquire(blocking=False):
+        return
+    fut = asyncio.get_running_loop().run_in_executor(None, _slots.acquire)
+    try:
+        await asyncio.shield(fut)
+    except asyncio.CancelledError:
+        # the slot is still granted later; hand it straight back
+        fut.add_done_callback(lambda f: _slots.release())
+        raise
+
+
+async def agenerate_content(model: str, contents: Any, config: Any = None, tries: Optional[int] = None):
+    tries = max(1, tries or LLM_RETRIES)
+    bucket = _bucket(model)
+    for attempt in range(1, tries + 1):
+        if bucket:
+            wait = bucket.reserve()
+            if wait > 0:
+                _bump("rate_limited")
+                await asyncio.sleep(wait)
+        try:
+            await _acquire_slot()
+            try:
+                _bump("calls")
+                return await get_client().aio.models.generate_content(model=model, contents=contents, config=config)
+            finally:
+                _slots.release()
+        except Exception as e:
+            if attempt >= tries or not _retryable(e):
+                _bump("errors")
+                raise
+            _bump("retries")
+            await asyncio.sleep(_backoff(attempt))
+
+
+async def agenerate_text(model: str, contents: Any, config: Any = None, **kw) -> str:
+    return response_text(await agenerate_content(model, contents, config=_text_config(config), **kw))
+
+
+# ---------- helpers ----------
+
+def _text_config(config: Any) -> Any:
+    if config is None:
+        return types.GenerateContentConfig(response_modalities=["TEXT"])
+    if isinstance(config, dict):
+        return {"response_modalities": ["TEXT"], **config}
+    return config
+
+
+def _chat_contents(history: List[Dict[str, Any]], message: str) -> List[Dict[str, Any]]:
+    return list(history) + [{"role": "user", "parts": [types.Part(text=message)]}]
+
+
+def response_text(res: Any) -> str:
+    if res is None or not getattr(res, "candidates", None):
+        return ""
+    try:
+        return res.text or ""
+    except Exception:
+        parts = res.candidates[0].content.parts or []
+        return parts[0].text if parts and getattr(parts[0], "text", None) else ""
+
+
+def gateway_stats() -> Dict[str, int]:
+    with _stats_lock:
+        return dict(_stats)
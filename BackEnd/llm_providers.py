@@ -0,0 +1,447 @@
+"""
+LLM backends behind llm_gateway.get_client().
+
+Every backend exposes the slice of the google-genai Client the gateway uses:
+`models.generate_content`, `models.generate_content_stream`,
+`aio.models.generate_content` and `caches.create`, returning real
+`types.GenerateContentResponse` objects. Pipeline code can't tell them apart.
+
+LLM_BACKEND:
+- gemini (default): google-genai against the live API (needs API_KEY)
+- synthetic: deterministic offline responses shaped like each call site expects
+  (TaskSpec JSON, lesson JSON, Mermaid, image prompts, slide plans, PNGs),
+  with latency drawn from LLM_SYNTH_LATENCY
+- record: live Gemini, appending every response to LLM_REPLAY_FILE
+- replay: serve responses from LLM_REPLAY_FILE by request key; misses go to
+  the synthetic backend (or raise with LLM_REPLAY_MISS=error)
+
+Record/replay keys use the resolved prefix text instead of volatile
+`cached_content` handle names, so a prefix sent as a handle while recording
+matches the same prefix sent as a (different) handle or inline on replay.
+`python check_replay.py` runs a record → replay round trip offline.
+"""
+import asyncio
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import struct
+import threading
+import time
+import zlib
+from collections import defaultdict
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional
+
+from google.genai import types
+
+import llm_cache
+
+LLM_BACKEND = os.getenv("LLM_BACKEND", "gemini").lower()
+LLM_REPLAY_FILE = os.getenv("LLM_REPLAY_FILE", os.path.join("data", "llm_replay.jsonl"))
+LLM_REPLAY_MISS = os.getenv("LLM_REPLAY_MISS", "synthetic").lower()
+# "lognormal:<median_ms>,<sigma>" | "uniform:<min_ms>,<max_ms>" | "fixed:<ms>"
+LLM_SYNTH_LATENCY = os.getenv("LLM_SYNTH_LATENCY", "lognormal:800,0.5")
+LLM_SYNTH_IMAGE_LATENCY = os.getenv("LLM_SYNTH_IMAGE_LATENCY", "lognormal:4000,0.4")
+LLM_SYNTH_LESSON_CHARS = int(os.getenv("LLM_SYNTH_LESSON_CHARS", "12000"))
+LLM_SYNTH_SEED = int(os.getenv("LLM_SYNTH_SEED", "0"))
+
+
+# ---------- request helpers ----------
+
+def _cfg_get(config: Any, name: str) -> Any:
+    if config is None:
+        return None
+    if isinstance(config, dict):
+        return config.get(name)
+    return getattr(config, name, None)
+
+
+def _part_texts(obj: Any) -> List[str]:
+    if obj is None:
+        return []
+    if isinstance(obj, str):
+        return [obj]
+    if isinstance(obj, (list, tuple)):
+        return [t for o in obj for t in _part_texts(o)]
+    if isinstance(obj, dict):
+        return _part_texts(obj.get("parts")) + ([obj["text"]] if isinstance(obj.get("text"), str) else [])
+    text = getattr(obj, "text", None)
+    parts = getattr(obj, "parts", None)
+    return ([text] if isinstance(text, str) else []) + _part_texts(parts)
+
+
+def prompt_text(contents: Any, config: Any = None) -> str:
+    system = "\n".join(_part_texts(_cfg_get(config, "system_instruction")))
+    return (system + "\n" + "\n".join(_part_texts(contents))).strip()
+
+
+def _sample_ms(spec: str, rng: random.Random) -> float:
+    kind, _, args = spec.partition(":")
+    vals = [float(v) for v in args.split(",") if v.strip()] or [0.0]
+    if kind == "fixed":
+        return vals[0]
+    if kind == "uniform":
+        return rng.uniform(vals[0], vals[-1])
+    median, sigma = vals[0], (vals[1] if len(vals) > 1 else 0.5)
+    return median * math.exp(rng.gauss(0.0, sigma))
+
+
+def _response(parts: List[types.Part], prompt_tokens: int, cached_tokens: int = 0) -> types.GenerateContentResponse:
+    out_tokens = sum(len(p.text or "") for p in parts) // 4
+    return types.GenerateContentResponse(
+        candidates=[types.Candidate(content=types.Content(role="model", parts=parts),
+                                    finish_reason=types.FinishReason.STOP)],
+        usage_metadata=types.GenerateContentResponseUsageMetadata(
+            prompt_token_count=prompt_tokens,
+            cached_content_token_count=cached_tokens or None,
+            candidates_token_count=out_tokens,
+            total_token_count=prompt_tokens + out_tokens,
+        ),
+    )
+
+
+def _png(width: int, height: int, rgb: tuple) -> bytes:
+    """Tiny solid-colour PNG (no imaging dependency)."""
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF)
+    row = b"\x00" + bytes(rgb) * width
+    raw = zlib.compress(row * height, 9)
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", raw) + chunk(b"IEND", b"")
+
+
+# ---------- synthetic backend ----------
+
+_WORDS = ("node", "edge", "queue", "stack", "state", "step", "input", "output", "rule", "case",
+          "example", "pattern", "model", "value", "order", "level", "path", "set", "map", "cost")
+_SECTIONS = ("Introduction & Motivation", "What Is {t}?", "Core Terminology", "Types / Taxonomy",
+             "Representations", "Worked Examples", "Bridge to a Related Concept", "Guided Tutorial",
+             "Practice Problems", "Assignments", "Glossary", "Common Pitfalls", "Summary", "Further Reading")
+
+
+class SyntheticModels:
+    def __init__(self, sleep: Callable[[float], None] = time.sleep):
+        self.sleep = sleep
+
+    def _rng(self, model: str, prompt: str) -> random.Random:
+        seed = hashlib.sha256(f"{LLM_SYNTH_SEED}|{model}|{prompt}".encode("utf-8")).hexdigest()
+        return random.Random(int(seed[:16], 16))
+
+    @staticmethod
+    def _topic(prompt: str) -> str:
+        m = re.search(r'"topic"\s*:\s*"([^"]+)"', prompt) or re.search(r"Topic:\s*(.+)", prompt)
+        if m:
+            return m.group(1).strip()
+        m = re.search(r"User message: ```([\s\S]*?)```", prompt)
+        words = re.findall(r"[A-Za-z][A-Za-z\-]+", m.group(1) if m else prompt)
+        return " ".join(words[-4:]) if words else "the topic"
+
+    def _sentence(self, rng: random.Random, topic: str) -> str:
+        words = [rng.choice(_WORDS) for _ in range(rng.randint(8, 16))]
+        words.insert(rng.randrange(len(words)), topic)
+        return " ".join(words).capitalize() + "."
+
+    def _markdown(self, rng: random.Random, topic: str, n_chars: int) -> str:
+        out, size = [], 0
+        while size < n_chars:
+            para = " ".join(self._sentence(rng, topic) for _ in range(rng.randint(2, 5)))
+            if rng.random() < 0.3:
+                para = "\n".join(f"- **{rng.choice(_WORDS)}**: {self._sentence(rng, topic)}" for _ in range(3))
+            out.append(para)
+            size += len(para)
+        return "\n\n".join(out)
+
+    def _mermaid(self, rng: random.Random, topic: str) -> str:
+        label = re.sub(r"[^A-Za-z0-9 ]", "", topic)[:30] or "Topic"
+        n = rng.randint(3, 6)
+        lines = ["flowchart TD", f"A[{label}]"]
+        for i in range(1, n):
+            lines.append(f"{chr(65 + i - 1)} --> {chr(65 + i)}[{rng.choice(_WORDS).title()} {i}]")
+        return "\n".join(lines)
+
+    def _image_prompt(self, rng: random.Random, topic: str) -> str:
+        return (f"clean 2D vector schematic of {topic}: {rng.choice(_WORDS)} and {rng.choice(_WORDS)} "
+                "with labeled arrows, white background, thin black outlines")
+
+    def _task_spec(self, rng: random.Random, prompt: str) -> Dict[str, Any]:
+        topic = self._topic(prompt)
+        return {
+            "topic": topic, "audience": "general", "language": "en", "difficulty": "intro",
+            "outputs": ["text", "diagram", "image"],
+            "keywords": [topic] + rng.sample(_WORDS, 3), "image_ideas": [self._image_prompt(rng, topic)],
+            "text_depth": "very_detailed", "min_diagrams": 2, "min_images": 2,
+        }
+
+    def _lesson(self, rng: random.Random, topic: str) -> Dict[str, Any]:
+        per = max(200, LLM_SYNTH_LESSON_CHARS // len(_SECTIONS))
+        segs = []
+        for i, sec in enumerate(_SECTIONS):
+            seg = {"section": sec.format(t=topic), "kind": "content",
+                   "text": f"## {sec.format(t=topic)}\n\n" + self._markdown(rng, topic, per), "text_format": "md"}
+            if i in (1, 4):
+                seg.update(kind="diagram", mermaid=self._mermaid(rng, topic), alt_text=f"Diagram of {topic}")
+            elif i in (3, 5):
+                seg.update(kind="image", image_prompt=self._image_prompt(rng, topic), alt_text=f"Schematic of {topic}")
+            segs.append(seg)
+        return {"title": f"Understanding {topic}", "segments": segs, "narration": self._markdown(rng, topic, 400)}
+
+    def _slide_plan(self, rng: random.Random, topic: str) -> Dict[str, Any]:
+        n = rng.randint(4, 6)
+        slides = [{"index": i + 1, "title": f"{topic}: part {i + 1}",
+                   "narration_text": " ".join(self._sentence(rng, topic) for _ in range(3)),
+                   "image_description": self._image_prompt(rng, topic)} for i in range(n)]
+        return {"slides": slides, "meta": {"topic": topic, "target_audience": "general",
+                                           "tone": "friendly", "slide_count": n}}
+
+    def _answer(self, model: str, contents: Any, config: Any):
+        """(parts, latency_ms) for a request, chosen by what the call site asks for."""
+        prompt = prompt_text(contents, config)
+        rng = self._rng(model, prompt)
+        topic = self._topic(prompt)
+        modalities = [str(m).upper() for m in (_cfg_get(config, "response_modalities") or [])]
+        schema = json.dumps(_cfg_get(config, "response_schema") or {}, default=str)
+        low = prompt.lower()
+
+        if any("IMAGE" in m for m in modalities):
+            png = _png(64, 64, tuple(rng.randrange(256) for _ in range(3)))
+            parts = [types.Part(text=f"Schematic for {topic}"),
+                     types.Part(inline_data=types.Blob(mime_type="image/png", data=png))]
+            return parts, _sample_ms(LLM_SYNTH_IMAGE_LATENCY, rng)
+
+        if '"slides"' in schema or "slides[]" in prompt:
+            text = json.dumps(self._slide_plan(rng, topic))
+        elif '"diagrams"' in schema:
+            n = re.search(r"exactly (\d+) items in 'diagrams' and (\d+)", prompt)
+            nd, ni = (int(n.group(1)), int(n.group(2))) if n else (2, 2)
+            text = json.dumps({"diagrams": [self._mermaid(rng, topic) for _ in range(nd)],
+                               "image_prompts": [self._image_prompt(rng, topic) for _ in range(ni)]})
+        elif "normalize casual user requests" in low:
+            text = json.dumps(self._task_spec(rng, prompt))
+        elif "taskspec json" in low:
+            text = json.dumps(self._lesson(rng, topic), ensure_ascii=False)
+        elif "running summary" in low:
+            text = " ".join(self._sentence(rng, topic) for _ in range(4))
+        elif "mermaid" in low:
+            text = self._mermaid(rng, topic)
+        elif "schematic prompt" in low or "image prompt" in low:
+            text = self._image_prompt(rng, topic)
+        else:
+            text = self._markdown(rng, topic, 800)
+        ms = _sample_ms(LLM_SYNTH_LATENCY, rng) * (1 + len(text) / 20000)
+        return [types.Part(text=text)], ms
+
+    def _usage(self, contents: Any, config: Any):
+        prompt_tokens = len(prompt_text(contents, config)) // 4
+        return prompt_tokens, (prompt_tokens // 2 if _cfg_get(config, "cached_content") else 0)
+
+    def generate_content(self, model: str, contents: Any, config: Any = None, **kw):
+        parts, ms = self._answer(model, contents, config)
+        self.sleep(ms / 1000.0)
+        return _response(parts, *self._usage(contents, config))
+
+    def generate_content_stream(self, model: str, contents: Any, config: Any = None, **kw):
+        parts, ms = self._answer(model, contents, config)
+        text = "".join(p.text or "" for p in parts)
+        pieces = [text[i:i + 400] for i in range(0, len(text), 400)] or [""]
+        # roughly a quarter of the latency before the first token, the rest spread over the stream
+        self.sleep(ms * 0.25 / 1000.0)
+        prompt_tokens, cached = self._usage(contents, config)
+        for i, piece in enumerate(pieces):
+            if i:
+                self.sleep(ms * 0.75 / len(pieces) / 1000.0)
+            last = i == len(pieces) - 1
+            yield _response([types.Part(text=piece)], prompt_tokens if last else 0, cached if last else 0)
+
+
+class _AsyncModels:
+    def __init__(self, models):
+        self._models = models
+
+    async def generate_content(self, model: str, contents: Any, config: Any = None, **kw):
+        parts, ms = self._models._answer(model, contents, config)
+        await asyncio.sleep(ms / 1000.0)
+        return _response(parts, *self._models._usage(contents, config))
+
+
+class _Caches:
+    def __init__(self):
+        self._n = 0
+        self._lock = threading.Lock()
+
+    def create(self, model: str, config: Any = None, **kw):
+        with self._lock:
+            self._n += 1
+            return SimpleNamespace(name=f"cachedContents/synthetic-{self._n}")
+
+
+class SyntheticClient:
+    def __init__(self):
+        self.models = SyntheticModels()
+        self.aio = SimpleNamespace(models=_AsyncModels(self.models))
+        self.caches = _Caches()
+
+
+# ---------- record / replay ----------
+
+def _dump(res: Any) -> Dict[str, Any]:
+    return res.model_dump(mode="json", exclude_none=True)
+
+
+class _PrefixCaches:
+    """Wraps `caches.create` and remembers each handle's system instruction."""
+
+    def __init__(self, inner):
+        self._inner = inner
+        self.prefixes: Dict[str, Any] = {}
+
+    def create(self, model: str, config: Any = None, **kw):
+        res = self._inner.create(model=model, config=config, **kw)
+        self.prefixes[res.name] = _cfg_get(config, "system_instruction")
+        return res
+
+
+def _request_key(model: str, contents: Any, config: Any, prefixes: Dict[str, Any]) -> str:
+    """llm_cache key with any cached_content handle replaced by the prefix it stands for."""
+    handle = _cfg_get(config, "cached_content")
+    if handle:
+        cfg = config.model_dump(mode="json", exclude_none=True) if hasattr(config, "model_dump") else dict(config)
+        cfg.pop("cached_content", None)
+        if handle in prefixes:
+            cfg["system_instruction"] = prefixes[handle]
+        config = types.GenerateContentConfig(**cfg)
+    return llm_cache.make_key(model, contents, config)
+
+
+class _RecordingModels:
+    def __init__(self, inner, writer: Callable[[str, str, Any], None], key: Callable[..., str]):
+        self._inner = inner
+        self._write = writer
+        self._key = key
+
+    def generate_content(self, model: str, contents: Any, config: Any = None, **kw):
+        res = self._inner.generate_content(model=model, contents=contents, config=config)
+        self._write(self._key(model, contents, config), model, _dump(res))
+        return res
+
+    def generate_content_stream(self, model: str, contents: Any, config: Any = None, **kw):
+        chunks = []
+        for chunk in self._inner.generate_content_stream(model=model, contents=contents, config=config):
+            chunks.append(_dump(chunk))
+            yield chunk
+        self._write(self._key(model, contents, config), model, {"stream": chunks})
+
+
+class _AsyncRecordingModels:
+    def __init__(self, inner, writer, key):
+        self._inner = inner
+        self._write = writer
+        self._key = key
+
+    async def generate_content(self, model: str, contents: Any, config: Any = None, **kw):
+        res = await self._inner.generate_content(model=model, contents=contents, config=config)
+        self._write(self._key(model, contents, config), model, _dump(res))
+        return res
+
+
+class RecordingClient:
+    """Wraps a live client and appends {key, model, response} lines to `path`."""
+
+    def __init__(self, inner, path: str = LLM_REPLAY_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.caches = _PrefixCaches(inner.caches)
+        self.models = _RecordingModels(inner.models, self._write, self.key)
+        self.aio = SimpleNamespace(models=_AsyncRecordingModels(inner.aio.models, self._write, self.key))
+
+    def key(self, model: str, contents: Any, config: Any) -> str:
+        return _request_key(model, contents, config, self.caches.prefixes)
+
+    def _write(self, key: str, model: str, response: Any):
+        line = json.dumps({"key": key, "model": model, "response": response}, ensure_ascii=False)
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+class _ReplayModels:
+    def __init__(self, client: "ReplayClient"):
+        self._c = client
+
+    def generate_content(self, model: str, contents: Any, config: Any = None, **kw):
+        rec = self._c.take(model, contents, config)
+        if rec is None:
+            return self._c.miss().models.generate_content(model, contents, config)
+        if "stream" in rec:
+            # recorded as a stream: join the chunks' text into one response
+            text = "".join(p.get("text", "") for ch in rec["stream"]
+                           for cand in ch.get("candidates", [])[:1]
+                           for p in cand.get("content", {}).get("parts", []))
+            return _response([types.Part(text=text)], 0)
+        return types.GenerateContentResponse.model_validate(rec)
+
+    def generate_content_stream(self, model: str, contents: Any, config: Any = None, **kw):
+        rec = self._c.take(model, contents, config)
+        if rec is None:
+            yield from self._c.miss().models.generate_content_stream(model, contents, config)
+            return
+        for chunk in rec.get("stream", [rec]):
+            yield types.GenerateContentResponse.model_validate(chunk)
+
+
+class _AsyncReplayModels:
+    def __init__(self, models: _ReplayModels):
+        self._m = models
+
+    async def generate_content(self, model: str, contents: Any, config: Any = None, **kw):
+        return self._m.generate_content(model, contents, config)
+
+
+class ReplayClient:
+    """Serves recorded responses by request key; repeated keys cycle through their recordings."""
+
+    def __init__(self, path: str = LLM_REPLAY_FILE):
+        self.records: Dict[str, List[Any]] = defaultdict(list)
+        self._next: Dict[str, int] = defaultdict(int)
+        self._lock = threading.Lock()
+        self._synthetic = None
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        rec = json.loads(line)
+                        self.records[rec["key"]].append(rec["response"])
+        print(f"[llm] replaying {sum(len(v) for v in self.records.values())} responses from {path}")
+        self.models = _ReplayModels(self)
+        self.aio = SimpleNamespace(models=_AsyncReplayModels(self.models))
+        self.caches = _PrefixCaches(_Caches())
+
+    def take(self, model: str, contents: Any, config: Any) -> Optional[Any]:
+        key = _request_key(model, contents, config, self.caches.prefixes)
+        with self._lock:
+            recs = self.records.get(key)
+            if not recs:
+                return None
+            i = self._next[key]
+            self._next[key] = i + 1
+            return recs[i % len(recs)]
+
+    def miss(self):
+        if LLM_REPLAY_MISS == "error":
+            raise LookupError("no recorded response for this request (LLM_REPLAY_MISS=error)")
+        if self._synthetic is None:
+            self._synthetic = SyntheticClient()
+        return self._synthetic
+
+
+def make_client(backend: str, live: Callable[[], Any]):
+    """Client for LLM_BACKEND; `live` builds the real google-genai client."""
+    if backend == "synthetic":
+        return SyntheticClient()
+    if backend == "replay":
+        return ReplayClient()
+    if backend == "record":
+        return RecordingClient(live())
+    return live()
@@ -1,13 +1,18 @@
 from gemini_api import (
     generate_image, generate_text, chat_with_model, 
-    get_evidence_pack, normalize_task, generate_lesson, sanitize_lesson,
-    gen_mermaid_snippet, gen_image_prompt, repair_mermaid
+    get_evidence_pack, normalize_task, generate_lesson, stream_lesson, sanitize_lesson, personalize_intro,
+    gen_mermaid_snippet, gen_image_prompt, repair_mermaid, gen_assets_batch
     )
-from auth import get_current_user, create_access_token
+from auth import get_current_user, create_access_token, require_admin
 from utils import generate_audio
+from llm_gateway import gateway_stats, prefix_cache_stats
+import llm_cache
+from lesson_cache import lesson_cache, LESSON_CACHE
+from singleflight import SingleFlight
+from history import compact_history
 
 from fastapi import FastAPI, Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse, FileResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi import FastAPI, Depends, HTTPException, status
 from fastapi.staticfiles import StaticFiles
@@ -24,15 +29,19 @@ from db_setup.schemas import (
     LessonWithAssets, EnrichedLessonSegment
 )
 
-from retrieval.hybrid_search import hybrid_search
+from retrieval.hybrid_search import hybrid_search, uncovered_queries, merge_results
+from retrieval.bundles import bundles, available_versions
 from retrieval.summarize import summarize_to_notes
 
 from media.pipeline import render_assets_for_lesson
-from media.mermaid import render_mermaid
+from media.render_pool import render_pool
+from media.cas import diagram_store, image_store
+from media.mermaid import render_stored
 
 from datetime import datetime
 from uuid import uuid4
-import os, asyncio
+from concurrent.futures import ThreadPoolExecutor
+import os, asyncio, json, hashlib, re
 
 from gen_video import createVideo
 
@@ -58,6 +67,43 @@ app.mount("/artifacts", StaticFiles(directory="artifacts"), name="artifacts")
 os.makedirs("local_data", exist_ok=True)
 local_path = 'local_data'
 
+# Hot-swap retrieval indexes when ingest publishes a new bundle (0 = admin endpoint only)
+INDEX_BUNDLE_WATCH_SECS = float(os.getenv("INDEX_BUNDLE_WATCH_SECS", "0"))
+
+@app.on_event("startup")
+async def start_bundle_watch():
+    bundles.watch(INDEX_BUNDLE_WATCH_SECS)
+
+# Lesson pipelines (Gemini calls, retrieval, mmdc, image threads) are blocking;
+# they run on their own bounded pool so the event loop keeps serving other requests.
+LESSON_CONCURRENCY = int(os.getenv("LESSON_CONCURRENCY", "4"))
+lesson_executor = ThreadPoolExecutor(max_workers=LESSON_CONCURRENCY, thread_name_prefix="lesson")
+
+# Retrieval on the raw chat starts while normalize_task is still waiting on Gemini
+SPECULATIVE_RETRIEVAL = os.getenv("SPECULATIVE_RETRIEVAL", "1") != "0"
+retrieval_executor = ThreadPoolExecutor(max_workers=LESSON_CONCURRENCY, thread_name_prefix="retrieval")
+
+# Lessons served from the semantic cache get their opening section rewritten for the new request
+LESSON_CACHE_PERSONALIZE = os.getenv("LESSON_CACHE_PERSONALIZE", "0") == "1"
+
+async def run_lesson_job(fn, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(lesson_executor, fn, *args)
+
+# Identical concurrent lesson requests share one pipeline run:
+# by normalized chat + history at the endpoint, by TaskSpec + history inside the pipeline
+request_flight = SingleFlight("request_flight")
+task_flight = SingleFlight("task_flight")
+
+def _history_key(messages: list) -> str:
+    h = hashlib.sha256()
+    for m in messages:
+        h.update(f"{m.sender}\x00{m.content}\x01".encode("utf-8"))
+    return h.hexdigest()
+
+def _request_key(prompt: str, messages: list) -> tuple:
+    return (" ".join((prompt or "").lower().split()), _history_key(messages))
+
 """
 API endpoint to process data
 """
@@ -153,21 +199,21 @@ async def generate_text_from_prompt(request: Request):
     data = await request.json()
     prompt = data.get('prompt')
 
-    return JSONResponse(content={"success": True, "message": generate_text(prompt)})
+    return JSONResponse(content={"success": True, "message": await asyncio.to_thread(generate_text, prompt)})
 
 @app.post("/gemini/gen_image", status_code=status.HTTP_200_OK)
 async def generate_image_from_prompt(request: Request):
     data = await request.json()
     prompt = data.get('prompt')
 
-    return JSONResponse(content={"success": True, **generate_image(prompt)})
+    return JSONResponse(content={"success": True, **(await asyncio.to_thread(generate_image, prompt))})
 
 @app.post("/gemini/gen_audio", status_code=status.HTTP_200_OK)
 async def generate_audio_from_prompt(request: Request):
     data = await request.json()
     prompt = data.get('prompt')
 
-    return JSONResponse(content={"success": True, "audio": generate_audio(prompt)})
+    return JSONResponse(content={"success": True, "audio": await asyncio.to_thread(generate_audio, prompt)})
 
 @app.post("/chat/new", status_code=status.HTTP_201_CREATED)
 async def create_chat_session(current_user_id: int = Depends(get_current_user), db: Session = Depends(get_db)):
@@ -200,9 +246,12 @@ async def send_message(session_id: str, request: Request, current_user_id: int =
         .order_by(models.Message.created_at)
         .all()
     )
+    # recent turns verbatim, older ones folded into a stored rolling summary (may call the LLM)
+    messages = await asyncio.to_thread(compact_history, session_id, messages)
 
     # if is_image_render:
-    output = api_full_lesson_rendered(prompt, messages)
+    output = await request_flight.ado(_request_key(prompt, messages), api_full_lesson_rendered, prompt, messages,
+                                      executor=lesson_executor)
     
     # else:
     #     output = api_full_lesson(prompt, messages)
@@ -210,6 +259,11 @@ async def send_message(session_id: str, request: Request, current_user_id: int =
     # refined_prompt = get_evidence_pack(prompt) 
     # output = chat_with_model(refined_prompt, messages)  # Assuming generate_text is used for chat
 
+    _save_exchange(db, session_id, prompt, output)
+    return output
+
+def _save_exchange(db: Session, session_id: str, prompt: str, output: LessonWithAssets) -> int:
+    """Persist the user prompt + model reply and pickle the rendered lesson; returns the reply id."""
     user_msg = models.Message(
         session_id=session_id,
         sender="user",
@@ -227,8 +281,75 @@ async def send_message(session_id: str, request: Request, current_user_id: int =
 
     with open(f'{local_path}\\{session_id}_{bot_msg.id}.pkl', 'wb') as file:
         pickle.dump(output, file)
+    return bot_msg.id
 
-    return output
+def _save_exchange_own_session(session_id: str, prompt: str, output: LessonWithAssets) -> int:
+    # the request-scoped session may already be closed once streaming starts
+    db = next(get_db())
+    try:
+        return _save_exchange(db, session_id, prompt, output)
+    finally:
+        db.close()
+
+# Streaming lesson jobs outlive their response when the client disconnects; hold them until done
+_stream_jobs: set = set()
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.post("/chat/{session_id}/message/stream")
+async def send_message_stream(session_id: str, request: Request, current_user_id: int = Depends(get_current_user), db: Session = Depends(get_db)):
+    """Server-sent events: `segment` per lesson segment, `asset` per rendered asset, then `done` (or `error`)."""
+    data = await request.json()
+    prompt = data.get('prompt')
+
+    chat_session = db.query(models.Chat_Session).filter(models.Chat_Session.session_id == session_id).first()
+    if not chat_session:
+        raise HTTPException(status_code=404, detail="Chat session not found")
+    if chat_session.user_id != current_user_id:
+        raise HTTPException(status_code=403, detail="Not authorized to access this chat session")
+
+    messages = (
+        db.query(models.Message)
+        .filter(models.Message.session_id == session_id)
+        .order_by(models.Message.created_at)
+        .all()
+    )
+    # recent turns verbatim, older ones folded into a stored rolling summary (may call the LLM)
+    messages = await asyncio.to_thread(compact_history, session_id, messages)
+
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+
+    def emit(event, payload):
+        loop.call_soon_threadsafe(queue.put_nowait, (event, payload))
+
+    async def job():
+        output = await run_lesson_job(api_full_lesson_streamed, prompt, messages, emit)
+        # saved by the job, not by events(): a client that disconnects mid-stream still gets the lesson
+        message_id = await asyncio.to_thread(_save_exchange_own_session, session_id, prompt, output)
+        return output, message_id
+
+    job_task = asyncio.ensure_future(job())
+    _stream_jobs.add(job_task)
+    job_task.add_done_callback(_stream_jobs.discard)
+    job_task.add_done_callback(lambda _: loop.call_soon_threadsafe(queue.put_nowait, None))
+
+    async def events():
+        while True:
+            item = await queue.get()
+            if item is None:
+                break
+            yield _sse(*item)
+        try:
+            output, message_id = job_task.result()
+        except Exception as e:
+            yield _sse("error", {"detail": str(e)})
+            return
+        yield _sse("done", {"message_id": message_id, "lesson": output.model_dump()})
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 @app.get("/chat/{session_id}/messages", status_code=status.HTTP_200_OK)
 async def get_chat_messages(session_id: str, current_user_id: int = Depends(get_current_user), db: Session = Depends(get_db)):
@@ -356,6 +477,64 @@ def api_generate(req: GenerateRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# Admin: index bundles
+@app.get("/admin/index", dependencies=[Depends(require_admin)])
+def api_index_status():
+    cur = bundles.current()
+    return {"current": cur.info() if cur else None, "available": available_versions()}
+
+
+@app.post("/admin/index/swap", dependencies=[Depends(require_admin)])
+def api_index_swap(version: str):
+    if version not in available_versions():
+        raise HTTPException(status_code=404, detail=f"Index bundle {version} not found")
+    try:
+        return {"current": bundles.activate(version)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/admin/llm", dependencies=[Depends(require_admin)])
+def api_llm_stats():
+    return {"gateway": gateway_stats(), "cache": llm_cache.cache_stats(), "prefix_cache": prefix_cache_stats()}
+
+@app.delete("/admin/llm/cache", dependencies=[Depends(require_admin)])
+def api_llm_cache_clear():
+    llm_cache.clear()
+    return {"cache": llm_cache.cache_stats()}
+
+@app.get("/admin/singleflight", dependencies=[Depends(require_admin)])
+def api_singleflight_stats():
+    return {"request": request_flight.stats(), "task": task_flight.stats()}
+
+@app.get("/admin/lesson-cache", dependencies=[Depends(require_admin)])
+def api_lesson_cache():
+    return lesson_cache.info()
+
+@app.delete("/admin/lesson-cache", dependencies=[Depends(require_admin)])
+def api_lesson_cache_invalidate(entry_id: str | None = None, topic: str | None = None):
+    """No query params → drop everything; ?entry_id= or ?topic= (substring) → drop matches."""
+    return {"removed": lesson_cache.invalidate(entry_id=entry_id, topic=topic)}
+
+@app.get("/diagrams/{key}.{fmt}")
+def api_diagram(key: str, fmt: str):
+    """A lesson diagram by diagram_key, rendered on first request and then served from the store."""
+    if fmt not in ("png", "svg") or not re.fullmatch(r"[0-9a-f]{64}", key):
+        raise HTTPException(status_code=404, detail="Diagram not found")
+    path = render_stored(key, fmt)
+    if not path:
+        raise HTTPException(status_code=404, detail="Diagram not found or could not be rendered")
+    return FileResponse(path, media_type="image/svg+xml" if fmt == "svg" else "image/png",
+                        headers={"Cache-Control": "public, max-age=31536000, immutable"})
+
+@app.get("/admin/media", dependencies=[Depends(require_admin)])
+def api_media_stats():
+    return {
+        "render_pool": render_pool.info(),
+        "diagram_store": diagram_store.info() if diagram_store else None,
+        "image_store": image_store.info() if image_store else None,
+    }
+
+
 def _top_up_assets_with_llm(lesson: dict, task: TaskSpec, notes: list, model: str | None = None):
     # sanitize first so booleans become None and don’t break counters
     lesson = sanitize_lesson(lesson)
@@ -366,36 +545,119 @@ def _top_up_assets_with_llm(lesson: dict, task: TaskSpec, notes: list, model: st
 
     target_merm = max(0, int(getattr(task, "min_diagrams", 2)))
     target_img  = max(0, int(getattr(task, "min_images", 2)))
+    need_merm = max(0, target_merm - count_merm)
+    need_img  = max(0, target_img - count_img)
+
+    if need_merm or need_img:
+        spec = task.model_dump()
+        added = []
+        # one structured call for everything missing ...
+        got = gen_assets_batch(spec, notes, need_merm, need_img, model=model)
+        mermaids, prompts = got["mermaid"], got["image_prompts"]
+        # ... and any shortfall concurrently (the LLM gateway caps in-flight calls)
+        short_merm = need_merm - len(mermaids)
+        short_img = need_img - len(prompts)
+        if short_merm > 0 or short_img > 0:
+            with ThreadPoolExecutor(max_workers=max(1, short_merm + short_img)) as ex:
+                # identical prompts: only the first may come from the response cache
+                fm = [ex.submit(gen_mermaid_snippet, spec, notes, model=model, cache=k == 0) for k in range(short_merm)]
+                fi = [ex.submit(gen_image_prompt, spec, notes, model=model, cache=k == 0) for k in range(short_img)]
+                mermaids += [f.result() for f in fm]
+                prompts += [f.result() for f in fi]
+
+        for m in mermaids:
+            added.append({
+                "section": "Auto-added Diagram",
+                "kind": "diagram",
+                "text": "Diagram for the current topic.",
+                "text_format": "md",
+                "mermaid": m,
+                "image_prompt": None,
+                "alt_text": "Diagram explaining a key concept of the topic."
+            })
+        for ip in prompts:
+            added.append({
+                "section": "Auto-added Image",
+                "kind": "image",
+                "text": "Illustrative image to support understanding.",
+                "text_format": "md",
+                "mermaid": None,
+                "image_prompt": ip,
+                "alt_text": "Schematic image for the topic."
+            })
+        # only the new segments need cleaning; the draft was sanitized above
+        segs += sanitize_lesson({"segments": added})["segments"]
 
-    while count_merm < target_merm:
-        m = gen_mermaid_snippet(task.model_dump(), notes, model=model)
-        segs.append({
-            "section": "Auto-added Diagram",
-            "kind": "diagram",
-            "text": "Diagram for the current topic.",
-            "text_format": "md",
-            "mermaid": m,
-            "image_prompt": None,
-            "alt_text": "Diagram explaining a key concept of the topic."
-        })
-        count_merm += 1
-
-    while count_img < target_img:
-        ip = gen_image_prompt(task.model_dump(), notes, model=model)
-        segs.append({
-            "section": "Auto-added Image",
-            "kind": "image",
-            "text": "Illustrative image to support understanding.",
-            "text_format": "md",
-            "mermaid": None,
-            "image_prompt": ip,
-            "alt_text": "Schematic image for the topic."
-        })
-        count_img += 1
-
-    # sanitize again (just in case)
     lesson["segments"] = segs
-    return sanitize_lesson(lesson)
+    return lesson
+
+
+def _search_notes(queries: list):
+    return hybrid_search(queries=queries, k_final=10, k_mmr=20, lambda_mmr=0.6)
+
+
+def _start_retrieval(chat: str):
+    """Speculative retrieval on the raw chat (None when SPECULATIVE_RETRIEVAL is off)."""
+    return retrieval_executor.submit(_search_notes, [chat]) if SPECULATIVE_RETRIEVAL else None
+
+def _normalize(chat: str) -> TaskSpec:
+    ts = normalize_task(chat, defaults={"language": "en"})
+    return TaskSpec(**ts)
+
+def _retrieve_for_task(chat: str, task: TaskSpec, spec=None) -> list:
+    queries = [task.topic] if task.topic else []
+    queries.extend(task.keywords[:5])
+    if not queries:
+        queries = [chat]
+    if spec is None:
+        return _search_notes(queries)
+
+    try:
+        chunks = spec.result()
+    except Exception as e:
+        print(f"[retrieval] speculative search failed: {e}")
+        chunks = []
+    missing = uncovered_queries(queries, chunks)
+    if missing:
+        chunks = merge_results(chunks, _search_notes(missing), k=10)
+    return chunks
+
+def _normalize_and_retrieve(chat: str):
+    """
+    chat → (TaskSpec, chunks). With SPECULATIVE_RETRIEVAL, retrieval on the raw
+    chat overlaps the normalize round trip; afterwards only TaskSpec queries not
+    already covered by those chunks are searched, and the two lists are merged.
+    """
+    spec = _start_retrieval(chat)
+    task = _normalize(chat)
+    return task, _retrieve_for_task(chat, task, spec)
+
+def _cached_lesson(task: TaskSpec, chat: str, messages: list):
+    """
+    Semantic lesson cache lookup. Only first turns are served from (and stored in)
+    the cache; follow-ups depend on the session history.
+    """
+    if not LESSON_CACHE or messages:
+        return None
+    try:
+        hit = lesson_cache.lookup(task)
+    except Exception as e:
+        print(f"[lesson_cache] lookup failed: {e}")
+        return None
+    if hit is not None and LESSON_CACHE_PERSONALIZE:
+        for seg in hit.segments:
+            if seg.kind == "content" and seg.text.strip():
+                seg.text = personalize_intro(seg.text, chat)
+                break
+    return hit
+
+def _remember_lesson(task: TaskSpec, messages: list, lesson: LessonWithAssets):
+    if not LESSON_CACHE or messages:
+        return
+    try:
+        lesson_cache.store(task, lesson)
+    except Exception as e:
+        print(f"[lesson_cache] store failed: {e}")
 
 
 # @app.post("/lesson", response_model=LessonDraft)
@@ -405,16 +667,8 @@ def api_full_lesson(chat: str, messages: list):
     Guarantees: ≥min_diagrams Mermaid + ≥min_images image prompts.
     """
     try:
-        # 1) normalize (Gemini #1)
-        ts = normalize_task(chat, defaults={"language": "en"})
-        task = TaskSpec(**ts)
-
-        # 2) helpful notes
-        queries = [task.topic] if task.topic else []
-        queries.extend(task.keywords[:5])
-        if not queries:
-            queries = [chat]
-        chunks = hybrid_search(queries=queries, k_final=10, k_mmr=20, lambda_mmr=0.6)
+        # 1) normalize (Gemini #1) + 2) helpful notes
+        task, chunks = _normalize_and_retrieve(chat)
         notes = summarize_to_notes(chunks, max_bullets=12, max_chars_per_bullet=220)
 
         # 3) lesson (Gemini #2)
@@ -437,49 +691,66 @@ def api_full_lesson_rendered(chat: str, messages: list):
     Repairs broken Mermaid once if needed.
     """
     # try:
-        # 1) normalize
-    ts = normalize_task(chat, defaults={"language": "en"})
-    task = TaskSpec(**ts)
-
+    # 1) normalize (retrieval overlaps it), then the semantic lesson cache
+    spec = _start_retrieval(chat)
+    task = _normalize(chat)
+    cached = _cached_lesson(task, chat, messages)
+    if cached is not None:
+        if spec is not None:
+            spec.cancel()
+        return cached
+
+    # different chats that normalize to the same TaskSpec share steps 2–6
+    key = (task.model_dump_json(), _history_key(messages))
+    return task_flight.do(key, _build_lesson, chat, task, spec, messages)
+
+def _build_lesson(chat: str, task: TaskSpec, spec, messages: list) -> LessonWithAssets:
     # 2) helpful notes
-    queries = [task.topic] if task.topic else []
-    queries.extend(task.keywords[:5])
-    if not queries:
-        queries = [chat]
-    chunks = hybrid_search(queries=queries, k_final=10, k_mmr=20, lambda_mmr=0.6)
+    chunks = _retrieve_for_task(chat, task, spec)
     notes = summarize_to_notes(chunks, max_bullets=12, max_chars_per_bullet=220)
 
     # 3) lesson draft
     lesson = generate_lesson(messages, task_spec=task.model_dump(), helpful_notes=notes)
     lesson = _top_up_assets_with_llm(lesson, task, notes)
 
-    # 4) render assets
-    run_id = str(uuid4())[:8]
-    out_root = os.path.join("artifacts", run_id)
-    enriched = render_assets_for_lesson(lesson, out_root=out_root, image_concurrency=5)
-
-    # 5) repair failed diagrams once
-    for i, seg in enumerate(enriched.get("segments", [])):
-        if isinstance(seg.get("mermaid"), str) and seg["mermaid"].strip():
-            if not seg.get("diagram_path"):
-                fixed = repair_mermaid(seg["mermaid"], error_log=None, topic=lesson.get("title"))
-                if fixed and fixed.strip() != seg["mermaid"].strip():
-                    seg["mermaid"] = fixed
-                    ddir = os.path.join(out_root, "diagrams"); os.makedirs(ddir, exist_ok=True)
-                    dpath = os.path.join(ddir, f"diagram_{i}.png")
-                    ok = render_mermaid(fixed, dpath)
-                    seg["diagram_path"] = dpath if ok else ""
-
-    # 6) add public URLs
+    out = _render_lesson(lesson)
+    _remember_lesson(task, messages, out)
+    return out
+
+    # except Exception as e:
+    #     raise HTTPException(status_code=500, detail=str(e))
+
+def _public_url(path: str) -> str:
     # base = str(base_url).rstrip("/")
     base = "http://localhost:8000"
+    rel = path.replace('\\', '/')
+    return f"{base}/{rel}"
+
+def _render_lesson(lesson: dict, on_asset=None) -> LessonWithAssets:
+    """Steps 4–5 of the rendered pipeline; on_asset(i, "diagram_url"|"image_url", url) fires per asset."""
+    emit = None
+    if on_asset:
+        emit = lambda i, kind, path: on_asset(i, f"{kind}_url", _public_url(path))
+
+    # 4) render assets: diagrams (each with its repair → re-render chain) and images in parallel
+    run_id = str(uuid4())[:8]
+    out_root = os.path.join("artifacts", run_id)
+    repair = lambda code, errors=None: repair_mermaid(code, error_log=errors, topic=lesson.get("title"))
+    enriched = render_assets_for_lesson(lesson, out_root=out_root, image_concurrency=5, on_asset=emit, repair=repair)
+
+    # 5) add public URLs
     for seg in enriched.get("segments", []):
         p = seg.get("diagram_path")
         if p:
-            seg["diagram_url"] = f"{base}/{p.replace('\\', '/')}"
+            seg["diagram_url"] = _public_url(p)
+        elif seg.get("diagram_key"):
+            seg["diagram_url"] = _public_url(f"diagrams/{seg['diagram_key']}.png")  # rendered on first request
         ip = seg.get("image_path")
         if ip:
-            seg["image_url"] = f"{base}/{ip.replace('\\', '/')}"
+            seg["image_url"] = _public_url(ip)
+        if seg.get("image_variants"):
+            seg["image_variants"] = [{**{k: v for k, v in var.items() if k != "path"}, "url": _public_url(var["path"])}
+                                     for var in seg["image_variants"]]
 
     segs_out = [EnrichedLessonSegment(**seg) for seg in enriched.get("segments", [])]
     return LessonWithAssets(
@@ -489,8 +760,42 @@ def api_full_lesson_rendered(chat: str, messages: list):
         artifacts_root=out_root
     )
 
-    # except Exception as e:
-    #     raise HTTPException(status_code=500, detail=str(e))
+def api_full_lesson_streamed(chat: str, messages: list, emit) -> LessonWithAssets:
+    """
+    api_full_lesson_rendered with progress: emit("segment", ...) for each lesson
+    segment as soon as the model finishes it, then emit("asset", ...) per rendered asset.
+    """
+    spec = _start_retrieval(chat)
+    task = _normalize(chat)
+    cached = _cached_lesson(task, chat, messages)
+    if cached is not None:
+        if spec is not None:
+            spec.cancel()
+        for i, seg in enumerate(cached.segments):
+            emit("segment", {"index": i, "segment": seg.model_dump(exclude={"diagram_path", "image_path", "diagram_url", "image_url", "image_width", "image_height", "image_variants"})})
+        for i, seg in enumerate(cached.segments):
+            for field in ("diagram_url", "image_url"):
+                if getattr(seg, field):
+                    emit("asset", {"index": i, field: getattr(seg, field)})
+        return cached
+
+    chunks = _retrieve_for_task(chat, task, spec)
+    notes = summarize_to_notes(chunks, max_bullets=12, max_chars_per_bullet=220)
+
+    sent = 0
+    def on_segment(seg):
+        nonlocal sent
+        emit("segment", {"index": sent, "segment": seg})
+        sent += 1
+
+    lesson = stream_lesson(messages, task_spec=task.model_dump(), helpful_notes=notes, on_segment=on_segment)
+    lesson = _top_up_assets_with_llm(lesson, task, notes)
+    for seg in lesson["segments"][sent:]:
+        on_segment(seg)
+
+    out = _render_lesson(lesson, on_asset=lambda i, field, url: emit("asset", {"index": i, field: url}))
+    _remember_lesson(task, messages, out)
+    return out
 
 def create_video_job(prompt, session_id, path):
     db = next(get_db())
@@ -509,6 +814,12 @@ def create_video_job(prompt, session_id, path):
     finally:
         db.close()
 
+@app.on_event("shutdown")
+def stop_lesson_executor():
+    lesson_executor.shutdown(wait=False, cancel_futures=True)
+    retrieval_executor.shutdown(wait=False, cancel_futures=True)
+    render_pool.shutdown()
+
 if __name__ == "__main__":
     # Run the code
     uvicorn.run('main:app', reload=True, host="0.0.0.0", port=8000)
\ No newline at end of file
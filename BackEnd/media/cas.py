@@ -0,0 +1,191 @@
+"""
+Content-addressed store for rendered diagrams and generated images.
+
+Files live at DIAGRAM_STORE_DIR/<key[:2]>/<key>.<ext>, where key is
+sha256 of the normalized source plus render options. A hit is hard-linked
+into the lesson's run directory (copied when linking isn't possible), so a
+repeated diagram costs no render and no extra disk.
+
+- DIAGRAM_STORE=1 (default) / 0
+- DIAGRAM_STORE_DIR, default artifacts/cas (served under /artifacts/cas)
+- DIAGRAM_STORE_MAX_MB: when exceeded, least recently used entries are
+  removed down to 90%. Run directories keep their own links, so eviction
+  never breaks a lesson that was already rendered. Diagram sources (.mmd,
+  kept for client-mode lessons and lazy renders) are never evicted and don't
+  count toward the cap: they are the only copy behind an immutable
+  /diagrams/{key} URL, and tiny (reported as pinned_bytes).
+- IMAGE_STORE / IMAGE_STORE_DIR (artifacts/cas_images) / IMAGE_STORE_MAX_MB:
+  the same for generated images, keyed by (model, enriched prompt)
+"""
+import hashlib
+import os
+import shutil
+import threading
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+DIAGRAM_STORE = os.getenv("DIAGRAM_STORE", "1") not in ("0", "off", "false", "")
+DIAGRAM_STORE_DIR = os.getenv("DIAGRAM_STORE_DIR", os.path.join("artifacts", "cas"))
+DIAGRAM_STORE_MAX_MB = float(os.getenv("DIAGRAM_STORE_MAX_MB", "512"))
+IMAGE_STORE = os.getenv("IMAGE_STORE", "1") not in ("0", "off", "false", "")
+IMAGE_STORE_DIR = os.getenv("IMAGE_STORE_DIR", os.path.join("artifacts", "cas_images"))
+IMAGE_STORE_MAX_MB = float(os.getenv("IMAGE_STORE_MAX_MB", "2048"))
+
+
+def normalize_mermaid(code: str) -> str:
+    """Drop what doesn't change the picture: CRLF, blank lines, `%%` comments, edge whitespace."""
+    lines = []
+    for ln in (code or "").replace("\r\n", "\n").replace("\r", "\n").split("\n"):
+        s = ln.strip()
+        if s and not (s.startswith("%%") and not s.startswith("%%{")):
+            lines.append(s)
+    return "\n".join(lines)
+
+
+def diagram_key(code: str, theme: str, background: str, fmt: str) -> str:
+    blob = "\x00".join([normalize_mermaid(code), theme or "", background or "", fmt or ""])
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+def image_key(model: str, prompt: str) -> str:
+    return hashlib.sha256(f"{model}\x00{prompt.strip()}".encode("utf-8")).hexdigest()
+
+
+class ContentStore:
+    def __init__(self, root: str = DIAGRAM_STORE_DIR, max_bytes: float = DIAGRAM_STORE_MAX_MB * 1024 * 1024,
+                 pinned: tuple = ()):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.pinned = tuple(f".{ext}" for ext in pinned)  # extensions eviction skips
+        self._lock = threading.Lock()
+        self._key_locks: Dict[str, list] = {}  # key -> [lock, holders + waiters]; dropped at zero
+        self._size: Optional[int] = None  # evictable bytes, scanned lazily
+        self._pinned_size = 0              # bytes in pinned files, outside the cap
+        self.stats = {"hits": 0, "misses": 0, "puts": 0, "evictions": 0}
+
+    def path(self, key: str, ext: str) -> str:
+        return os.path.join(self.root, key[:2], f"{key}.{ext}")
+
+    @contextmanager
+    def key_lock(self, key: str):
+        """Per-key lock so concurrent requests for one diagram render it once."""
+        with self._lock:
+            entry = self._key_locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._key_locks[key]
+
+    def get(self, key: str, ext: str) -> Optional[str]:
+        path = self.path(key, ext)
+        try:
+            os.utime(path)  # mtime doubles as the LRU clock
+        except OSError:
+            with self._lock:
+                self.stats["misses"] += 1
+            return None
+        with self._lock:
+            self.stats["hits"] += 1
+        return path
+
+    def put(self, key: str, data: bytes, ext: str) -> str:
+        path = self.path(key, ext)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        old = os.path.getsize(path) if os.path.exists(path) else 0
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        with self._lock:
+            self.stats["puts"] += 1
+            if self._size is not None:
+                if self._is_pinned(path):
+                    self._pinned_size += len(data) - old
+                else:
+                    self._size += len(data) - old
+        self._maybe_evict(keep=path)
+        return path
+
+    def put_file(self, key: str, src: str, ext: str) -> str:
+        with open(src, "rb") as f:
+            return self.put(key, f.read(), ext)
+
+    def link(self, key: str, ext: str, dest: str) -> Optional[str]:
+        """Materialize a stored entry at `dest`; None on a miss."""
+        src = self.get(key, ext)
+        return self.materialize(src, dest) if src else None
+
+    @staticmethod
+    def materialize(src: str, dest: str) -> str:
+        os.makedirs(os.path.dirname(dest) or ".", exist_ok=True)
+        tmp = f"{dest}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.link(src, tmp)
+        except OSError:
+            shutil.copyfile(src, tmp)  # other filesystem, or no hard-link support
+        os.replace(tmp, dest)
+        return dest
+
+    def _entries(self):
+        for dirpath, _, files in os.walk(self.root):
+            for name in files:
+                if name.endswith(".tmp"):
+                    continue
+                p = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(p)
+                except OSError:
+                    continue
+                yield p, st.st_size, st.st_mtime
+
+    def _is_pinned(self, path: str) -> bool:
+        return bool(self.pinned) and path.endswith(self.pinned)
+
+    def _scan(self):
+        """Recount evictable and pinned bytes (caller holds self._lock)."""
+        self._size = self._pinned_size = 0
+        for p, size, _ in self._entries():
+            if self._is_pinned(p):
+                self._pinned_size += size
+            else:
+                self._size += size
+
+    def _maybe_evict(self, keep: str = ""):
+        with self._lock:
+            if self._size is None:
+                self._scan()
+            if self.max_bytes <= 0 or self._size <= self.max_bytes:
+                return
+            target = self.max_bytes * 0.9
+            for p, size, _ in sorted(self._entries(), key=lambda e: e[2]):
+                if self._size <= target:
+                    break
+                if p == keep or self._is_pinned(p):
+                    continue
+                try:
+                    os.remove(p)
+                except OSError:
+                    continue
+                self._size -= size
+                self.stats["evictions"] += 1
+
+    def info(self) -> dict:
+        with self._lock:
+            if self._size is None:
+                self._scan()
+            return {"root": self.root, "bytes": self._size, "pinned_bytes": self._pinned_size,
+                    "max_bytes": int(self.max_bytes), **self.stats}
+
+    def clear(self):
+        with self._lock:
+            shutil.rmtree(self.root, ignore_errors=True)
+            self._size = self._pinned_size = 0
+
+
+diagram_store = ContentStore(pinned=("mmd",)) if DIAGRAM_STORE else None
+image_store = ContentStore(IMAGE_STORE_DIR, IMAGE_STORE_MAX_MB * 1024 * 1024) if IMAGE_STORE else None
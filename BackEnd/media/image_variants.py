@@ -0,0 +1,100 @@
+"""
+Post-processing for generated images: compressed WebP (optionally AVIF)
+variants and responsive thumbnails, with metadata stripped.
+
+For img_{i}.png this writes next to it:
+- img_{i}.webp                  full size
+- img_{i}.w{W}.webp             for each width in IMAGE_VARIANT_WIDTHS smaller than the original
+- img_{i}.avif                  when IMAGE_AVIF=1 and Pillow has AVIF support
+
+Encodes are content-addressed in the image store (hash of source bytes +
+variant spec), so a repeated image costs no re-encode. Work runs on a
+shared pool of IMAGE_VARIANT_WORKERS threads (Pillow releases the GIL
+while encoding). Needs Pillow; without it, make_variants returns None and
+lessons keep the original PNGs only.
+"""
+import hashlib
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from .cas import image_store
+
+try:
+    from PIL import Image, features
+except ImportError:  # optional dependency
+    Image = None
+
+IMAGE_VARIANTS = os.getenv("IMAGE_VARIANTS", "1") not in ("0", "off", "false", "")
+IMAGE_VARIANT_WIDTHS = [int(w) for w in os.getenv("IMAGE_VARIANT_WIDTHS", "320,640").split(",") if w.strip()]
+IMAGE_WEBP_QUALITY = int(os.getenv("IMAGE_WEBP_QUALITY", "80"))
+IMAGE_AVIF = os.getenv("IMAGE_AVIF", "0") not in ("0", "off", "false", "")
+IMAGE_AVIF_QUALITY = int(os.getenv("IMAGE_AVIF_QUALITY", "60"))
+IMAGE_VARIANT_WORKERS = int(os.getenv("IMAGE_VARIANT_WORKERS", "2"))
+
+variant_executor = ThreadPoolExecutor(max_workers=max(1, IMAGE_VARIANT_WORKERS), thread_name_prefix="img-variant")
+
+
+def enabled() -> bool:
+    return IMAGE_VARIANTS and Image is not None
+
+
+def _encode(im, fmt: str, width: Optional[int]) -> bytes:
+    if width and width < im.width:
+        im = im.resize((width, round(im.height * width / im.width)), Image.LANCZOS)
+    # a fresh image carries no EXIF/ICC/text chunks from the model output
+    clean = Image.frombytes(im.mode, im.size, im.tobytes())
+    buf = io.BytesIO()
+    if fmt == "avif":
+        clean.save(buf, "AVIF", quality=IMAGE_AVIF_QUALITY)
+    else:
+        clean.save(buf, "WEBP", quality=IMAGE_WEBP_QUALITY, method=4)
+    return buf.getvalue()
+
+
+def _specs(width: int) -> List[tuple]:
+    specs = [("webp", None)] + [("webp", w) for w in sorted(set(IMAGE_VARIANT_WIDTHS)) if 0 < w < width]
+    if IMAGE_AVIF and features.check("avif"):
+        specs.append(("avif", None))
+    return specs
+
+
+def make_variants(path: str) -> Optional[Dict[str, Any]]:
+    """
+    {"width", "height", "variants": [{"path", "format", "width", "height"}, ...]}
+    for the image at `path`, or None if Pillow is missing or the file can't be read.
+    """
+    if not enabled():
+        return None
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+        with Image.open(io.BytesIO(data)) as src:
+            im = src.convert("RGBA" if "A" in src.getbands() or src.mode == "P" else "RGB")
+    except Exception as e:
+        print(f"[image_variants] {path}: {e}")
+        return None
+
+    digest = hashlib.sha256(data).hexdigest()
+    stem = os.path.splitext(path)[0]
+    variants = []
+    for fmt, width in _specs(im.width):
+        out = f"{stem}.w{width}.{fmt}" if width else f"{stem}.{fmt}"
+        w = width or im.width
+        h = round(im.height * w / im.width)
+        try:
+            if image_store is None:
+                with open(out, "wb") as f:
+                    f.write(_encode(im, fmt, width))
+            else:
+                spec = f"{fmt}:{w}:{IMAGE_AVIF_QUALITY if fmt == 'avif' else IMAGE_WEBP_QUALITY}"
+                key = hashlib.sha256(f"{digest}\x00{spec}".encode("utf-8")).hexdigest()
+                with image_store.key_lock(key):
+                    stored = image_store.get(key, fmt) or image_store.put(key, _encode(im, fmt, width), fmt)
+                    image_store.materialize(stored, out)
+        except Exception as e:
+            print(f"[image_variants] {out}: {e}")
+            continue
+        variants.append({"path": out, "format": fmt, "width": w, "height": h})
+    return {"width": im.width, "height": im.height, "variants": variants}
@@ -1,16 +1,12 @@
-import os, sys, time
+import os, sys
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from typing import List, Dict, Tuple, Optional
-from google import genai
+from typing import Callable, List, Dict, Tuple, Optional
 from google.genai import types
 
-DEFAULT_IMG_MODEL = os.getenv("GEMINI_IMG_MODEL", "gemini-2.0-flash-preview-image-generation")
+import llm_gateway
+from .cas import image_store, image_key
 
-def _client():
-    api_key = os.getenv("API_KEY")
-    if not api_key:
-        raise RuntimeError("API_KEY not set")
-    return genai.Client(api_key=api_key)
+DEFAULT_IMG_MODEL = os.getenv("GEMINI_IMG_MODEL", "gemini-2.0-flash-preview-image-generation")
 
 def _pick_inline_image(parts) -> Optional[bytes]:
     for p in parts or []:
@@ -20,54 +16,78 @@ def _pick_inline_image(parts) -> Optional[bytes]:
             return data
     return None
 
-def _gen_one_image(prompt: str, model_name: Optional[str] = None, tries: int = 2, backoff: float = 0.8) -> bytes:
-    client = _client()
+def _gen_one_image(prompt: str, model_name: Optional[str] = None, tries: int = 2) -> bytes:
     model = model_name or DEFAULT_IMG_MODEL
 
-    last_err = None
-    for attempt in range(1, tries + 1):
-        try:
-            res = client.models.generate_content(
-                model=model,
-                contents=prompt,
-                # many Gemini variants need TEXT+IMAGE to actually return the image bytes
-                config=types.GenerateContentConfig(response_modalities=["TEXT", "IMAGE"])
-            )
-            parts = res.candidates[0].content.parts if res.candidates else []
-            data = _pick_inline_image(parts)
-            if data:
-                return data
-            last_err = RuntimeError("No image data in response")
-        except Exception as e:
-            last_err = e
-
-        if attempt < tries:
-            time.sleep(backoff * attempt)
+    # transport/quota errors are retried (with backoff) by the gateway;
+    # here we only re-ask when the model answered without an image
+    for _ in range(tries):
+        res = llm_gateway.generate_content(
+            model=model,
+            contents=prompt,
+            # many Gemini variants need TEXT+IMAGE to actually return the image bytes
+            config=types.GenerateContentConfig(response_modalities=["TEXT", "IMAGE"])
+        )
+        parts = res.candidates[0].content.parts if res.candidates else []
+        data = _pick_inline_image(parts)
+        if data:
+            return data
 
-    raise last_err or RuntimeError("image generation failed")
+    raise RuntimeError("No image data in response")
 
 def gen_images(
     prompts: List[Tuple[int, str]],
     out_dir: str,
     concurrency: int = 5,
-    model_name: Optional[str] = None
+    model_name: Optional[str] = None,
+    on_saved: Optional[Callable[[int, str], None]] = None
 ) -> Dict[int, str]:
+    """
+    Generate img_{idx}.png for each (idx, prompt). Identical prompts in one call
+    are generated once; prompts already in the image store are linked, not generated.
+    """
     os.makedirs(out_dir, exist_ok=True)
     saved: Dict[int, str] = {}
     concurrency = max(1, min(concurrency, 32))
+    model = model_name or DEFAULT_IMG_MODEL
+
+    # dedupe: one generation per distinct (model, prompt)
+    groups: Dict[str, Tuple[str, List[int]]] = {}
+    for idx, prompt in prompts:
+        groups.setdefault(image_key(model, prompt), (prompt, []))[1].append(idx)
+
+    def _path(idx: int) -> str:
+        return os.path.join(out_dir, f"img_{idx}.png")
+
+    def _one(key: str, prompt: str, idxs: List[int]) -> List[int]:
+        if image_store is None:
+            img_bytes = _gen_one_image(prompt, model)
+            for idx in idxs:
+                with open(_path(idx), "wb") as f:
+                    f.write(img_bytes)
+            return idxs
+        # the lock also makes concurrent lessons with the same prompt share one generation
+        with image_store.key_lock(key):
+            src = image_store.get(key, "png")
+            if src is None:
+                src = image_store.put(key, _gen_one_image(prompt, model), "png")
+            for idx in idxs:
+                image_store.materialize(src, _path(idx))
+        return idxs
 
-    from concurrent.futures import ThreadPoolExecutor, as_completed
     with ThreadPoolExecutor(max_workers=concurrency) as ex:
-        futures = {ex.submit(_gen_one_image, prompt, model_name): idx for (idx, prompt) in prompts}
+        futures = {ex.submit(_one, key, prompt, idxs): idxs for key, (prompt, idxs) in groups.items()}
         for fut in as_completed(futures):
-            idx = futures[fut]
+            idxs = futures[fut]
             try:
-                img_bytes = fut.result()
-                path = os.path.join(out_dir, f"img_{idx}.png")
-                with open(path, "wb") as f:
-                    f.write(img_bytes)
-                saved[idx] = path
+                fut.result()
             except Exception as e:
-                print(f"[image_gen] idx={idx} failed: {e}", file=sys.stderr)
-                saved[idx] = ""
+                print(f"[image_gen] idx={idxs} failed: {e}", file=sys.stderr)
+                for idx in idxs:
+                    saved[idx] = ""
+                continue
+            for idx in idxs:
+                saved[idx] = _path(idx)
+                if on_saved:
+                    on_saved(idx, saved[idx])
     return saved
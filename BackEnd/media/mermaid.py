@@ -3,6 +3,9 @@ import subprocess
 import tempfile
 from typing import Optional
 
+from .cas import diagram_store, diagram_key
+from .render_pool import render_pool, MermaidSyntaxError
+
 # Resolve Mermaid CLI path:
 # - use MERMAID_BIN if provided (Windows users often set mmdc.cmd)
 # - otherwise try "mmdc" (must be on PATH)
@@ -15,17 +18,80 @@ def _resolve_mermaid_bin() -> str:
 
 def render_mermaid(mermaid_code: str, out_png_path: str, background: str = "transparent") -> bool:
     """
-    Render a Mermaid diagram to PNG using the Mermaid CLI (mmdc).
+    Render a Mermaid diagram to PNG (or SVG when out_png_path ends in .svg), on the
+    warm worker pool when available, otherwise with the Mermaid CLI (mmdc).
+    Diagrams already in the content-addressed store are hard-linked instead of rendered.
     Returns True on success, False on failure. Does not raise.
     """
     try:
         os.makedirs(os.path.dirname(out_png_path), exist_ok=True)
+        bg = background or os.getenv("MERMAID_BG", "#ffe45e")  # light yellow
+        fmt = "svg" if out_png_path.lower().endswith(".svg") else "png"
+        if diagram_store is None:
+            return _render(mermaid_code, out_png_path, bg, fmt)
+        key = diagram_key(mermaid_code, "neutral", bg, fmt)
+        with diagram_store.key_lock(key):
+            if diagram_store.link(key, fmt, out_png_path):
+                return True
+            ok = _render(mermaid_code, out_png_path, bg, fmt)
+            if ok:
+                stored = diagram_store.put_file(key, out_png_path, fmt)
+                diagram_store.materialize(stored, out_png_path)
+            return ok
+    except Exception as e:
+        print(f"[mermaid] exception: {e}")
+        return False
+
+
+def store_source(mermaid_code: str) -> Optional[str]:
+    """
+    Keep a (validated) diagram's source for lazy rendering; returns its key for
+    GET /diagrams/{key}.{png|svg}, or None when the store is off.
+    """
+    if diagram_store is None:
+        return None
+    key = diagram_key(mermaid_code, "neutral", "transparent", "mmd")
+    if diagram_store.get(key, "mmd") is None:
+        diagram_store.put(key, mermaid_code.encode("utf-8"), "mmd")
+    return key
+
+
+def render_stored(key: str, fmt: str) -> Optional[str]:
+    """Path of the rendered diagram for a key from store_source, rendering it on first request."""
+    if diagram_store is None:
+        return None
+    src = diagram_store.get(key, "mmd")
+    if src is None:
+        return None
+    with open(src, "r", encoding="utf-8") as f:
+        code = f.read()
+    out_key = diagram_key(code, "neutral", "transparent", fmt)
+    path = diagram_store.get(out_key, fmt)
+    if path:
+        return path
+    with tempfile.TemporaryDirectory(prefix="mermaid_lazy_") as tmp:
+        if not render_mermaid(code, os.path.join(tmp, f"diagram.{fmt}")):
+            return None
+    return diagram_store.get(out_key, fmt)
+
+
+def _render(mermaid_code: str, out_png_path: str, bg: str, fmt: str = "png") -> bool:
+    try:
+        try:
+            png = render_pool.render(mermaid_code, fmt=fmt, theme="neutral", background=bg)
+        except MermaidSyntaxError as e:
+            print(f"[mermaid] invalid diagram: {e}")
+            return False
+        if png:
+            with open(out_png_path, "wb") as f:
+                f.write(png)
+            return True
+
         # write a temp .mmd file
         with tempfile.NamedTemporaryFile("w", suffix=".mmd", delete=False, encoding="utf-8") as tf:
             tf.write(mermaid_code)
             tmp_in = tf.name
 
-        bg = background or os.getenv("MERMAID_BG", "#ffe45e")  # light yellow
         cmd = [
             _resolve_mermaid_bin(),
             "-i", tmp_in,
@@ -0,0 +1,383 @@
+"""
+Fast local check for the Mermaid flowchart/graph subset our prompts produce.
+
+validate_mermaid(code) parses every statement, applies safe fixes and reports
+what it could not fix:
+- labels with brackets, quotes or pipes are quoted: A[Size (4 bits)] → A["Size (4 bits)"]
+- such edge text moves into a quoted pipe: A -- IP (x) --> B → A -->|"IP (x)"| B
+- unclosed or mismatched node brackets are closed; stray `end`s are dropped
+  and missing ones appended
+- arrows are normalized: -> and → become -->, => becomes ==>
+- a missing header becomes `flowchart TD`; an unknown direction becomes TD
+- trailing `%% comments` are ignored, as Mermaid's lexer does
+
+Other diagram types (sequenceDiagram, classDiagram, ...) pass through
+unchecked. Diagrams that still have errors skip the renderer and go straight
+to repair. MERMAID_VALIDATE=0 turns the check off.
+"""
+import os
+import re
+from typing import List, NamedTuple, Optional, Tuple
+
+MERMAID_VALIDATE = os.getenv("MERMAID_VALIDATE", "1") not in ("0", "off", "false", "")
+
+_DIRECTIONS = {"TB", "TD", "BT", "RL", "LR"}
+_FLOW_HEADER = re.compile(r"^(graph|flowchart)\b[ \t]*([A-Za-z]*)[ \t]*;?[ \t]*(.*)$", re.IGNORECASE)
+_OTHER_HEADER = re.compile(
+    r"^(sequenceDiagram|classDiagram|stateDiagram|erDiagram|gantt|pie|journey|gitGraph|mindmap|timeline"
+    r"|quadrantChart|requirementDiagram|C4\w+|sankey-beta|xychart-beta|block-beta|architecture-beta"
+    r"|packet-beta|kanban)\b(?!\s*[-=.&\[({>])"
+)
+_PASSTHROUGH = ("style ", "classdef ", "class ", "linkstyle ", "click ", "acctitle", "accdescr")
+
+# longest openers first; a shape only counts if its closer is found
+_SHAPES = [
+    ("(((", ")))"), ("([", "])"), ("[[", "]]"), ("[(", ")]"), ("((", "))"),
+    ("{{", "}}"), ("[/", "/]"), ("[\\", "\\]"), ("[", "]"), ("(", ")"), ("{", "}"), (">", "]"),
+]
+_PAIRS = {"[": "]", "(": ")", "{": "}"}
+_RISKY = set('()[]{}|<>"')
+
+_ID = re.compile(r"\w+(?:-\w+)*")
+_CLASS = re.compile(r":::\w+")
+_OP = re.compile(r"<?(?:-{2,}>|={2,}>|-\.+->|-\.+-|-{3,}|={3,}|-{2,}[ox](?=\s)|~{3,})")
+_BAD_OP = re.compile(r"<->|—>|–>|→|⟶|->|⇒|=>")
+_BAD_OP_FIX = {"<->": "<-->", "⇒": "==>", "=>": "==>"}
+_TEXT_OPS = [
+    (re.compile(r"(<?)--\s*(.+?)\s*(-{2,}>|-{3,}|-{2,}[ox](?=\s)|->)"), lambda op: op),
+    (re.compile(r"(<?)==\s*(.+?)\s*(={2,}>|={3,})"), lambda op: op),
+    (re.compile(r"(<?)-\.\s*(.+?)\s*(\.+->|\.+-)"), lambda op: "-" + op),
+]
+_LOOSE_OP = re.compile(r"\s(?:<?-{2,}>?|={2,}>|-\.+->?)\s")
+
+
+class MermaidCheck(NamedTuple):
+    code: str
+    fixes: List[str]
+    errors: List[str]
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+
+class _Bad(ValueError):
+    pass
+
+
+def _quote(label: str) -> str:
+    return '"' + label.replace('"', "#quot;") + '"'
+
+
+def _needs_quotes(label: str) -> bool:
+    return not (label.startswith('"') and label.endswith('"') and len(label) > 1) and any(c in _RISKY for c in label)
+
+
+def _scan(s: str, i: int, closer: str) -> Tuple[Optional[int], Optional[int]]:
+    """(closer index, mismatched-bracket index) for an unquoted label starting at i."""
+    depth = 0
+    for j in range(i, len(s)):
+        if depth == 0 and s.startswith(closer, j):
+            return j, None
+        c = s[j]
+        if c in "([{":
+            depth += 1
+        elif c in ")]}":
+            if depth == 0:
+                return None, j
+            depth -= 1
+    return None, None
+
+
+def _boundary(s: str, j: int) -> bool:
+    """A node ends at end of statement, whitespace, `&`, `:::` or an arrow."""
+    return j >= len(s) or s[j].isspace() or s[j] in "&-=<~.:"
+
+
+def _parse_shape(s: str, j: int, where: str, fixes: List[str]) -> Tuple[str, int]:
+    """Parse the shape right after a node id; returns (rebuilt shape, end index)."""
+    openers = [(op, cl) for op, cl in _SHAPES if s.startswith(op, j)]
+    for op, cl in openers:
+        k = j + len(op)
+        if s.startswith('"', k):
+            q = s.find('"', k + 1)
+            if q != -1 and s.startswith(cl, q + 1) and _boundary(s, q + 1 + len(cl)):
+                return s[j:q + 1 + len(cl)], q + 1 + len(cl)
+            continue
+        end, _ = _scan(s, k, cl)
+        if end is None or not _boundary(s, end + len(cl)):
+            continue
+        label = s[k:end]
+        if not label:
+            fixes.append(f"{where}: dropped empty label")
+            return "", end + len(cl)
+        if _needs_quotes(label):
+            fixes.append(f"{where}: quoted label {label.strip()!r}")
+            return op + _quote(label.strip()) + cl, end + len(cl)
+        return s[j:end + len(cl)], end + len(cl)
+    if not openers:
+        return "", j
+
+    # no opener closed cleanly: fix the plain single-bracket case
+    op, cl = openers[-1]
+    k = j + len(op)
+    _, bad = _scan(s, k, cl)
+    if bad is not None and _PAIRS.get(op) and s[bad] in ")]}" and _boundary(s, bad + 1):
+        label, end = s[k:bad], bad + 1
+        fixes.append(f"{where}: fixed mismatched bracket {op}…{s[bad]}")
+    else:
+        m = _LOOSE_OP.search(s, k)
+        if m:
+            label, end = s[k:m.start()], m.start()
+        else:
+            label, end = s[k:], len(s)
+        if not label.strip():
+            raise _Bad(f"{where}: unclosed {op!r}")
+        fixes.append(f"{where}: closed {op!r}")
+    label = label.strip()
+    return op + (_quote(label) if _needs_quotes(label) else label) + cl, end
+
+
+def _parse_node(s: str, i: int, where: str, fixes: List[str]) -> Tuple[str, int]:
+    m = _ID.match(s, i)
+    if not m:
+        raise _Bad(f"{where}: expected a node near {s[i:i + 20]!r}")
+    nid = m.group(0)
+    if nid == "end":  # reserved word; mermaid needs it capitalized or changed
+        fixes.append(f"{where}: renamed node 'end'")
+        nid = "end_"
+    shape, j = _parse_shape(s, m.end(), where, fixes)
+    cm = _CLASS.match(s, j)
+    cls = cm.group(0) if cm else ""
+    return nid + shape + cls, cm.end() if cm else j
+
+
+def _parse_pipe(s: str, i: int, where: str, fixes: List[str]) -> Tuple[str, int]:
+    j = i
+    while j < len(s) and s[j].isspace():
+        j += 1
+    if j >= len(s) or s[j] != "|":
+        return "", i
+    if s.startswith('"', j + 1):
+        q = s.find('"', j + 2)
+        if q != -1 and s.startswith("|", q + 1):
+            return s[j:q + 2], q + 2
+    end = s.find("|", j + 1)
+    if end == -1:
+        raise _Bad(f"{where}: unclosed edge label |")
+    text = s[j + 1:end].strip()
+    if _needs_quotes(text):
+        fixes.append(f"{where}: quoted edge label {text!r}")
+        return "|" + _quote(text) + "|", end + 1
+    return s[j:end + 1], end + 1
+
+
+def _parse_link(s: str, i: int, where: str, fixes: List[str]) -> Tuple[str, int]:
+    m = _OP.match(s, i)
+    if m:
+        pipe, j = _parse_pipe(s, m.end(), where, fixes)
+        return m.group(0) + pipe, j
+    for rx, norm in _TEXT_OPS:
+        m = rx.match(s, i)
+        if m:
+            text, op = m.group(2), norm(m.group(3))
+            if op == "->":
+                fixes.append(f"{where}: arrow '->' → '-->'")
+                op = "-->"
+            if _needs_quotes(text):
+                fixes.append(f"{where}: quoted edge label {text!r}")
+                return m.group(1) + op + "|" + _quote(text) + "|", m.end()
+            if op != norm(m.group(3)):
+                return m.group(1) + "-->|" + text + "|", m.end()
+            return m.group(0), m.end()
+    m = _BAD_OP.match(s, i)
+    if m:
+        op = _BAD_OP_FIX.get(m.group(0), "-->")
+        fixes.append(f"{where}: arrow {m.group(0)!r} → {op!r}")
+        pipe, j = _parse_pipe(s, m.end(), where, fixes)
+        return op + pipe, j
+    raise _Bad(f"{where}: expected an arrow near {s[i:i + 20]!r}")
+
+
+def _skip_ws(s: str, i: int) -> int:
+    while i < len(s) and s[i].isspace():
+        i += 1
+    return i
+
+
+def _parse_chain(stmt: str, where: str, fixes: List[str]) -> str:
+    """Parse `node (& node)* (link node (& node)*)*`; returns the statement, rebuilt if fixed."""
+    before = len(fixes)
+    parts: List[str] = []
+    i = 0
+    while True:
+        group = []
+        while True:
+            node, i = _parse_node(stmt, _skip_ws(stmt, i), where, fixes)
+            group.append(node)
+            i = _skip_ws(stmt, i)
+            if not stmt.startswith("&", i):
+                break
+            i += 1
+        parts.append(" & ".join(group))
+        if i >= len(stmt):
+            break
+        link, i = _parse_link(stmt, i, where, fixes)
+        parts.append(link)
+        if _skip_ws(stmt, i) >= len(stmt):
+            raise _Bad(f"{where}: arrow without a target")
+    return " ".join(parts) if len(fixes) > before else stmt
+
+
+def _split_comment(line: str) -> Tuple[str, str]:
+    """(code, `%% comment`) for a line with a trailing comment outside quotes, brackets and pipes."""
+    depth, quoted, piped = 0, False, False
+    for j, c in enumerate(line):
+        if c == '"':
+            quoted = not quoted
+        elif not quoted:
+            if c in "([{":
+                depth += 1
+            elif c in ")]}":
+                depth = max(0, depth - 1)
+            elif c == "|" and depth == 0:
+                piped = not piped
+            elif (c == "%" and depth == 0 and not piped and line.startswith("%%", j)
+                  and not line.startswith("%%{", j)):
+                return line[:j].rstrip(), line[j:]
+    return line, ""
+
+
+def _split_statements(line: str) -> List[str]:
+    """Split on `;` outside quotes, brackets and pipes."""
+    out, cur, depth, quoted, piped = [], [], 0, False, False
+    for c in line:
+        if c == '"':
+            quoted = not quoted
+        elif not quoted:
+            if c in "([{":
+                depth += 1
+            elif c in ")]}":
+                depth = max(0, depth - 1)
+            elif c == "|" and depth == 0:
+                piped = not piped
+            elif c == ";" and depth == 0 and not piped:
+                out.append("".join(cur).strip())
+                cur = []
+                continue
+        cur.append(c)
+    out.append("".join(cur).strip())
+    return [s for s in out if s]
+
+
+def _fix_subgraph(rest: str, where: str, n: int, fixes: List[str]) -> str:
+    if not rest:
+        fixes.append(f"{where}: named empty subgraph")
+        return f"sg{n}"
+    if not any(c in _RISKY for c in rest):
+        return rest
+    if rest.startswith('"') and rest.endswith('"') and rest.count('"') == 2:
+        return rest
+    m = _ID.match(rest)
+    if m:
+        tail = rest[m.end():].lstrip()
+        if tail.startswith("[") and tail.endswith("]"):
+            label = tail[1:-1].strip()
+            if _needs_quotes(label):
+                fixes.append(f"{where}: quoted subgraph title")
+                return f"{m.group(0)}[{_quote(label)}]"
+            return rest
+    fixes.append(f"{where}: quoted subgraph title")
+    return f'sg{n}[{_quote(rest.strip(chr(34)))}]'
+
+
+def validate_mermaid(code: str) -> MermaidCheck:
+    if not MERMAID_VALIDATE or not isinstance(code, str):
+        return MermaidCheck(code, [], [])
+    lines = code.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    idx = next((k for k, ln in enumerate(lines) if ln.strip() and not ln.strip().startswith("%%")), None)
+    if idx is None:
+        return MermaidCheck(code, [], ["empty diagram"])
+    head = _split_comment(lines[idx].strip())[0]
+    if _OTHER_HEADER.match(head):
+        return MermaidCheck(code, [], [])
+
+    fixes: List[str] = []
+    errors: List[str] = []
+    out = lines[:idx]
+    body = lines[idx + 1:]
+    m = _FLOW_HEADER.match(head)
+    if m:
+        kind, direction, rest = m.group(1), m.group(2), m.group(3).strip()
+        if direction and direction.upper() not in _DIRECTIONS:
+            # `graph A-->B`: the "direction" is really the first node
+            rest = f"{direction} {rest}" if rest else ""
+            fixes.append(f"line {idx + 1}: direction {direction!r} → TD")
+            out.append(f"{kind} TD")
+        elif direction != direction.upper():
+            fixes.append(f"line {idx + 1}: direction {direction!r} → {direction.upper()!r}")
+            out.append(f"{kind} {direction.upper()}")
+        elif rest:
+            fixes.append(f"line {idx + 1}: split statement off the header")
+            out.append(f"{kind} {direction}".strip())
+        else:
+            out.append(lines[idx])
+        if rest:
+            body = [rest] + body
+    else:
+        fixes.append("added 'flowchart TD' header")
+        out.append("flowchart TD")
+        body = lines[idx:]
+
+    depth = subgraphs = 0
+    first = len(lines) - len(body) + 1
+    for n, ln in enumerate(body, start=first):
+        s = ln.strip()
+        where = f"line {n}"
+        if not s or s.startswith("%%"):
+            out.append(ln)
+            continue
+        indent = ln[:len(ln) - len(ln.lstrip())]
+        low = s.lower()
+        if low == "subgraph" or low.startswith("subgraph "):
+            depth += 1
+            subgraphs += 1
+            rest = s[len("subgraph"):].strip()
+            fixed = _fix_subgraph(rest, where, subgraphs, fixes)
+            out.append(ln if fixed == rest else f"{indent}subgraph {fixed}")
+            continue
+        if low.rstrip(";").strip() == "end":
+            if depth == 0:
+                fixes.append(f"{where}: dropped stray 'end'")
+                continue
+            depth -= 1
+            out.append(ln)
+            continue
+        if low.startswith("direction"):
+            d = s[len("direction"):].strip().rstrip(";").upper()
+            if d not in _DIRECTIONS:
+                fixes.append(f"{where}: direction {d!r} → TB")
+                out.append(f"{indent}direction TB")
+            else:
+                out.append(ln)
+            continue
+        if low.startswith(_PASSTHROUGH):
+            out.append(ln)
+            continue
+        s, comment = _split_comment(s)
+        stmts = _split_statements(s)
+        rebuilt = []
+        for st in stmts:
+            try:
+                rebuilt.append(_parse_chain(st, where, fixes))
+            except _Bad as e:
+                errors.append(str(e))
+                rebuilt.append(st)
+        if rebuilt != stmts:
+            out.append(indent + "; ".join(rebuilt) + (";" if s.endswith(";") else "") + (f" {comment}" if comment else ""))
+        else:
+            out.append(ln)
+    if depth > 0:
+        fixes.append(f"closed {depth} open subgraph(s)")
+        out.extend(["end"] * depth)
+    return MermaidCheck("\n".join(out).strip(), fixes, errors)
@@ -0,0 +1,105 @@
+// Long-lived Mermaid renderer used by media/render_pool.py.
+//
+// Keeps one headless Chromium page with mermaid loaded and renders jobs
+// read as JSON lines on stdin:
+//   {"id": 1, "code": "flowchart TD\nA-->B", "fmt": "png"|"svg", "theme": "neutral", "background": "transparent"}
+//   {"id": 2, "ping": true}
+// and answers one JSON line per job on stdout:
+//   {"id": 1, "ok": true, "data": "<base64>"} | {"id": 1, "ok": false, "kind": "syntax"|"crash", "error": "..."}
+//
+// puppeteer and mermaid are resolved from the global npm root (where
+// @mermaid-js/mermaid-cli installs them) or NODE_PATH; MERMAID_JS can point
+// at mermaid.min.js directly.
+import { createRequire } from "node:module";
+import { execSync } from "node:child_process";
+import path from "node:path";
+import readline from "node:readline";
+
+function resolver() {
+  const roots = (process.env.NODE_PATH || "").split(path.delimiter).filter(Boolean);
+  try {
+    roots.push(execSync("npm root -g", { encoding: "utf8" }).trim());
+  } catch {}
+  const cli = roots.map((r) => path.join(r, "@mermaid-js", "mermaid-cli", "node_modules"));
+  const require = createRequire(import.meta.url);
+  return (name) => require.resolve(name, { paths: [...cli, ...roots, process.cwd()] });
+}
+
+const resolve = resolver();
+const puppeteer = (await import(resolve("puppeteer"))).default;
+const mermaidJs = process.env.MERMAID_JS || resolve("mermaid/dist/mermaid.min.js");
+
+const browser = await puppeteer.launch({
+  headless: true,
+  args: ["--no-sandbox", "--disable-gpu", "--disable-dev-shm-usage"],
+});
+const page = await browser.newPage();
+await page.setViewport({ width: 1600, height: 1200, deviceScaleFactor: 2 });
+await page.setContent('<!doctype html><html><body style="margin:0"><div id="c"></div></body></html>');
+await page.addScriptTag({ path: mermaidJs });
+
+let seq = 0;
+
+async function render(job) {
+  const id = `d${++seq}`;
+  const svg = await page.evaluate(
+    async (code, theme, id) => {
+      window.mermaid.initialize({ startOnLoad: false, theme, securityLevel: "strict" });
+      const { svg } = await window.mermaid.render(id, code);
+      return svg;
+    },
+    job.code,
+    job.theme || "neutral",
+    id,
+  );
+  if (job.fmt === "svg") return Buffer.from(svg, "utf8");
+
+  const bg = job.background || "transparent";
+  await page.evaluate(
+    (svg, bg) => {
+      document.body.style.background = bg;
+      document.getElementById("c").innerHTML = svg;
+    },
+    svg,
+    bg,
+  );
+  const el = await page.$("#c svg");
+  const png = await el.screenshot({ omitBackground: bg === "transparent" });
+  await page.evaluate(() => (document.getElementById("c").innerHTML = ""));
+  return Buffer.from(png);
+}
+
+function reply(obj) {
+  process.stdout.write(JSON.stringify(obj) + "\n");
+}
+
+// jobs are handled one at a time; the pool gives each worker a single job
+let chain = Promise.resolve();
+const rl = readline.createInterface({ input: process.stdin });
+rl.on("line", (line) => {
+  if (!line.trim()) return;
+  chain = chain.then(async () => {
+    let job;
+    try {
+      job = JSON.parse(line);
+    } catch (e) {
+      return reply({ id: null, ok: false, kind: "crash", error: `bad job: ${e}` });
+    }
+    if (job.ping) return reply({ id: job.id, ok: true, pong: true });
+    try {
+      const data = await render(job);
+      reply({ id: job.id, ok: true, data: data.toString("base64") });
+    } catch (e) {
+      const msg = String((e && e.message) || e);
+      const kind = /parse|syntax|lexical|no diagram type/i.test(msg) ? "syntax" : "crash";
+      reply({ id: job.id, ok: false, kind, error: msg });
+    }
+  });
+});
+rl.on("close", async () => {
+  await chain;
+  await browser.close();
+  process.exit(0);
+});
+
+reply({ id: 0, ok: true, ready: true });
@@ -1,15 +1,40 @@
 import os
-from typing import Dict, Any, List
-from .mermaid import render_mermaid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Any, List, Optional
+from .mermaid import render_mermaid, store_source
+from .mermaid_validate import validate_mermaid
 from .images import gen_images
+from .image_variants import make_variants, variant_executor, enabled as variants_enabled
 from .prompt_enricher import enrich_image_prompt
+from .render_pool import MERMAID_POOL_SIZE
 
-def render_assets_for_lesson(lesson: Dict[str, Any], out_root: str, image_concurrency: int = 5) -> Dict[str, Any]:
+# Diagrams rendered at once; matches the warm worker pool (mmdc processes when it is off)
+DIAGRAM_CONCURRENCY = int(os.getenv("DIAGRAM_CONCURRENCY", str(max(2, MERMAID_POOL_SIZE))))
+# png: rasterize on the server; svg: server-side SVG; client: validated source only,
+# rendered by the browser (or lazily via GET /diagrams/{key}.{fmt})
+DIAGRAM_RENDER_MODE = os.getenv("DIAGRAM_RENDER_MODE", "png").lower()
+
+def render_assets_for_lesson(lesson: Dict[str, Any], out_root: str, image_concurrency: int = 5,
+                            on_asset: Optional[Callable[[int, str, str], None]] = None,
+                            repair: Optional[Callable[[str, Optional[str]], Optional[str]]] = None,
+                            diagram_concurrency: int = DIAGRAM_CONCURRENCY,
+                            render_mode: str = DIAGRAM_RENDER_MODE) -> Dict[str, Any]:
     """
     Enrich a LessonDraft-like dict by rendering Mermaid diagrams and generating images.
-    - Diagrams: diagram_{i}.png (serial)
+    Both branches run at the same time:
+    - Diagrams: diagram_{i}.png (parallel, capped by diagram_concurrency); a failed
+      diagram goes through repair(mermaid, errors) → re-render once, inside its own task.
+      Diagrams the local validator rejects skip the first render and go straight to repair;
+      if repair can't produce a valid replacement, the original gets one real render
+      (in client mode it is handed to the browser / lazy route unrendered)
     - Images:   img_{i}.png (parallel, capped by image_concurrency)
-    Returns the same dict with segments[i].diagram_path / image_path added.
+    render_mode "svg" writes diagram_{i}.svg instead; "client" renders nothing and
+    only stores the validated source (segments[i].diagram_key), the path passed to
+    on_asset is then the lazy diagrams/{key}.png route.
+    Each saved image is queued for WebP variants/thumbnails (media/image_variants) as it lands.
+    Returns the same dict with segments[i].diagram_path / image_path added
+    (plus image_width / image_height / image_variants when variants are on).
+    on_asset(i, "diagram"|"image", path) is called as each asset lands.
     """
     segs: List[Dict[str, Any]] = list(lesson.get("segments", []))
     os.makedirs(out_root, exist_ok=True)
@@ -18,13 +43,47 @@ def render_assets_for_lesson(lesson: Dict[str, Any], out_root: str, image_concur
     os.makedirs(diag_dir, exist_ok=True)
     os.makedirs(img_dir, exist_ok=True)
 
-    # 1) Mermaid → PNG
-    for i, seg in enumerate(segs):
-        mmd = seg.get("mermaid")
-        if isinstance(mmd, str) and mmd.strip():
-            out_path = os.path.join(diag_dir, f"diagram_{i}.png")
-            ok = render_mermaid(mmd, out_path)
-            seg["diagram_path"] = out_path if ok else ""
+    # 1) Mermaid → PNG, each with its own repair → re-render chain
+    client = render_mode == "client"
+    ext = "svg" if render_mode == "svg" else "png"
+
+    def render(code: str, out_path: str) -> bool:
+        # client mode: a diagram that passes validation is done; the browser draws it
+        return True if client else render_mermaid(code, out_path)
+
+    def diagram_job(i: int, seg: Dict[str, Any]):
+        out_path = os.path.join(diag_dir, f"diagram_{i}.{ext}")
+        check = validate_mermaid(seg["mermaid"])
+        seg["mermaid"] = check.code
+        if check.ok:
+            ok = render(check.code, out_path)
+        else:
+            print(f"[diagram] idx={i} invalid, skipping render: {'; '.join(check.errors)}")
+            ok = False
+        if not ok and repair:
+            fixed = repair(check.code, "\n".join(check.errors) or None)
+            if fixed and fixed.strip() != check.code.strip():
+                retry = validate_mermaid(fixed)
+                seg["mermaid"] = retry.code
+                ok = retry.ok and render(retry.code, out_path)
+        if not ok and not check.ok:
+            # the validator is stricter than Mermaid in places; a diagram it rejected
+            # and repair couldn't replace gets one real render before it is dropped.
+            # In client mode render() doesn't render: the browser or the lazy route decides
+            ok = render(check.code, out_path)
+            if ok:
+                print(f"[diagram] idx={i} {'passed to the client' if client else 'rendered'} despite validator errors")
+                seg["mermaid"] = check.code
+        seg["diagram_key"] = store_source(seg["mermaid"]) if ok else None
+        seg["diagram_path"] = out_path if ok and not client else ""
+        if ok and on_asset:
+            if not client:
+                on_asset(i, "diagram", out_path)
+            elif seg["diagram_key"]:
+                on_asset(i, "diagram", f"diagrams/{seg['diagram_key']}.png")
+
+    diagrams = [(i, seg) for i, seg in enumerate(segs)
+                if isinstance(seg.get("mermaid"), str) and seg["mermaid"].strip()]
 
     # 2) Image prompts → PNG (parallel)
     prompts = []
@@ -34,11 +93,41 @@ def render_assets_for_lesson(lesson: Dict[str, Any], out_root: str, image_concur
             enriched = enrich_image_prompt(p.strip(), topic=lesson.get("title"))
             prompts.append((i, enriched))
     print(prompts)
-    if prompts:
-        saved = gen_images(prompts, out_dir=img_dir, concurrency=image_concurrency)
-        for i, path in saved.items():
-            if 0 <= i < len(segs):
-                segs[i]["image_path"] = path
+    variant_jobs = {}
+
+    def on_saved(i: int, path: str):
+        if on_asset:
+            on_asset(i, "image", path)
+        if variants_enabled():
+            variant_jobs[i] = variant_executor.submit(make_variants, path)
+
+    with ThreadPoolExecutor(max_workers=max(1, diagram_concurrency), thread_name_prefix="diagram") as dex, \
+         ThreadPoolExecutor(max_workers=1, thread_name_prefix="images") as iex:
+        image_job = iex.submit(gen_images, prompts, out_dir=img_dir, concurrency=image_concurrency,
+                               on_saved=on_saved) if prompts else None
+        diagram_jobs = [dex.submit(diagram_job, i, seg) for i, seg in diagrams]
+        for fut, (i, seg) in zip(diagram_jobs, diagrams):
+            try:
+                fut.result()
+            except Exception as e:
+                print(f"[diagram] idx={i} failed: {e}")
+                seg["diagram_path"] = ""
+        saved = image_job.result() if image_job else {}
+
+    for i, path in saved.items():
+        if 0 <= i < len(segs):
+            segs[i]["image_path"] = path
+
+    for i, fut in variant_jobs.items():
+        try:
+            info = fut.result()
+        except Exception as e:
+            print(f"[image_variants] idx={i} failed: {e}")
+            continue
+        if info and 0 <= i < len(segs):
+            segs[i]["image_width"] = info["width"]
+            segs[i]["image_height"] = info["height"]
+            segs[i]["image_variants"] = info["variants"]
 
     out = dict(lesson)
     out["segments"] = segs
@@ -0,0 +1,233 @@
+"""
+Pool of warm Mermaid renderer processes (media/mermaid_worker.mjs).
+
+Each worker keeps a headless Chromium page with mermaid loaded, so a diagram
+costs its layout time instead of a full `mmdc` start (Node + browser launch +
+temp files). Jobs go over stdin/stdout as JSON lines.
+
+- MERMAID_POOL_SIZE workers (0 disables the pool; callers fall back to mmdc)
+- MERMAID_RENDER_TIMEOUT seconds per render; a worker that times out is killed
+  and replaced
+- MERMAID_CHECKOUT_TIMEOUT seconds to wait for a free worker; after that the
+  call falls back to mmdc instead of queueing behind busy workers
+- idle workers are pinged every MERMAID_HEALTH_SECS and restarted if dead
+- if workers can't start (no node/puppeteer), the pool is disabled for
+  MERMAID_POOL_RETRY seconds and `render` returns None
+"""
+import base64
+import itertools
+import json
+import os
+import queue
+import subprocess
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from typing import Dict, Optional
+
+MERMAID_POOL_SIZE = int(os.getenv("MERMAID_POOL_SIZE", "2"))
+MERMAID_RENDER_TIMEOUT = float(os.getenv("MERMAID_RENDER_TIMEOUT", "20"))
+MERMAID_CHECKOUT_TIMEOUT = float(os.getenv("MERMAID_CHECKOUT_TIMEOUT", "10"))
+MERMAID_START_TIMEOUT = float(os.getenv("MERMAID_START_TIMEOUT", "30"))
+MERMAID_HEALTH_SECS = float(os.getenv("MERMAID_HEALTH_SECS", "30"))
+MERMAID_POOL_RETRY = float(os.getenv("MERMAID_POOL_RETRY", "300"))
+NODE_BIN = os.getenv("NODE_BIN", "node")
+WORKER_SCRIPT = os.getenv("MERMAID_WORKER_SCRIPT", os.path.join(os.path.dirname(__file__), "mermaid_worker.mjs"))
+
+
+class MermaidSyntaxError(ValueError):
+    """The diagram itself is invalid; re-rendering elsewhere won't help."""
+
+
+class RenderWorker:
+    _ids = itertools.count(1)
+
+    def __init__(self):
+        self.proc = subprocess.Popen(
+            [NODE_BIN, WORKER_SCRIPT],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=None,
+            text=True, encoding="utf-8", bufsize=1,
+        )
+        self._pending: Dict[int, Future] = {0: Future()}  # id 0 = ready signal
+        self._lock = threading.Lock()
+        self.renders = 0
+        threading.Thread(target=self._read, daemon=True).start()
+        try:
+            self._pending[0].result(timeout=MERMAID_START_TIMEOUT)
+        except Exception:
+            self.kill()
+            raise RuntimeError("mermaid worker failed to start")
+
+    def _read(self):
+        for line in self.proc.stdout:
+            try:
+                msg = json.loads(line)
+            except ValueError:
+                continue
+            with self._lock:
+                fut = self._pending.pop(msg.get("id"), None)
+            if fut is not None and not fut.done():
+                fut.set_result(msg)
+        # process exited: fail everything still waiting
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for fut in pending.values():
+            if not fut.done():
+                fut.set_exception(RuntimeError("mermaid worker exited"))
+
+    def alive(self) -> bool:
+        return self.proc.poll() is None
+
+    def _call(self, job: dict, timeout: float) -> dict:
+        job_id = next(self._ids)
+        fut = Future()
+        with self._lock:
+            self._pending[job_id] = fut
+        try:
+            self.proc.stdin.write(json.dumps({**job, "id": job_id}) + "\n")
+            self.proc.stdin.flush()
+        except (OSError, ValueError) as e:
+            raise RuntimeError(f"mermaid worker pipe closed: {e}")
+        try:
+            return fut.result(timeout=timeout)
+        except FutureTimeout:
+            self.kill()
+            raise TimeoutError(f"mermaid render exceeded {timeout:.0f}s")
+
+    def ping(self, timeout: float = 5.0) -> bool:
+        try:
+            return bool(self._call({"ping": True}, timeout).get("pong"))
+        except Exception:
+            return False
+
+    def render(self, code: str, fmt: str, theme: str, background: str, timeout: float) -> bytes:
+        msg = self._call({"code": code, "fmt": fmt, "theme": theme, "background": background}, timeout)
+        self.renders += 1
+        if msg.get("ok"):
+            return base64.b64decode(msg["data"])
+        if msg.get("kind") == "syntax":
+            raise MermaidSyntaxError(msg.get("error", "invalid diagram"))
+        raise RuntimeError(msg.get("error", "render failed"))
+
+    def kill(self):
+        try:
+            self.proc.kill()
+            self.proc.wait(timeout=5)
+        except Exception:
+            pass
+
+
+class RenderPool:
+    def __init__(self, size: int = MERMAID_POOL_SIZE, timeout: float = MERMAID_RENDER_TIMEOUT):
+        self.size = max(0, size)
+        self.timeout = timeout
+        self._idle: "queue.Queue[Optional[RenderWorker]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._started = False
+        self._disabled_until = 0.0
+        self.stats = {"renders": 0, "failures": 0, "restarts": 0, "timeouts": 0, "fallbacks": 0,
+                      "checkout_timeouts": 0}
+
+    def _spawn(self) -> Optional[RenderWorker]:
+        try:
+            return RenderWorker()
+        except Exception as e:
+            print(f"[render_pool] worker start failed: {e}")
+            return None
+
+    def _start(self) -> bool:
+        with self._lock:
+            if self._started:
+                return True
+            if self.size == 0 or time.time() < self._disabled_until:
+                return False
+            first = self._spawn()
+            if first is None:
+                self._disabled_until = time.time() + MERMAID_POOL_RETRY
+                return False
+            self._idle.put(first)
+            # the rest start lazily (None = slot without a process yet)
+            for _ in range(self.size - 1):
+                self._idle.put(None)
+            self._started = True
+            if MERMAID_HEALTH_SECS > 0:
+                threading.Thread(target=self._health_loop, daemon=True).start()
+            return True
+
+    def _checkout(self) -> Optional[RenderWorker]:
+        """A live worker (or None if one couldn't be spawned); raises queue.Empty if no slot frees up in time."""
+        w = self._idle.get(timeout=MERMAID_CHECKOUT_TIMEOUT)
+        if w is None or not w.alive():
+            if w is not None:
+                self.stats["restarts"] += 1
+            w = self._spawn()
+        return w
+
+    def render(self, code: str, fmt: str = "png", theme: str = "neutral",
+               background: str = "transparent") -> Optional[bytes]:
+        """
+        Image bytes, or None when the pool is unavailable or the worker failed
+        (caller falls back to mmdc). Raises MermaidSyntaxError for invalid diagrams.
+        """
+        if not self._start():
+            return None
+        try:
+            w = self._checkout()
+        except queue.Empty:
+            print(f"[render_pool] no free worker after {MERMAID_CHECKOUT_TIMEOUT:g}s; falling back to mmdc")
+            self.stats["checkout_timeouts"] += 1
+            self.stats["fallbacks"] += 1
+            return None
+        if w is None:
+            self._idle.put(None)
+            self.stats["fallbacks"] += 1
+            return None
+        try:
+            data = w.render(code, fmt, theme, background, self.timeout)
+            self.stats["renders"] += 1
+            return data
+        except MermaidSyntaxError:
+            self.stats["failures"] += 1
+            raise
+        except TimeoutError as e:
+            print(f"[render_pool] {e}; restarting worker")
+            self.stats["timeouts"] += 1
+            return None
+        except Exception as e:
+            print(f"[render_pool] render failed: {e}")
+            self.stats["failures"] += 1
+            return None
+        finally:
+            self._idle.put(w if w.alive() else None)
+
+    def _health_loop(self):
+        while True:
+            time.sleep(MERMAID_HEALTH_SECS)
+            n = self._idle.qsize()
+            for _ in range(n):
+                try:
+                    w = self._idle.get_nowait()
+                except queue.Empty:
+                    break
+                if w is not None and not (w.alive() and w.ping()):
+                    print("[render_pool] worker failed health check; restarting")
+                    w.kill()
+                    self.stats["restarts"] += 1
+                    w = self._spawn()
+                self._idle.put(w)
+
+    def info(self) -> dict:
+        return {"size": self.size, "started": self._started, **self.stats}
+
+    def shutdown(self):
+        while True:
+            try:
+                w = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            if w is not None:
+                w.kill()
+        self._started = False
+
+
+render_pool = RenderPool()
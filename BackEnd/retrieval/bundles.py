@@ -0,0 +1,192 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+from whoosh import index
+
+# Layout written by ingest/build_bundle.py
+BUNDLES_DIR = os.getenv("INDEX_BUNDLES_DIR", "data/bundles")
+CURRENT_FILE = "CURRENT"
+PREVIOUS_FILE = "PREVIOUS"  # the version CURRENT pointed at before the last publish (rollback target)
+# Pre-bundle layout, used when nothing has been published yet
+LEGACY_WHOOSH_DIR = "data/whoosh_index"
+LEGACY_COLLECTION = "books_corpus"
+
+
+class IndexBundle:
+    """One immutable set of indexes: an opened Whoosh index plus its Qdrant collection name."""
+
+    def __init__(self, version: str, whoosh_dir: str, collection: str, manifest: Optional[Dict[str, Any]] = None):
+        self.version = version
+        self.whoosh_dir = whoosh_dir
+        self.collection = collection
+        self.manifest = manifest or {}
+        self.ix = index.open_dir(whoosh_dir)
+        self._inflight = 0
+        self._retiring = False
+        self._closed = False
+        self._cond = threading.Condition()
+
+    @classmethod
+    def load(cls, version: str) -> "IndexBundle":
+        root = os.path.join(BUNDLES_DIR, version)
+        with open(os.path.join(root, "manifest.json"), encoding="utf-8") as f:
+            manifest = json.load(f)
+        return cls(version, os.path.join(root, manifest.get("whoosh_dir", "whoosh")), manifest["collection"], manifest)
+
+    def _enter(self):
+        with self._cond:
+            self._inflight += 1
+
+    def _exit(self):
+        with self._cond:
+            self._inflight -= 1
+            last = self._inflight == 0
+            if last:
+                self._cond.notify_all()
+        if last and self._retiring:
+            self._close()
+
+    def _close(self):
+        with self._cond:
+            if self._closed or self._inflight:
+                return
+            self._closed = True
+        try:
+            self.ix.close()
+        except Exception:
+            pass
+
+    def retire(self, timeout: float = 60.0):
+        """Close the index once in-flight queries drain; if they outlast `timeout`, the last one closes it."""
+        with self._cond:
+            self._retiring = True
+            if not self._cond.wait_for(lambda: self._inflight == 0, timeout=timeout):
+                print(f"[bundles] {self.version}: {self._inflight} queries still running after {timeout:g}s; "
+                      f"closing when they finish")
+                return
+        self._close()
+
+    def info(self) -> Dict[str, Any]:
+        return {"version": self.version, "collection": self.collection, "inflight": self._inflight, **{
+            k: self.manifest[k] for k in ("chunks", "created_at") if k in self.manifest}}
+
+
+class BundleManager:
+    """
+    Holds the active IndexBundle. Queries pin a bundle with `acquire()`;
+    `swap()` opens the new bundle first, switches the pointer under a lock,
+    and retires the old one in the background once its queries drain.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._current: Optional[IndexBundle] = None
+        self._published: Optional[str] = None
+        self._watcher: Optional[threading.Thread] = None
+
+    def _initial(self) -> IndexBundle:
+        version = read_published()
+        if version:
+            self._published = version
+            return IndexBundle.load(version)
+        return IndexBundle("legacy", LEGACY_WHOOSH_DIR, LEGACY_COLLECTION)
+
+    @contextmanager
+    def acquire(self):
+        with self._lock:
+            if self._current is None:
+                self._current = self._initial()
+            bundle = self._current
+            bundle._enter()
+        try:
+            yield bundle
+        finally:
+            bundle._exit()
+
+    def current(self) -> Optional[IndexBundle]:
+        return self._current
+
+    def swap(self, version: str) -> Dict[str, Any]:
+        new = IndexBundle.load(version)   # fails before anything changes if the bundle is broken
+        with self._lock:
+            old, self._current = self._current, new
+            self._published = version
+        if old is not None and old is not new:
+            threading.Thread(target=old.retire, name=f"retire-{old.version}", daemon=True).start()
+        return new.info()
+
+    def reload_if_changed(self) -> bool:
+        version = read_published()
+        if not version or version == self._published:
+            return False
+        self.swap(version)
+        return True
+
+    def activate(self, version: str) -> Dict[str, Any]:
+        """Publish `version` (so restarts and other workers follow) and switch to it now."""
+        publish(version)
+        return self.swap(version)
+
+    def watch(self, interval: float):
+        """Poll the CURRENT pointer and hot-swap when ingest publishes a new bundle."""
+        if self._watcher is not None or interval <= 0:
+            return
+
+        def loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    if self.reload_if_changed():
+                        print(f"[bundles] switched to {self._published}")
+                except Exception as e:
+                    print(f"[bundles] reload failed: {e}")
+
+        self._watcher = threading.Thread(target=loop, name="bundle-watch", daemon=True)
+        self._watcher.start()
+
+
+def _read_pointer(name: str) -> Optional[str]:
+    try:
+        with open(os.path.join(BUNDLES_DIR, name), encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def _write_pointer(name: str, version: str):
+    tmp = os.path.join(BUNDLES_DIR, f".{name}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(version)
+    os.replace(tmp, os.path.join(BUNDLES_DIR, name))
+
+
+def read_published() -> Optional[str]:
+    return _read_pointer(CURRENT_FILE)
+
+
+def read_previous() -> Optional[str]:
+    return _read_pointer(PREVIOUS_FILE)
+
+
+def publish(version: str):
+    """Atomically point CURRENT at `version`; the version it replaces is recorded in PREVIOUS."""
+    if not os.path.exists(os.path.join(BUNDLES_DIR, version, "manifest.json")):
+        raise FileNotFoundError(f"bundle {version} is missing or incomplete")
+    current = read_published()
+    if current and current != version:
+        _write_pointer(PREVIOUS_FILE, current)
+    _write_pointer(CURRENT_FILE, version)
+
+
+def available_versions() -> List[str]:
+    if not os.path.isdir(BUNDLES_DIR):
+        return []
+    return sorted(v for v in os.listdir(BUNDLES_DIR)
+                  if os.path.exists(os.path.join(BUNDLES_DIR, v, "manifest.json")))
+
+
+bundles = BundleManager()
@@ -1,4 +1,6 @@
+import re
 from typing import List, Dict, Any, Tuple
+from functools import lru_cache
 import numpy as np
 
 from whoosh import index
@@ -8,14 +10,23 @@ from qdrant_client import QdrantClient
 from sentence_transformers import SentenceTransformer
 
 from .mmr import mmr_select
+from .bundles import bundles
 
-# Paths & constants
+# Paths & constants (the active index bundle overrides the Whoosh dir / collection)
 WHOOSH_INDEX_DIR = "data/whoosh_index"
 QDRANT_HOST = "localhost"
 QDRANT_PORT = 6333
 QDRANT_COLLECTION = "books_corpus"
 EMB_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
 
+@lru_cache(maxsize=1)
+def get_qdrant() -> QdrantClient:
+    return QdrantClient(host=QDRANT_HOST, port=QDRANT_PORT)
+
+@lru_cache(maxsize=1)
+def get_embedder() -> SentenceTransformer:
+    return SentenceTransformer(EMB_MODEL)
+
 def _normalize_scores(vals: List[float]) -> List[float]:
     if not vals:
         return []
@@ -24,8 +35,8 @@ def _normalize_scores(vals: List[float]) -> List[float]:
         return [0.5 for _ in vals]
     return [float((v - vmin) / (vmax - vmin)) for v in vals]
 
-def bm25_topk(query: str, k: int = 30) -> List[Tuple[str, float, Dict[str, Any]]]:
-    ix = index.open_dir(WHOOSH_INDEX_DIR)
+def bm25_topk(query: str, k: int = 30, ix=None) -> List[Tuple[str, float, Dict[str, Any]]]:
+    ix = ix or index.open_dir(WHOOSH_INDEX_DIR)
     qp = MultifieldParser(["title", "text"], schema=ix.schema)
     q = qp.parse(query)
     out = []
@@ -35,10 +46,11 @@ def bm25_topk(query: str, k: int = 30) -> List[Tuple[str, float, Dict[str, Any]]
             out.append((r["chunk_id"], float(r.score), {"doc_id": r["doc_id"], "title": r["title"], "text": r["text"]}))
     return out
 
-def semantic_topk(query: str, model: SentenceTransformer, client: QdrantClient, k: int = 30):
+def semantic_topk(query: str, model: SentenceTransformer, client: QdrantClient, k: int = 30,
+                  collection: str = QDRANT_COLLECTION):
     qv = model.encode([query], normalize_embeddings=True)[0]
     hits = client.search(
-        collection_name=QDRANT_COLLECTION,
+        collection_name=collection,
         query_vector=qv.tolist(),
         limit=k,
         with_payload=True
@@ -50,6 +62,34 @@ def semantic_topk(query: str, model: SentenceTransformer, client: QdrantClient,
         out.append((cid, float(h.score), payload))
     return out
 
+def _terms(text: str) -> List[str]:
+    return [t for t in re.findall(r"[a-z0-9]+", (text or "").lower()) if len(t) > 2]
+
+def uncovered_queries(queries: List[str], chunks: List[Dict[str, Any]]) -> List[str]:
+    """Queries whose terms do not all appear somewhere in the retrieved chunks."""
+    seen = set()
+    for c in chunks:
+        seen.update(_terms(c.get("text", "")))
+    out = []
+    for q in queries:
+        terms = _terms(q)
+        if q and q.strip() and (not terms or any(t not in seen for t in terms)):
+            out.append(q)
+    return out
+
+def merge_results(first: List[Dict[str, Any]], second: List[Dict[str, Any]], k: int) -> List[Dict[str, Any]]:
+    """Interleave two ranked payload lists, dropping repeats (by chunk_id, else text)."""
+    out, keys = [], set()
+    for i in range(max(len(first), len(second))):
+        for lst in (first, second):
+            if i < len(lst):
+                p = lst[i]
+                key = p.get("chunk_id") or p.get("text")
+                if key not in keys:
+                    keys.add(key)
+                    out.append(p)
+    return out[:k]
+
 def _pool_candidates(bm25_list, sem_list) -> Dict[str, Dict[str, Any]]:
     pooled: Dict[str, Dict[str, Any]] = {}
     for cid, score, payload in bm25_list:
@@ -83,15 +123,16 @@ def hybrid_search(
     """
     Returns a list of up to k_final payload dicts (diverse, high-quality).
     """
-    client = QdrantClient(host=QDRANT_HOST, port=QDRANT_PORT)
-    model = SentenceTransformer(EMB_MODEL)
+    client = get_qdrant()
+    model = get_embedder()
 
     bm25_all, sem_all = [], []
-    for q in queries:
-        if not q or not q.strip():
-            continue
-        bm25_all.extend(bm25_topk(q, k=topn_bm25))
-        sem_all.extend(semantic_topk(q, model, client, k=topm_sem))
+    with bundles.acquire() as bundle:
+        for q in queries:
+            if not q or not q.strip():
+                continue
+            bm25_all.extend(bm25_topk(q, k=topn_bm25, ix=bundle.ix))
+            sem_all.extend(semantic_topk(q, model, client, k=topm_sem, collection=bundle.collection))
 
     pooled = _pool_candidates(bm25_all, sem_all)
     _ensure_text_payload(pooled)
@@ -0,0 +1,69 @@
+"""
+Single-flight coalescing: concurrent calls with the same key share one execution.
+
+The first caller for a key (the leader) runs the function; everyone who asks
+for the same key while it is running waits on the leader's Future and gets
+the same result or exception. Works from threads (`do`) and from the event
+loop (`ado`, which runs the leader on an executor); both kinds of waiter can
+share one flight.
+"""
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable
+
+
+class SingleFlight:
+    def __init__(self, name: str = "flight"):
+        self.name = name
+        self._calls: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+        self._leaders = 0
+        self._coalesced = 0
+
+    def _join(self, key: Hashable):
+        with self._lock:
+            fut = self._calls.get(key)
+            if fut is not None:
+                self._coalesced += 1
+                return fut, False
+            fut = Future()
+            self._calls[key] = fut
+            self._leaders += 1
+            return fut, True
+
+    def _run(self, key: Hashable, fut: Future, fn: Callable, args: tuple):
+        try:
+            fut.set_result(fn(*args))
+        except BaseException as e:
+            fut.set_exception(e)
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+    def do(self, key: Hashable, fn: Callable, *args) -> Any:
+        fut, leader = self._join(key)
+        if leader:
+            self._run(key, fut, fn, args)
+        else:
+            print(f"[{self.name}] coalesced onto in-flight {key!r:.80}")
+        return fut.result()
+
+    async def ado(self, key: Hashable, fn: Callable, *args, executor=None) -> Any:
+        fut, leader = self._join(key)
+        if leader:
+            try:
+                asyncio.get_running_loop().run_in_executor(executor, self._run, key, fut, fn, args)
+            except BaseException as e:
+                # never started (e.g. executor shut down): fail this flight instead of leaving it stuck
+                fut.set_exception(e)
+                with self._lock:
+                    self._calls.pop(key, None)
+        else:
+            print(f"[{self.name}] coalesced onto in-flight {key!r:.80}")
+        # shield: a disconnecting waiter must not cancel the shared flight
+        return await asyncio.shield(asyncio.wrap_future(fut))
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"leaders": self._leaders, "coalesced": self._coalesced, "in_flight": len(self._calls)}
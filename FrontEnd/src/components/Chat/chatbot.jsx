@@ -116,7 +116,13 @@ const Chatbot = () => {
         console.log(seg);
         let imgPath = seg.image_url;
         imgPath = imgPath.replace("http://localhost:8000/", `${backendUrl}`);
-        const imgHtml = `<img src="${imgPath}" alt="${seg.image_prompt}" style="width: 200px; height: auto;" />`;
+        // WebP variants/thumbnails from the backend; the browser picks the smallest that fits
+        const srcset = (seg.image_variants || [])
+          .filter((v) => v.format === "webp")
+          .map((v) => `${v.url.replace("http://localhost:8000/", `${backendUrl}`)} ${v.width}w`)
+          .join(", ");
+        const srcsetAttr = srcset ? ` srcset="${srcset}" sizes="200px"` : "";
+        const imgHtml = `<img src="${imgPath}"${srcsetAttr} alt="${seg.image_prompt}" style="width: 200px; height: auto;" />`;
         aiReplySegments.push({ type: "img", content: imgHtml });
       }
       aiReplySegments.push({ type: "markdown", content: (seg.text + "\n\n") });